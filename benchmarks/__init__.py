@@ -0,0 +1 @@
+"""Microbenchmarks of in-process costs of the service hot paths, run with `python -m benchmarks --help`."""
@@ -0,0 +1,62 @@
+"""Runs benchmarks, prints results and optionally saves them as JSON or compares them with the baseline JSON.
+
+Exits with code 1 when some benchmark is slower than its baseline by more than `--max-regression`, so it can be used
+as a CI gate:
+
+    python -m benchmarks --output baseline.json                 # on main branch
+    python -m benchmarks --compare baseline.json --max-regression 0.1
+"""
+
+import argparse
+import sys
+import typing as t
+from pathlib import Path
+
+from benchmarks import hot_paths  # noqa: F401 (registers benchmarks)
+from benchmarks.runner import BenchmarkResult, compare, dump_results, get_benchmarks, load_results, run
+
+
+def main(argv: t.Optional[t.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", "--filter", help="run only benchmarks with that substring in name")
+    parser.add_argument("-o", "--output", type=Path, help="save results to JSON file")
+    parser.add_argument("-c", "--compare", type=Path, help="compare results with baseline JSON file")
+    parser.add_argument("--max-regression", type=float, default=0.1,
+                        help="max allowed slowdown of median time relative to baseline (default: %(default)s)")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--min-round-time", type=float, default=0.1, help="seconds")
+    args = parser.parse_args(argv)
+
+    results: t.Dict[str, BenchmarkResult] = {}
+    for name, setup in get_benchmarks(args.filter).items():
+        results[name] = result = run(setup, args.rounds, args.min_round_time)
+        print(f"{name:<45} {_format_time(result.median):>10} ± {_format_time(result.stdev):>10}"
+              f"  ({result.rounds} x {result.iterations})")
+
+    if args.output is not None:
+        dump_results(results, args.output)
+
+    if args.compare is None:
+        return 0
+
+    regressions = 0
+    print(f"\ncompared with {args.compare}:")
+    for comparison in compare(load_results(args.compare), results):
+        regressed = comparison.ratio > 1.0 + args.max_regression
+        regressions += regressed
+        print(f"{comparison.name:<45} {_format_time(comparison.baseline):>10} -> {_format_time(comparison.current):>10}"
+              f"  {comparison.ratio:6.2f}x{'  REGRESSION' if regressed else ''}")
+
+    return 1 if regressions else 0
+
+
+def _format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+sys.exit(main())
@@ -0,0 +1,156 @@
+"""Benchmarks of request hot paths, that don't need DB or solana: response serialization, DB row conversion, SQL
+construction, token account derivation and loan signature verification."""
+
+import typing as t
+import uuid
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from gino import Gino
+from solders.keypair import Keypair
+from solders.pubkey import Pubkey
+from solders.signature import Signature
+from spl.token.instructions import get_associated_token_address
+from sqlalchemy.dialects import postgresql
+
+from benchmarks.runner import Call, benchmark
+from spl_token_lending.api.data import ItemsViewObject, LoanObject
+from spl_token_lending.api.encoding import encode_loan_records_view
+from spl_token_lending.domain.cases import UserLendingCase
+from spl_token_lending.domain.data import ItemsView
+from spl_token_lending.repository.data import Amount, LoanFilterOptions, LoanId, LoanItem, LoanRecord
+from spl_token_lending.repository.loan import LoanRepository
+
+PAGE_SIZE: t.Final[int] = 1_000
+
+_WALLETS = [Keypair() for _ in range(16)]
+_TOKEN = Pubkey.new_unique()
+
+
+def _make_loans(count: int = PAGE_SIZE) -> t.Sequence[LoanItem]:
+    return [
+        LoanItem(
+            id_=LoanId(uuid.uuid4()),
+            status=LoanItem.Status.ACTIVE,
+            wallet=_WALLETS[i % len(_WALLETS)].pubkey(),
+            amount=Amount(i + 1),
+            signature=Signature.default(),
+        )
+        for i in range(count)
+    ]
+
+
+def _make_rows() -> t.Sequence[object]:
+    """Rows as they are received from DB: values are converted by column types."""
+
+    return [
+        SimpleNamespace(id=loan.id_, status=loan.status, wallet=str(loan.wallet), amount=loan.amount,
+                        signature=str(loan.signature), last_valid_block_height=loan.last_valid_block_height)
+        for loan in _make_loans()
+    ]
+
+
+def _make_serializer(response_model: t.Any, content: object) -> Call:
+    """Serializes the content the same way as FastAPI does for the handler with the response model."""
+
+    field = create_response_field(name="response", type_=response_model)
+
+    async def serialize() -> bytes:
+        return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+    return serialize
+
+
+def _make_loan_repository() -> LoanRepository:
+    # only query construction & row conversion are measured, DB is not used
+    return LoanRepository(t.cast(Gino, None))
+
+
+@benchmark("serialize.loan_object")
+def serialize_loan_object() -> Call:
+    return _make_serializer(LoanObject, _make_loans(1)[0])
+
+
+@benchmark("serialize.loan_object_list_1000")
+def serialize_loan_object_list() -> Call:
+    return _make_serializer(t.Sequence[LoanObject], _make_loans())
+
+
+@benchmark("serialize.items_view_object_1000")
+def serialize_items_view_object() -> Call:
+    page = ItemsView(ItemsView.Info(offset=0, limit=PAGE_SIZE, total=10 * PAGE_SIZE), _make_loans())
+
+    return _make_serializer(ItemsViewObject[LoanObject], page)
+
+
+@benchmark("serialize.loan_records_view_1000")
+def serialize_loan_records_view() -> Call:
+    """Fast listing path, compare with `loan_repository.row2item_1000` + `serialize.items_view_object_1000`."""
+
+    row2record = getattr(_make_loan_repository(), "_LoanRepository__row2record")
+    rows = _make_rows()
+    info = ItemsView.Info(offset=0, limit=PAGE_SIZE, total=10 * PAGE_SIZE)
+
+    return lambda: encode_loan_records_view(ItemsView(info, [row2record(row) for row in rows]))
+
+
+@benchmark("serialize.jsonable_encoder_loans_1000")
+def encode_loans() -> Call:
+    objects = [LoanObject.parse_obj(loan.__dict__) for loan in _make_loans()]
+
+    return lambda: jsonable_encoder(objects, by_alias=True)
+
+
+@benchmark("loan_repository.row2item_1000")
+def convert_rows() -> Call:
+    row2item = getattr(_make_loan_repository(), "_LoanRepository__row2item")
+    rows = _make_rows()
+
+    return lambda: [row2item(row) for row in rows]
+
+
+@benchmark("loan_repository.append_filter")
+def append_filter() -> Call:
+    append_filter_ = getattr(_make_loan_repository(), "_LoanRepository__append_filter")
+    select_stmt = getattr(LoanRepository, "_LoanRepository__SELECT_ITEMS_ORDERED")
+    filter_ = LoanFilterOptions(status_equals=LoanItem.Status.ACTIVE, wallet_equals=_WALLETS[0].pubkey())
+
+    return lambda: append_filter_(select_stmt, filter_)
+
+
+@benchmark("loan_repository.append_filter_compiled")
+def append_filter_compiled() -> Call:
+    """The statement is compiled on each query execution as well."""
+
+    append_filter_ = getattr(_make_loan_repository(), "_LoanRepository__append_filter")
+    select_stmt = getattr(LoanRepository, "_LoanRepository__SELECT_ITEMS_ORDERED")
+    filter_ = LoanFilterOptions(status_equals=LoanItem.Status.ACTIVE, wallet_equals=_WALLETS[0].pubkey())
+    dialect = postgresql.dialect()
+
+    def construct() -> object:
+        return append_filter_(select_stmt, filter_).compile(dialect=dialect)
+
+    return construct
+
+
+@benchmark("token.get_associated_token_address")
+def derive_token_account() -> Call:
+    wallet = _WALLETS[0].pubkey()
+
+    return lambda: get_associated_token_address(wallet, _TOKEN)
+
+
+@benchmark("lending.validate_signature")
+def validate_signature() -> Call:
+    case = UserLendingCase(*(t.cast(t.Any, None) for _ in range(4)))
+    validate_signature_ = getattr(case, "_UserLendingCase__validate_signature")
+
+    wallet = _WALLETS[0]
+    loan = _make_loans(1)[0]
+    loan = LoanItem(loan.id_, loan.status, wallet.pubkey(), loan.amount)
+    signature = wallet.sign_message(loan.id_.bytes)
+
+    return lambda: validate_signature_(loan, signature)
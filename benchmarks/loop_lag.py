@@ -0,0 +1,87 @@
+"""Measures event loop lag while a batch of loan signatures is verified with each offload mode, e.g. to check that lag
+stays flat as the batch grows when verification is offloaded:
+
+    python -m benchmarks.loop_lag --sizes 10 100 1000 5000
+"""
+
+import argparse
+import asyncio
+import time
+import typing as t
+import uuid
+
+from solders.keypair import Keypair
+
+from spl_token_lending.domain.cases import UserLendingCase
+from spl_token_lending.offload import CpuOffloader, OffloadMode, create_executor
+from spl_token_lending.repository.data import Amount, LoanId, LoanItem
+
+_MODES: t.Sequence[OffloadMode] = ("inline", "thread", "process")
+
+
+async def measure_lag(case: UserLendingCase, size: int, tick: float = 0.001) -> t.Tuple[float, float]:
+    """Returns the duration of the batch verification and the max delay of a ticker task scheduled every `tick`
+    seconds meanwhile."""
+
+    wallet = Keypair()
+    loans = [
+        LoanItem(LoanId(uuid.uuid4()), LoanItem.Status.PENDING, wallet.pubkey(), Amount(1))
+        for _ in range(size)
+    ]
+    signatures = [wallet.sign_message(loan.id_.bytes) for loan in loans]
+
+    max_lag = 0.0
+    done = False
+
+    async def tick_() -> None:
+        nonlocal max_lag
+
+        while not done:
+            scheduled_at = time.perf_counter()
+            await asyncio.sleep(tick)
+            max_lag = max(max_lag, time.perf_counter() - scheduled_at - tick)
+
+    ticker = asyncio.create_task(tick_())
+    await asyncio.sleep(tick * 10)
+
+    started_at = time.perf_counter()
+    results = await case.validate_signatures(loans, signatures)
+    duration = time.perf_counter() - started_at
+    assert all(results)
+
+    done = True
+    await ticker
+
+    return duration, max_lag
+
+
+async def main(sizes: t.Sequence[int], workers: t.Optional[int], min_batch_size: int) -> None:
+    print(f"{'mode':<10} {'batch':>8} {'duration':>12} {'max lag':>12}")
+
+    for mode in _MODES:
+        offloader = CpuOffloader(create_executor(mode, workers), min_batch_size)
+        # only signature verification is measured, repositories are not used
+        none = t.cast(t.Any, None)
+        case = UserLendingCase(none, none, none, none, offloader=offloader)
+
+        try:
+            # warm up the pool, so worker start is not measured
+            await measure_lag(case, max(sizes))
+
+            for size in sizes:
+                duration, max_lag = await measure_lag(case, size)
+                print(f"{mode:<10} {size:>8} {duration * 1000:>9.1f} ms {max_lag * 1000:>9.1f} ms")
+
+        finally:
+            offloader.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loop_lag", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1_000, 5_000])
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--min-batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.sizes, args.workers, args.min_batch_size))
@@ -0,0 +1,148 @@
+"""Module provides a minimal benchmark runner: registry of benchmarks, calibrated timing, JSON results and comparison
+with baseline results."""
+
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+import typing as t
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+Call = t.Callable[[], object]
+Setup = t.Callable[[], Call]
+
+_BENCHMARKS: t.Dict[str, Setup] = {}
+
+
+def benchmark(name: str) -> t.Callable[[Setup], Setup]:
+    """Registers the setup function: it prepares the data and returns the measured call (plain function or a
+    function, that returns awaitable)."""
+
+    def register(setup: Setup) -> Setup:
+        if name in _BENCHMARKS:
+            raise ValueError("benchmark is already registered", name)
+
+        _BENCHMARKS[name] = setup
+
+        return setup
+
+    return register
+
+
+def get_benchmarks(pattern: t.Optional[str] = None) -> t.Mapping[str, Setup]:
+    return {name: setup for name, setup in _BENCHMARKS.items() if pattern is None or pattern in name}
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    """Times are in seconds per call."""
+
+    median: float
+    min: float
+    mean: float
+    stdev: float
+    rounds: int
+    iterations: int
+    """Calls in each round."""
+
+
+@dataclass(frozen=True)
+class Comparison:
+    name: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline
+
+
+def run(setup: Setup, rounds: int, min_round_time: float) -> BenchmarkResult:
+    call = setup()
+    loop = asyncio.new_event_loop()
+
+    try:
+        measure = _make_async_measure(call, loop) if asyncio.iscoroutine(_warm_up(call, loop)) else _make_measure(call)
+
+        # the same way as `timeit.Timer.autorange` does
+        iterations = 1
+        while (elapsed := measure(iterations)) < min_round_time:
+            iterations *= 10 if elapsed < min_round_time / 10 else 2
+
+        times = [measure(iterations) / iterations for _ in range(rounds)]
+
+    finally:
+        loop.close()
+
+    return BenchmarkResult(
+        median=statistics.median(times),
+        min=min(times),
+        mean=statistics.mean(times),
+        stdev=statistics.stdev(times) if len(times) > 1 else 0.0,
+        rounds=rounds,
+        iterations=iterations,
+    )
+
+
+def compare(
+        baseline: t.Mapping[str, BenchmarkResult],
+        current: t.Mapping[str, BenchmarkResult],
+) -> t.Sequence[Comparison]:
+    """Compares medians of benchmarks, that exist in both results."""
+
+    return [
+        Comparison(name, baseline[name].median, result.median)
+        for name, result in current.items()
+        if name in baseline
+    ]
+
+
+def dump_results(results: t.Mapping[str, BenchmarkResult], path: Path) -> None:
+    path.write_text(json.dumps({
+        "python": sys.version,
+        "platform": platform.platform(),
+        "created_at": time.time(),
+        "benchmarks": {name: asdict(result) for name, result in results.items()},
+    }, indent=2))
+
+
+def load_results(path: Path) -> t.Mapping[str, BenchmarkResult]:
+    raw = json.loads(path.read_text())
+
+    return {name: BenchmarkResult(**result) for name, result in raw["benchmarks"].items()}
+
+
+def _warm_up(call: Call, loop: asyncio.AbstractEventLoop) -> object:
+    result = call()
+    if asyncio.iscoroutine(result):
+        loop.run_until_complete(result)
+
+    return result
+
+
+def _make_measure(call: Call) -> t.Callable[[int], float]:
+    def measure(iterations: int) -> float:
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            call()
+
+        return time.perf_counter() - started_at
+
+    return measure
+
+
+def _make_async_measure(call: Call, loop: asyncio.AbstractEventLoop) -> t.Callable[[int], float]:
+    async def measure_async(iterations: int) -> float:
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            await t.cast(t.Awaitable[object], call())
+
+        return time.perf_counter() - started_at
+
+    def measure(iterations: int) -> float:
+        return loop.run_until_complete(measure_async(iterations))
+
+    return measure
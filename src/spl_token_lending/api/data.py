@@ -4,7 +4,7 @@ import uuid
 from pydantic import BaseModel, Extra, Field, root_validator, validator
 from pydantic.generics import GenericModel
 
-from spl_token_lending.repository.data import Amount, LoanItem
+from spl_token_lending.repository.data import Amount, LoanItem, TotalCountMode
 from spl_token_lending.serializable import PublicKeyObject, SignatureObject
 from spl_token_lending.strict_typing import make_non_exhaustive_check_error
 
@@ -21,13 +21,14 @@ class ItemsViewObject(GenericModel, t.Generic[T]):
     class InfoObject(BaseObject):
         offset: int
         limit: int
-        total: int
+        total: t.Optional[int]
+        next_cursor: t.Optional[str] = None
 
     info: InfoObject
     items: t.Sequence[T]
 
 
-LoanStatus = t.Literal["PENDING", "ACTIVE", "CLOSED"]
+LoanStatus = t.Literal["PENDING", "ACTIVE", "CLOSED", "TRANSFERRING", "FAILED", "CONFIRMED"]
 
 
 def decode_loan_item_status(value: LoanStatus) -> LoanItem.Status:
@@ -37,6 +38,43 @@ def decode_loan_item_status(value: LoanStatus) -> LoanItem.Status:
         return LoanItem.Status.ACTIVE
     elif value == "CLOSED":
         return LoanItem.Status.CLOSED
+    elif value == "TRANSFERRING":
+        return LoanItem.Status.TRANSFERRING
+    elif value == "FAILED":
+        return LoanItem.Status.FAILED
+    elif value == "CONFIRMED":
+        return LoanItem.Status.CONFIRMED
+    else:
+        raise make_non_exhaustive_check_error(value)
+
+
+def encode_loan_item_status(value: LoanItem.Status) -> LoanStatus:
+    if value is LoanItem.Status.PENDING:
+        return "PENDING"
+    elif value is LoanItem.Status.ACTIVE:
+        return "ACTIVE"
+    elif value is LoanItem.Status.CLOSED:
+        return "CLOSED"
+    elif value is LoanItem.Status.TRANSFERRING:
+        return "TRANSFERRING"
+    elif value is LoanItem.Status.FAILED:
+        return "FAILED"
+    elif value is LoanItem.Status.CONFIRMED:
+        return "CONFIRMED"
+    else:
+        raise make_non_exhaustive_check_error(value)
+
+
+TotalMode = t.Literal["exact", "estimate", "none"]
+
+
+def decode_total_count_mode(value: TotalMode) -> TotalCountMode:
+    if value == "exact":
+        return TotalCountMode.EXACT
+    elif value == "estimate":
+        return TotalCountMode.ESTIMATE
+    elif value == "none":
+        return TotalCountMode.NONE
     else:
         raise make_non_exhaustive_check_error(value)
 
@@ -50,6 +88,22 @@ class LoanSubmitObject(BaseObject):
     signature: SignatureObject
 
 
+class LoanBatchRequestObject(BaseObject):
+    items: t.List[t.Dict[str, object]] = Field(min_items=1, max_items=1_000)
+    """Loan requests (see :class:`LoanRequestObject`), each of them is validated separately, so an invalid item
+    doesn't fail the whole batch."""
+
+
+class LoanBatchSubmitItemObject(BaseObject):
+    loan_id: uuid.UUID
+    signature: SignatureObject
+
+
+class LoanBatchSubmitObject(BaseObject):
+    items: t.List[t.Dict[str, object]] = Field(min_items=1, max_items=5_000)
+    """Loan submits (see :class:`LoanBatchSubmitItemObject`), each of them is validated separately."""
+
+
 class LoanObject(BaseObject):
     id_: uuid.UUID = Field(alias="id")
     status: LoanStatus
@@ -57,6 +111,10 @@ class LoanObject(BaseObject):
     #  exception occur: TypeError("'solders.pubkey.Pubkey' object is not iterable")
     wallet: str
     amount: Amount
+    signature: t.Optional[str] = None
+    """Signature of the transfer transaction, it's set when the transfer was sent."""
+    last_valid_block_height: t.Optional[int] = None
+    """TRANSFERRING loan with unknown transfer result is settled after solana reaches that block height."""
 
     @root_validator(pre=True)
     def validate_id(cls, value: t.Mapping[str, object]) -> t.Mapping[str, object]:
@@ -71,17 +129,41 @@ class LoanObject(BaseObject):
 
     @validator("status", pre=True)
     def validate_status(cls, value: t.Union[LoanStatus, LoanItem.Status]) -> LoanStatus:
-        if not isinstance(value, LoanItem.Status):
-            return value
-        elif value is LoanItem.Status.PENDING:
-            return "PENDING"
-        elif value is LoanItem.Status.ACTIVE:
-            return "ACTIVE"
-        elif value is LoanItem.Status.CLOSED:
-            return "CLOSED"
-        else:
-            raise make_non_exhaustive_check_error(value)
+        return encode_loan_item_status(value) if isinstance(value, LoanItem.Status) else value
+
+    @validator("wallet", pre=True)
+    def validate_wallet(cls, value: object) -> str:
+        return str(PublicKeyObject.validate(value))
+
+    @validator("signature", pre=True)
+    def validate_signature(cls, value: object) -> t.Optional[str]:
+        return str(SignatureObject.validate(value)) if value is not None else None
+
+
+class LoanBatchResultObject(BaseObject):
+    loan: t.Optional[LoanObject] = None
+    error: t.Optional[str] = None
+    """Reason why the loan was not initialized, `loan` is not set then."""
+
+
+class WalletDebtObject(BaseObject):
+    wallet: str
+    amount: Amount
+    loans: int
 
     @validator("wallet", pre=True)
     def validate_wallet(cls, value: object) -> str:
         return str(PublicKeyObject.validate(value))
+
+
+class MetricSampleObject(BaseObject):
+    name: str
+    labels: t.Mapping[str, str]
+    value: float
+
+
+class MetricObject(BaseObject):
+    name: str
+    kind: str
+    documentation: str
+    samples: t.Sequence[MetricSampleObject]
@@ -5,10 +5,10 @@ import uuid
 from fastapi import Depends
 from solders.pubkey import Pubkey
 
-from spl_token_lending.api.data import LoanStatus, decode_loan_item_status
+from spl_token_lending.api.data import LoanStatus, TotalMode, decode_loan_item_status, decode_total_count_mode
 from spl_token_lending.container import Container
-from spl_token_lending.domain.cases import UserLendingCase, ViewLoansCase
-from spl_token_lending.repository.data import LoanFilterOptions, LoanId, PaginationOptions
+from spl_token_lending.domain.cases import UserLendingCase, ViewDebtsCase, ViewLoansCase
+from spl_token_lending.repository.data import LoanFilterOptions, LoanId, PaginationOptions, TotalCountMode
 
 
 @ft.lru_cache(maxsize=1)
@@ -24,8 +24,16 @@ async def get_view_user_loans_case(container: Container = Depends(get_container)
     return await container.view_loans_case()  # type: ignore[misc,no-any-return]
 
 
-def get_pagination_options(offset: int = 0, limit: int = 1_000) -> PaginationOptions:
-    return PaginationOptions(offset, limit)
+async def get_view_debts_case(container: Container = Depends(get_container)) -> ViewDebtsCase:
+    return await container.view_debts_case()  # type: ignore[misc,no-any-return]
+
+
+def get_pagination_options(offset: int = 0, limit: int = 1_000, after: t.Optional[str] = None) -> PaginationOptions:
+    return PaginationOptions(offset, limit, after)
+
+
+def get_total_count_mode(total: TotalMode = "exact") -> TotalCountMode:
+    return decode_total_count_mode(total)
 
 
 def get_loan_filter_options(
@@ -0,0 +1,47 @@
+"""Module provides fast JSON encoding of loan listings: loans are encoded as they are stored in DB, without parsing
+them into `solders` objects, pydantic models and response model validation. The result matches the schema of
+`ItemsViewObject[LoanObject]`.
+"""
+
+import typing as t
+
+import orjson
+
+from spl_token_lending.api.data import encode_loan_item_status
+from spl_token_lending.domain.data import ItemsView
+from spl_token_lending.repository.data import LoanItem, LoanRecord
+
+JSON_MEDIA_TYPE: t.Final[str] = "application/json"
+
+_STATUSES = {status: encode_loan_item_status(status) for status in LoanItem.Status}
+
+
+def dumps(value: object) -> bytes:
+    """Encodes value to compact JSON, UUIDs are encoded as strings."""
+
+    return orjson.dumps(value)
+
+
+def encode_loan_records_view(view: ItemsView[LoanRecord]) -> bytes:
+    return dumps({
+        "info": {
+            "offset": view.info.offset,
+            "limit": view.info.limit,
+            "total": view.info.total,
+            "next_cursor": view.info.next_cursor,
+        },
+        "items": [make_loan_record_object(record) for record in view.items],
+    })
+
+
+def make_loan_record_object(record: LoanRecord) -> t.Dict[str, object]:
+    """Returns loan record with the same fields as `LoanObject` has, it's shared by listing and export."""
+
+    return {
+        "id": record.id_,
+        "status": _STATUSES[record.status],
+        "wallet": record.wallet,
+        "amount": record.amount,
+        "signature": record.signature,
+        "last_valid_block_height": record.last_valid_block_height,
+    }
@@ -0,0 +1,50 @@
+"""Module provides encoding of streamed loan batches for export, each batch is encoded into one chunk of the response
+body, so the whole export is never kept in memory."""
+
+import csv
+import io
+import typing as t
+
+from spl_token_lending.api.encoding import dumps, make_loan_record_object
+from spl_token_lending.repository.data import LoanRecord
+from spl_token_lending.strict_typing import make_non_exhaustive_check_error
+
+ExportFormat = t.Literal["ndjson", "csv"]
+
+_CSV_FIELDS = ("id", "status", "wallet", "amount", "signature", "last_valid_block_height")
+
+
+def get_export_media_type(format_: ExportFormat) -> str:
+    if format_ == "ndjson":
+        return "application/x-ndjson"
+    elif format_ == "csv":
+        return "text/csv"
+    else:
+        raise make_non_exhaustive_check_error(format_)
+
+
+async def encode_loans(
+        batches: t.AsyncIterator[t.Sequence[LoanRecord]],
+        format_: ExportFormat,
+) -> t.AsyncIterator[bytes]:
+    """Encodes loans with the same fields as `LoanObject` has: one JSON object per line or CSV rows with header."""
+
+    if format_ == "csv":
+        yield _encode_csv_rows([_CSV_FIELDS])
+
+    async for batch in batches:
+        objects = [make_loan_record_object(record) for record in batch]
+
+        if format_ == "ndjson":
+            yield b"".join(dumps(obj) + b"\n" for obj in objects)
+        elif format_ == "csv":
+            yield _encode_csv_rows([[obj[field] for field in _CSV_FIELDS] for obj in objects])
+        else:
+            raise make_non_exhaustive_check_error(format_)
+
+
+def _encode_csv_rows(rows: t.Iterable[t.Sequence[object]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+
+    return buffer.getvalue().encode()
@@ -1,18 +1,35 @@
 import typing as t
 
-from fastapi import APIRouter, Body, Depends, HTTPException, Path, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from solders.pubkey import Pubkey
 
-from spl_token_lending.api.data import ItemsViewObject, LoanObject, LoanRequestObject, LoanSubmitObject
+from spl_token_lending import metrics
+from spl_token_lending.api.data import (
+    ItemsViewObject, LoanBatchRequestObject, LoanBatchResultObject, LoanBatchSubmitItemObject,
+    LoanBatchSubmitObject, LoanObject, LoanRequestObject, LoanSubmitObject,
+    MetricObject, WalletDebtObject,
+)
 from spl_token_lending.api.dependencies import (
     get_loan_filter_options,
     get_pagination_options,
-    get_user_lending_case, get_view_user_loans_case,
+    get_total_count_mode,
+    get_user_lending_case, get_view_debts_case, get_view_user_loans_case,
+)
+from spl_token_lending.api.encoding import JSON_MEDIA_TYPE, encode_loan_records_view
+from spl_token_lending.api.export import ExportFormat, encode_loans, get_export_media_type
+from spl_token_lending.domain.cases import UserLendingCase, ViewDebtsCase, ViewLoansCase
+from spl_token_lending.domain.data import FailedUserLoan, InitializedUserLoan, SubmittedUserLoan
+from spl_token_lending.repository.data import (
+    LoanFilterOptions, LoanId, LoanItem, PaginationOptions, TotalCountMode,
+    WalletDebtItem,
 )
-from spl_token_lending.domain.cases import UserLendingCase, ViewLoansCase
-from spl_token_lending.domain.data import InitializedUserLoan, ItemsView, SubmittedUserLoan
-from spl_token_lending.repository.data import LoanFilterOptions, LoanId, LoanItem, PaginationOptions
 
 router = APIRouter(prefix="/loans")
+debts_router = APIRouter(prefix="/debts")
+debug_router = APIRouter(prefix="/debug")
+metrics_router = APIRouter()
 
 
 @router.put("/", response_model=LoanObject)
@@ -32,31 +49,218 @@ async def request_loan(
     return result.item
 
 
+@router.put("/batch", response_model=t.Sequence[LoanBatchResultObject])
+async def request_loans(
+        executor: UserLendingCase = Depends(get_user_lending_case),
+        data: LoanBatchRequestObject = Body(),
+) -> t.Sequence[t.Mapping[str, object]]:
+    """Initializes user token loans in bulk, results are returned in the order of requested items.
+
+    Each item is initialized the same way as in `PUT /loans`, an invalid item or an item that doesn't fit into the
+    source balance gets an error and doesn't fail other items.
+    """
+
+    requests = _parse_batch_items(LoanRequestObject, data.items)
+    init_results = await executor.initialize_many([
+        (r.wallet, r.amount) for r in requests if isinstance(r, LoanRequestObject)
+    ])
+
+    return _make_batch_results(requests, init_results)
+
+
+@router.patch("/batch", response_model=t.Sequence[LoanBatchResultObject])
+async def submit_loans(
+        executor: UserLendingCase = Depends(get_user_lending_case),
+        data: LoanBatchSubmitObject = Body(),
+) -> t.Sequence[t.Mapping[str, object]]:
+    """Submits loans in bulk and transfers tokens for the valid ones, results are returned in the order of submitted
+    items.
+
+    Each item is checked the same way as in `PATCH /loans/{loan_id}`, transfers of the batch are packed into shared
+    transactions. An invalid item gets an error and doesn't fail other items.
+    """
+
+    requests = _parse_batch_items(LoanBatchSubmitItemObject, data.items)
+    submit_results = await executor.submit_many([
+        (LoanId(r.loan_id), r.signature) for r in requests if isinstance(r, LoanBatchSubmitItemObject)
+    ])
+
+    return _make_batch_results(requests, submit_results)
+
+
 @router.patch("/{loan_id}", response_model=LoanObject)
 async def submit_loan(
+        response: Response,
         executor: UserLendingCase = Depends(get_user_lending_case),
         loan_id: LoanId = Path(),
+        background: bool = Query(False),
         data: LoanSubmitObject = Body(),
 ) -> LoanItem:
     """Submits the loan and transfers appropriate token amount to user associated token account.
 
     User must provide a signature by performing message sign: user must sign a loan id with hist own keypair and send
     the result to this handler.
+
+    With `background` option the handler doesn't wait for the transfer: it responds with 202 status and TRANSFERRING
+    loan, then the loan becomes ACTIVE (CONFIRMED) or FAILED (see `GET /loans/{loan_id}` with `wait` option). The
+    handler responds the same way when the transfer result is unknown, the loan is settled after its transfer
+    transaction blockhash expires.
     """
 
-    result = await executor.submit(loan_id, data.signature)
+    if background:
+        result = await executor.submit_in_background(loan_id, data.signature)
+        response.status_code = status.HTTP_202_ACCEPTED
+
+    else:
+        result = await executor.submit(loan_id, data.signature)
+
     if not isinstance(result, SubmittedUserLoan):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result.error)
 
+    if result.item.status is LoanItem.Status.TRANSFERRING:
+        response.status_code = status.HTTP_202_ACCEPTED
+
     return result.item
 
 
+@router.get("/export", response_class=StreamingResponse)
+async def export_loans(
+        executor: ViewLoansCase = Depends(get_view_user_loans_case),
+        filter_: t.Optional[LoanFilterOptions] = Depends(get_loan_filter_options),
+        format_: ExportFormat = Query("ndjson", alias="format"),
+) -> StreamingResponse:
+    """Streams all loans that match the filter as newline delimited JSON (the same objects as `GET /loans` returns) or
+    CSV with header.
+
+    Loans are read from a DB cursor and sent as they are read, without counting and pagination, so it's the way to get
+    the whole loan book.
+    """
+
+    return StreamingResponse(
+        encode_loans(executor.export(filter_), format_),
+        media_type=get_export_media_type(format_),
+        headers={"content-disposition": f"attachment; filename=loans.{format_}"},
+    )
+
+
+@router.get("/{loan_id}", response_model=LoanObject)
+async def view_loan(
+        executor: ViewLoansCase = Depends(get_view_user_loans_case),
+        loan_id: LoanId = Path(),
+        wait: float = Query(0.0, ge=0.0, le=60.0),
+) -> LoanItem:
+    """Views the loan. If loan is TRANSFERRING, handler waits up to `wait` seconds for the transfer to finish."""
+
+    loan = await executor.get(loan_id, wait)
+    if loan is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="loan was not found")
+
+    return loan
+
+
 @router.get("/", response_model=ItemsViewObject[LoanObject])
 async def view_loans(
         executor: ViewLoansCase = Depends(get_view_user_loans_case),
         filter_: t.Optional[LoanFilterOptions] = Depends(get_loan_filter_options),
         pagination: PaginationOptions = Depends(get_pagination_options),
-) -> ItemsView[LoanItem]:
-    """Views all known loans with specified filter and pagination options."""
+        total_mode: TotalCountMode = Depends(get_total_count_mode),
+) -> Response:
+    """Views all known loans with specified filter and pagination options.
+
+    Total amount of found loans is counted exactly by default, `estimate` total is cheap for unfiltered listing of a
+    big table, `none` skips counting.
+    """
+
+    # response model is used for docs only, loans are encoded as stored in DB, see `encode_loan_records_view`
+    view = await executor.perform_records(filter_, pagination, total_mode)
+
+    return Response(encode_loan_records_view(view), media_type=JSON_MEDIA_TYPE)
+
+
+@debts_router.get("/", response_model=t.Sequence[WalletDebtObject])
+async def view_top_debts(
+        executor: ViewDebtsCase = Depends(get_view_debts_case),
+        limit: int = Query(100, gt=0, le=1_000),
+) -> t.Sequence[WalletDebtItem]:
+    """Views wallets with the biggest outstanding debt (total amount of active loans)."""
+
+    return await executor.find_top(limit)
+
+
+@debts_router.get("/{wallet}", response_model=WalletDebtObject)
+async def view_wallet_debt(
+        executor: ViewDebtsCase = Depends(get_view_debts_case),
+        wallet: str = Path(),
+) -> WalletDebtItem:
+    """Views outstanding debt (total amount of active loans) of the wallet."""
+
+    return await executor.get(Pubkey.from_string(wallet))
+
+
+@debug_router.get("/metrics", response_model=t.Sequence[MetricObject])
+async def view_metrics() -> t.Sequence[t.Mapping[str, object]]:
+    """Views current values of in-process metrics, e.g. DB connection pool usage."""
+
+    return [
+        {
+            "name": metric.name,
+            "kind": metric.type,
+            "documentation": metric.documentation,
+            "samples": [{"name": s.name, "labels": s.labels, "value": s.value} for s in metric.samples],
+        }
+        for metric in metrics.collect()
+    ]
+
+
+@metrics_router.get("/metrics", response_class=Response, include_in_schema=False)
+async def export_metrics() -> Response:
+    """Exports metrics in prometheus text format, metrics of all processes are aggregated in prometheus multiprocess
+    mode (`PROMETHEUS_MULTIPROC_DIR` is set)."""
+
+    return Response(metrics.render_text(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+M = t.TypeVar("M", bound=BaseModel)
+
+
+def _parse_batch_items(
+        model: t.Type[M],
+        items: t.Sequence[t.Mapping[str, object]],
+) -> t.Sequence[t.Union[M, ValidationError]]:
+    results: t.List[t.Union[M, ValidationError]] = []
+
+    for item in items:
+        try:
+            results.append(model.parse_obj(item))
+
+        except ValidationError as err:
+            results.append(err)
+
+    return results
+
+
+def _make_batch_results(
+        requests: t.Sequence[t.Union[BaseModel, ValidationError]],
+        results: t.Sequence[t.Union[InitializedUserLoan, SubmittedUserLoan, FailedUserLoan]],
+) -> t.Sequence[t.Mapping[str, object]]:
+    """Merges validation errors of batch items with results of valid items, which are in the same order."""
+
+    valid_results = iter(results)
+    batch_results: t.List[t.Mapping[str, object]] = []
+
+    for request in requests:
+        if isinstance(request, ValidationError):
+            batch_results.append({"error": _format_validation_error(request)})
+            continue
+
+        result = next(valid_results)
+        if isinstance(result, FailedUserLoan):
+            batch_results.append({"error": result.error})
+        else:
+            batch_results.append({"loan": result.item})
+
+    return batch_results
+
 
-    return await executor.perform(filter_, pagination)
+def _format_validation_error(err: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in err.errors())
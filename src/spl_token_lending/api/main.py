@@ -5,11 +5,18 @@ from starlette.requests import Request
 from starlette.responses import JSONResponse, Response
 
 from spl_token_lending.api.dependencies import get_container
-from spl_token_lending.api.handlers import router
+from spl_token_lending.api.handlers import debts_router, debug_router, metrics_router, router
+from spl_token_lending.api.middleware import RequestMetricsMiddleware, RequestTimingMiddleware
 from spl_token_lending.db.migration import run_migration_upgrade
 
 app = FastAPI()
 app.include_router(router)
+app.include_router(debts_router)
+app.include_router(debug_router)
+app.include_router(metrics_router)
+app.add_middleware(RequestMetricsMiddleware)
+app.add_middleware(RequestTimingMiddleware,
+                   get_slow_request_threshold=lambda: get_container().config().http_slow_request_threshold)
 
 
 @app.exception_handler(ValueError)
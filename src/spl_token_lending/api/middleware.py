@@ -0,0 +1,120 @@
+"""Module provides ASGI middlewares, that measure HTTP request latency: by route in metrics and per request in
+`Server-Timing` header."""
+
+import logging
+import time
+import typing as t
+
+from prometheus_client import Histogram
+from starlette.routing import BaseRoute, Route
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from spl_token_lending.timing import format_server_timing, use_trace
+
+_LOGGER = logging.getLogger(__name__)
+
+_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency by route and status",
+                             ("method", "route", "status"))
+
+# requests that didn't match any route are not labeled with their path to keep the amount of label values bounded
+_UNMATCHED_ROUTE: t.Final[str] = "<unmatched>"
+
+
+class RequestMetricsMiddleware:
+    """Observes the duration of each HTTP request labeled with route path template (e.g. `/loans/{loan_id}`), so all
+    requests to the same handler fall into the same histogram."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.__app = app
+        # route endpoint -> path template
+        self.__routes: t.Optional[t.Mapping[t.Callable[..., t.Any], str]] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.__app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+            await send(message)
+
+        started_at = time.perf_counter()
+
+        try:
+            await self.__app(scope, receive, send_with_status)
+
+        finally:
+            # router puts the matched endpoint into the scope
+            _REQUEST_SECONDS.labels(scope["method"], self.__get_route(scope), str(status)).observe(
+                time.perf_counter() - started_at,
+            )
+
+    def __get_route(self, scope: Scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return _UNMATCHED_ROUTE
+
+        if self.__routes is None:
+            routes: t.Sequence[BaseRoute] = getattr(scope.get("app"), "routes", ())
+            self.__routes = {route.endpoint: route.path for route in routes if isinstance(route, Route)}
+
+        return self.__routes.get(endpoint, _UNMATCHED_ROUTE)
+
+
+class RequestTimingMiddleware:
+    """Collects spans of each HTTP request (see :mod:`spl_token_lending.timing`) and sends their breakdown in
+    `Server-Timing` response header. The whole span tree of the request, that took longer than the threshold, is
+    logged as one record.
+
+    The threshold (in seconds, `None` disables logging) is received on the first request, so it may come from the
+    config, that is not available when the app is created.
+    """
+
+    def __init__(self, app: ASGIApp, get_slow_request_threshold: t.Callable[[], t.Optional[float]]) -> None:
+        self.__app = app
+        self.__get_slow_request_threshold = get_slow_request_threshold
+        self.__slow_request_threshold: t.Optional[float] = None
+        self.__threshold_received = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.__app(scope, receive, send)
+            return
+
+        status = 500
+
+        with use_trace(f"{scope['method']} {scope['path']}") as trace:
+            async def send_with_timing(message: Message) -> None:
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    message["headers"] = [
+                        *message.get("headers", ()),
+                        (b"server-timing", format_server_timing(trace).encode("latin-1")),
+                    ]
+
+                await send(message)
+
+            await self.__app(scope, receive, send_with_timing)
+
+        threshold = self.__get_threshold()
+        if threshold is not None and trace.duration >= threshold:
+            _LOGGER.warning("slow request", extra={
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "duration": trace.duration,
+                "spans": trace.to_dict(),
+            })
+
+    def __get_threshold(self) -> t.Optional[float]:
+        if not self.__threshold_received:
+            self.__slow_request_threshold = self.__get_slow_request_threshold()
+            self.__threshold_received = True
+
+        return self.__slow_request_threshold
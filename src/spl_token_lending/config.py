@@ -3,7 +3,23 @@ import os
 import typing as t
 from pathlib import Path
 
-from pydantic import AnyUrl, BaseSettings, PostgresDsn
+from pydantic import AnyUrl, BaseModel, BaseSettings, PostgresDsn
+
+
+class SolanaEndpointConfig(BaseModel):
+    url: AnyUrl
+    weight: float = 1.0
+
+
+class SolanaSimulationConfig(BaseModel):
+    slot_time: float = 0.4
+    latency_median: float = 0.05
+    latency_sigma: float = 0.5
+    throttle_rate: float = 0.0
+    error_rate: float = 0.0
+    confirmation_lag: int = 1
+    finalization_lag: int = 32
+    seed: t.Optional[int] = None
 
 
 class Config(BaseSettings):
@@ -16,12 +32,116 @@ class Config(BaseSettings):
     logging_level: t.Union[int, str] = logging.INFO
     logging_json_enabled: bool = False
 
+    http_slow_request_threshold: t.Optional[float] = 1.0
+    """Requests that take longer (in seconds) are logged with their timing breakdown, see
+    :class:`spl_token_lending.api.middleware.RequestTimingMiddleware`"""
+
+    cpu_offload_mode: t.Literal["inline", "thread", "process"] = "process"
+    """Where CPU-bound work of big batches (signature verification, token account address derivation) is performed,
+    see :class:`spl_token_lending.offload.CpuOffloader`"""
+    cpu_offload_workers: t.Optional[int] = None
+    """Size of the offload pool, by default it depends on the amount of CPUs."""
+    cpu_offload_min_batch_size: int = 64
+    """Smaller batches are processed inline, on the event loop."""
+
     postgres_dsn: PostgresDsn
+    postgres_pool_min_size: int = 10
+    postgres_pool_max_size: int = 10
+    postgres_pool_acquire_timeout: t.Optional[float] = 30.0
+    """Max time (in seconds) to wait for a free pool connection."""
+    postgres_connection_max_queries: int = 50_000
+    """Connection is replaced after that many queries."""
+    postgres_connection_max_inactive_lifetime: float = 300.0
+    """Idle connection is closed after that time (in seconds)."""
+    postgres_statement_cache_size: int = 100
 
     solana_endpoint: AnyUrl
+    solana_extra_endpoints: t.List[SolanaEndpointConfig] = []
+    """Additional solana RPC endpoints (JSON list of objects with `url` and `weight`), requests are balanced between
+    them and `solana_endpoint` (weight 1), see :class:`spl_token_lending.repository.rpc.PooledHTTPProvider`"""
+    solana_hedge_delay: t.Optional[float] = 0.5
+    """Time (in seconds) to wait for read request response before it's sent to another endpoint too."""
+    solana_endpoint_cooldown: float = 5.0
+    """Time (in seconds) the endpoint is out of rotation after 429 / 5xx response."""
+    solana_max_slot_lag: int = 50
+    solana_rate_limit: t.Optional[float] = 10.0
+    """Max amount of RPC requests per second made by the process (devnet allows 100 requests per 10 seconds), see
+    :class:`spl_token_lending.repository.ratelimit.RpcRateLimiter`"""
+    solana_rate_limit_burst: t.Optional[float] = 20.0
+    solana_method_rate_limits: t.Dict[str, float] = {}
+    """Max amount of RPC requests per second for specific methods, e.g. `{"getSignatureStatuses": 2}`."""
+    solana_throttled_max_retries: int = 5
+    """How many times the request is retried after 429 response (the whole process is paused before retry)."""
+    solana_simulation: t.Optional[SolanaSimulationConfig] = None
+    """When it's set (JSON object, e.g. `{"latency_median": 0.02, "throttle_rate": 0.01}`), solana RPC is served by
+    in-process simulated ledger instead of the cluster, for offline load & latency testing, see
+    :class:`spl_token_lending.repository.simulation.SimulatedSolanaTransport`"""
+    solana_ws_endpoint: t.Optional[AnyUrl] = None
+    """Solana pubsub websocket endpoint, by default it's derived from `solana_endpoint`."""
+    solana_confirmation_timeout: float = 90.0
+    """Max time (in seconds) to wait for transaction confirmation."""
+    solana_status_poll_interval: float = 0.4
+    """How often (in seconds) statuses of in-flight transactions are requested, by default it matches solana slot
+    time."""
+    solana_blockhash_refresh_interval: float = 10.0
+    """How often (in seconds) recent blockhash for locally built transactions is refreshed, see
+    :class:`spl_token_lending.repository.blockhash.RecentBlockhashProvider`"""
+    solana_blockhash_min_remaining_blocks: int = 75
+    """Recent blockhash is used for new transactions while it stays valid for that many blocks (blockhash is valid for
+    150 blocks, ~60 seconds)."""
+    solana_slot_time: float = 0.4
+    """Average time (in seconds) of solana slot, it's used to estimate current block height between requests."""
+    solana_transfer_commitment: t.Literal["confirmed", "finalized"] = "confirmed"
+    """Commitment the loan transfer waits for. With "confirmed" loan becomes CONFIRMED right after the transfer and
+    ACTIVE when the transfer is finalized, see :class:`spl_token_lending.domain.cases.LoanFinalizationCase`"""
+    solana_token_account_commitment: t.Literal["confirmed", "finalized"] = "confirmed"
+    """Commitment the creation of associated token account waits for before the transfer to it is sent."""
     solana_airdrop_amount: int = 1_000_000_000
     solana_mint_amount: int = 1_000
 
     token_repository_config_path: Path
     """A path to a config on a disk with :class:`spl_token_lending.repository.token.TokenRepositoryConfig` structure, 
     see :class:`spl_token_lending.repository.token.TokenRepositoryFactory`"""
+    token_transfer_batch_window: float = 0.05
+    """Time (in seconds) to collect concurrent token transfers into one batch, see
+    :class:`spl_token_lending.repository.transfer.TokenTransferBatcher`"""
+    token_transfer_batch_max_size: int = 64
+    token_account_cache_size: int = 10_000
+    """Max amount of associated token accounts that are known to exist, see
+    :meth:`spl_token_lending.repository.token.TokenRepository.get_or_create_account`"""
+    token_account_cache_ttl: float = 3600.0
+    token_balance_refresh_interval: float = 5.0
+    """How often (in seconds) source token balance is refreshed, see
+    :class:`spl_token_lending.repository.balance.SourceBalanceLedger`"""
+    loan_reservation_ttl: float = 900.0
+    """Time (in seconds) the token amount stays reserved for the initialized loan, the loan can't be submitted after
+    it (it expires and becomes FAILED)."""
+    loan_transfer_concurrency: int = 64
+    """Max amount of loan transfers performed in background at once, see
+    :class:`spl_token_lending.domain.pipeline.LoanTransferPipeline`"""
+    loan_status_poll_interval: float = 0.5
+    """How often (in seconds) loan status is checked while client waits for loan transfer to finish."""
+    loan_finalization_enabled: bool = True
+    """Whether API process checks CONFIRMED loans for finalization, see
+    :class:`spl_token_lending.domain.pipeline.LoanFinalizationReconciler`. Checks of several processes race for the
+    same loans, so when API is scaled to several processes keep it enabled in one of them only."""
+    loan_finalization_interval: float = 5.0
+    """How often (in seconds) transfers of CONFIRMED loans are checked for finalization."""
+    loan_rollback_after: float = 120.0
+    """Time (in seconds) after which CONFIRMED loan is rolled back (becomes FAILED) if solana doesn't know its
+    transfer transaction, it must exceed blockhash lifetime (~60 seconds)."""
+    loan_transfer_queue: t.Literal["memory", "postgres"] = "memory"
+    """Where transfers of loans submitted in background are queued: in API process memory or in postgres table, that
+    is processed by worker processes (`python -m spl_token_lending.worker`)."""
+
+    transfer_job_concurrency: int = 64
+    """Max amount of transfer jobs performed by one worker process at once."""
+    transfer_job_poll_interval: float = 1.0
+    """How often (in seconds) worker checks for new transfer jobs when the queue is empty."""
+    transfer_job_visibility_timeout: float = 300.0
+    """Time (in seconds) the claimed job is hidden from other workers, it must exceed the max job duration (token
+    account creation and transfer confirmation)."""
+    transfer_job_max_attempts: int = 5
+    transfer_job_retry_delay: float = 5.0
+    """Delay (in seconds) before the first retry of failed transfer job, it's doubled on each next retry."""
+    transfer_job_retry_max_delay: float = 300.0
@@ -1,6 +1,7 @@
 """Module provides DI container and can be used by different frameworks to set up the application."""
 
 import asyncio
+import functools as ft
 import logging
 import typing as t
 from contextlib import asynccontextmanager, contextmanager
@@ -13,10 +14,36 @@ from solana.rpc.async_api import AsyncClient
 
 from spl_token_lending.config import Config
 from spl_token_lending.db.models import gino
-from spl_token_lending.domain.cases import UserLendingCase, ViewLoansCase
+from spl_token_lending.db.pool import InstrumentedPool
+from spl_token_lending.domain.cases import (
+    LoanFinalizationCase,
+    LoanTransferCase,
+    TransferJobCase,
+    UserLendingCase,
+    ViewDebtsCase,
+    ViewLoansCase,
+)
+from spl_token_lending.domain.pipeline import LoanFinalizationReconciler, LoanTransferPipeline, TransferJobWorker
 from spl_token_lending.logging import setup_logging
+from spl_token_lending.metrics import mark_process_dead
+from spl_token_lending.offload import CpuOffloader, create_executor
+from spl_token_lending.repository.balance import SourceBalanceLedger
+from spl_token_lending.repository.blockhash import RecentBlockhashProvider
+from spl_token_lending.repository.cache import ExpiringLRUCache
+from spl_token_lending.repository.confirmation import (
+    BatchedSignatureStatusPoller,
+    SignatureWaiter,
+    WebsocketSignatureWaiter,
+)
+from spl_token_lending.repository.data import LoanFilterOptions, LoanItem
+from spl_token_lending.repository.debt import WalletDebtRepository
+from spl_token_lending.repository.job import TransferJobRepository
 from spl_token_lending.repository.loan import LoanRepository
+from spl_token_lending.repository.ratelimit import RpcRateLimiter
+from spl_token_lending.repository.rpc import PooledAsyncClient, RpcEndpoint, RpcPoolOptions
+from spl_token_lending.repository.simulation import SimulatedLedger, SimulatedSolanaTransport, SimulationOptions
 from spl_token_lending.repository.token import TokenRepository, TokenRepositoryFactory
+from spl_token_lending.repository.transfer import TransferBatchOptions
 from spl_token_lending.repository.wallet import WalletRepository
 
 _LOGGER = logging.getLogger(__name__)
@@ -30,6 +57,26 @@ def _create_config() -> Config:
     return config
 
 
+async def _run_metrics_process() -> t.AsyncIterator[None]:
+    try:
+        yield
+
+    finally:
+        # live gauges of the stopped process must not be reported by other processes
+        mark_process_dead()
+
+
+def _create_cpu_offloader(config: Config) -> t.Iterator[CpuOffloader]:
+    offloader = CpuOffloader(create_executor(config.cpu_offload_mode, config.cpu_offload_workers),
+                             config.cpu_offload_min_batch_size)
+
+    try:
+        yield offloader
+
+    finally:
+        offloader.close()
+
+
 def _create_alembic_postgres_engine(config: Config) -> t.Iterator[sa.engine.Engine]:
     engine = sa.create_engine(config.postgres_dsn)
 
@@ -41,17 +88,175 @@ def _create_alembic_postgres_engine(config: Config) -> t.Iterator[sa.engine.Engi
 
 
 async def _create_gino_postgres_engine(config: Config, gino_meta: Gino) -> t.AsyncIterator[Gino]:
-    async with gino_meta.with_bind(config.postgres_dsn) as engine:
+    async with gino_meta.with_bind(
+            config.postgres_dsn,
+            pool_class=ft.partial(InstrumentedPool, acquire_timeout=config.postgres_pool_acquire_timeout),
+            min_size=config.postgres_pool_min_size,
+            max_size=config.postgres_pool_max_size,
+            max_queries=config.postgres_connection_max_queries,
+            max_inactive_connection_lifetime=config.postgres_connection_max_inactive_lifetime,
+            statement_cache_size=config.postgres_statement_cache_size,
+    ) as engine:
         yield engine
 
 
 async def _create_solana_client(config: Config) -> t.AsyncIterator[AsyncClient]:
-    async with AsyncClient(config.solana_endpoint) as client:
+    endpoints = [
+        RpcEndpoint(config.solana_endpoint),
+        *(RpcEndpoint(endpoint.url, endpoint.weight) for endpoint in config.solana_extra_endpoints),
+    ]
+    options = RpcPoolOptions(
+        hedge_delay=config.solana_hedge_delay,
+        cooldown=config.solana_endpoint_cooldown,
+        max_slot_lag=config.solana_max_slot_lag,
+    )
+    rate_limiter = RpcRateLimiter(
+        rate=config.solana_rate_limit,
+        burst=config.solana_rate_limit_burst,
+        method_rates=config.solana_method_rate_limits,
+        max_retries=config.solana_throttled_max_retries,
+    )
+
+    async with PooledAsyncClient(endpoints, options, rate_limiter=rate_limiter,
+                                 transport=_create_simulated_transport(config)) as client:
         yield client
 
 
-async def _create_token_repository(config: Config, factory: TokenRepositoryFactory) -> TokenRepository:
-    return await factory.create_from_path(config.token_repository_config_path)
+def _create_simulated_transport(config: Config) -> t.Optional[SimulatedSolanaTransport]:
+    if config.solana_simulation is None:
+        return None
+
+    options = SimulationOptions(**config.solana_simulation.dict())
+    _LOGGER.warning("solana RPC is simulated", extra={"options": options})
+
+    # all endpoints share the transport, so they see the same ledger
+    return SimulatedSolanaTransport(SimulatedLedger(options), options)
+
+
+def _get_solana_ws_endpoint(config: Config) -> str:
+    if config.solana_ws_endpoint is not None:
+        return config.solana_ws_endpoint
+
+    # the same way as solana web3.js does: ws(s) scheme on the next port (if port is set explicitly)
+    url = config.solana_endpoint
+    scheme = "wss" if url.scheme == "https" else "ws"
+    port = f":{int(url.port) + 1}" if url.port is not None else ""
+
+    return f"{scheme}://{url.host}{port}{url.path or ''}"
+
+
+async def _create_signature_status_poller(
+        config: Config,
+        client: AsyncClient,
+) -> t.AsyncIterator[BatchedSignatureStatusPoller]:
+    poller = BatchedSignatureStatusPoller(
+        client=client,
+        timeout=config.solana_confirmation_timeout,
+        interval=config.solana_status_poll_interval,
+    )
+
+    try:
+        yield poller
+
+    finally:
+        await poller.close()
+
+
+async def _create_signature_waiter(
+        config: Config,
+        poller: BatchedSignatureStatusPoller,
+) -> t.AsyncIterator[SignatureWaiter]:
+    if config.solana_simulation is not None:
+        # simulation doesn't provide websocket notifications
+        yield poller
+        return
+
+    waiter = WebsocketSignatureWaiter(
+        endpoint=_get_solana_ws_endpoint(config),
+        poller=poller,
+        timeout=config.solana_confirmation_timeout,
+    )
+
+    try:
+        yield waiter
+
+    finally:
+        await waiter.close()
+
+
+async def _create_token_repository(
+        config: Config,
+        factory: TokenRepositoryFactory,
+        loan_repository: LoanRepository,
+) -> TokenRepository:
+    repository = await factory.create_from_path(config.token_repository_config_path)
+
+    # tokens were already transferred to wallets with active loans, so their token accounts exist
+    wallets = await loan_repository.find_wallets(
+        filter_=LoanFilterOptions(status_equals=LoanItem.Status.ACTIVE),
+        limit=config.token_account_cache_size,
+    )
+    await repository.add_known_accounts(wallets)
+    _LOGGER.info("token account cache warmed up", extra={"accounts": len(wallets)})
+
+    return repository
+
+
+async def _create_balance_ledger(
+        config: Config,
+        token_repository: TokenRepository,
+        loan_repository: LoanRepository,
+) -> SourceBalanceLedger:
+    ledger = SourceBalanceLedger(token_repository, config.token_balance_refresh_interval, config.loan_reservation_ttl)
+
+    # reservations are kept in memory, so amounts of loans that still may be transferred are reserved again: pending
+    # loans until they expire, transferring loans until they are settled or for the whole TTL
+    loans = await loan_repository.find_with_status_age([LoanItem.Status.PENDING, LoanItem.Status.TRANSFERRING])
+    reserved = 0
+    for loan, status_age in loans:
+        ttl = config.loan_reservation_ttl - status_age if loan.status is LoanItem.Status.PENDING else None
+        if ttl is not None and ttl <= 0:
+            continue
+
+        ledger.reserve(loan.id_, loan.amount, ttl)
+        reserved += 1
+
+    _LOGGER.info("loan reservations restored", extra={"reservations": reserved})
+
+    return ledger
+
+
+async def _run_loan_finalization_reconciler(
+        config: Config,
+        loan_repository: LoanRepository,
+        case_factory: t.Callable[[], t.Awaitable[LoanFinalizationCase]],
+) -> t.AsyncIterator[t.Optional[LoanFinalizationReconciler]]:
+    if not config.loan_finalization_enabled:
+        yield None
+        return
+
+    reconciler = LoanFinalizationReconciler(loan_repository, case_factory, config.loan_finalization_interval)
+    task = asyncio.create_task(reconciler.run())
+
+    try:
+        yield reconciler
+
+    finally:
+        reconciler.stop()
+        await task
+
+
+async def _create_loan_transfer_pipeline(
+        config: Config,
+        case_factory: t.Callable[[], t.Awaitable[LoanTransferCase]],
+) -> t.AsyncIterator[LoanTransferPipeline]:
+    pipeline = LoanTransferPipeline(case_factory, config.loan_transfer_concurrency)
+
+    try:
+        yield pipeline
+
+    finally:
+        await pipeline.close()
 
 
 class Container(DeclarativeContainer):
@@ -61,21 +266,77 @@ class Container(DeclarativeContainer):
     """
 
     config = providers.Singleton(_create_config)
+    metrics_process = providers.Resource(_run_metrics_process)
+    cpu_offloader = providers.Resource(_create_cpu_offloader, config)
 
     db_metadata = providers.Object(t.cast(Gino, gino))  # type: ignore[var-annotated]
     alembic_engine = providers.Resource(_create_alembic_postgres_engine, config)
     gino_engine = providers.Resource(_create_gino_postgres_engine, config, db_metadata)
 
     solana_client = providers.Resource(_create_solana_client, config)
-
-    wallet_repository = providers.Singleton(WalletRepository, solana_client, config.provided.solana_airdrop_amount)
-    token_repository_factory = providers.Singleton(TokenRepositoryFactory, solana_client, wallet_repository,
-                                                   config.provided.solana_mint_amount)
-    token_repository = providers.Singleton(_create_token_repository, config, token_repository_factory)
+    signature_status_poller = providers.Resource(_create_signature_status_poller, config, solana_client)
+    signature_waiter = providers.Resource(_create_signature_waiter, config, signature_status_poller)
+
+    wallet_repository = providers.Singleton(WalletRepository, solana_client, signature_waiter,
+                                            config.provided.solana_airdrop_amount)
+    token_account_cache = providers.Singleton(ExpiringLRUCache, config.provided.token_account_cache_size,
+                                              config.provided.token_account_cache_ttl)
+    token_transfer_options = providers.Singleton(TransferBatchOptions, config.provided.token_transfer_batch_window,
+                                                 config.provided.token_transfer_batch_max_size,
+                                                 config.provided.solana_transfer_commitment)
+    recent_blockhash_provider = providers.Singleton(RecentBlockhashProvider, solana_client,
+                                                    config.provided.solana_blockhash_refresh_interval,
+                                                    config.provided.solana_blockhash_min_remaining_blocks,
+                                                    config.provided.solana_slot_time)
+    token_repository_factory = providers.Singleton(TokenRepositoryFactory, solana_client, signature_waiter,
+                                                   recent_blockhash_provider, wallet_repository,
+                                                   config.provided.solana_mint_amount,
+                                                   token_transfer_options, token_account_cache,
+                                                   config.provided.solana_token_account_commitment, cpu_offloader)
     loan_repository = providers.Singleton(LoanRepository, gino_engine)
-
-    user_lending_case = providers.Singleton(UserLendingCase, token_repository, loan_repository)
-    view_loans_case = providers.Singleton(ViewLoansCase, loan_repository)
+    transfer_job_repository = providers.Singleton(TransferJobRepository, gino_engine)
+    wallet_debt_repository = providers.Singleton(WalletDebtRepository, gino_engine)
+    token_repository = providers.Singleton(_create_token_repository, config, token_repository_factory,
+                                           loan_repository)
+
+    balance_ledger = providers.Singleton(_create_balance_ledger, config, token_repository, loan_repository)
+
+    loan_transfer_case = providers.Singleton(LoanTransferCase, token_repository, loan_repository, balance_ledger)
+    # transfer case is passed as a provider, it's created on first transfer, not on resources initialization
+    loan_transfer_pipeline = providers.Resource(_create_loan_transfer_pipeline, config, loan_transfer_case.provider)
+
+    loan_finalization_case = providers.Singleton(LoanFinalizationCase, token_repository, loan_repository,
+                                                 balance_ledger, config.provided.loan_rollback_after)
+    # finalization case is passed as a provider, it's created when the first CONFIRMED or sent TRANSFERRING loan is
+    # found
+    loan_finalization_reconciler = providers.Resource(_run_loan_finalization_reconciler, config, loan_repository,
+                                                      loan_finalization_case.provider)
+
+    user_lending_case = providers.Singleton(
+        UserLendingCase,
+        loan_repository,
+        balance_ledger,
+        loan_transfer_case,
+        loan_transfer_pipeline,
+        providers.Selector(
+            config.provided.loan_transfer_queue,
+            memory=providers.Object(None),
+            postgres=transfer_job_repository,
+        ),
+        cpu_offloader,
+        config.provided.loan_reservation_ttl,
+    )
+    view_loans_case = providers.Singleton(ViewLoansCase, loan_repository, config.provided.loan_status_poll_interval)
+    view_debts_case = providers.Singleton(ViewDebtsCase, wallet_debt_repository)
+
+    transfer_job_case = providers.Singleton(TransferJobCase, token_repository, loan_repository, transfer_job_repository,
+                                            config.provided.transfer_job_max_attempts,
+                                            config.provided.transfer_job_retry_delay,
+                                            config.provided.transfer_job_retry_max_delay)
+    transfer_job_worker = providers.Singleton(TransferJobWorker, transfer_job_repository, transfer_job_case,
+                                              config.provided.transfer_job_concurrency,
+                                              config.provided.transfer_job_poll_interval,
+                                              config.provided.transfer_job_visibility_timeout)
 
 
 @asynccontextmanager
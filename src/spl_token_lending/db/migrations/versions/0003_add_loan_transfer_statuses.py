@@ -0,0 +1,28 @@
+"""add loan transfer statuses
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 10:12:40.518214
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("alter type status add value if not exists 'TRANSFERRING'")
+    op.execute("alter type status add value if not exists 'FAILED'")
+
+
+def downgrade() -> None:
+    # postgres can't drop values from enum type, so the type is recreated without them
+    op.execute("update loan set status = 'PENDING' where status in ('TRANSFERRING', 'FAILED')")
+    op.execute("alter type status rename to status_old")
+    op.execute("create type status as enum ('PENDING', 'ACTIVE', 'CLOSED')")
+    op.execute("alter table loan alter column status type status using status::text::status")
+    op.execute("drop type status_old")
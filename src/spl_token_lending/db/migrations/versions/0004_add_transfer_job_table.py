@@ -0,0 +1,40 @@
+"""add transfer job table
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 11:03:27.160528
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('transfer_job',
+                    sa.Column('id', postgresql.UUID(), server_default=sa.text('uuid_generate_v4()'), nullable=False),
+                    sa.Column('loan_id', postgresql.UUID(), nullable=False),
+                    sa.Column('status', sa.Enum('QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED',
+                                                name='transfer_job_status'), nullable=False),
+                    sa.Column('attempts', sa.Integer(), server_default=sa.text('0'), nullable=False),
+                    sa.Column('available_at', sa.DateTime(timezone=True), server_default=sa.func.now(),
+                              nullable=False),
+                    sa.Column('signature', sa.String(), nullable=True),
+                    sa.Column('error', sa.String(), nullable=True),
+                    sa.ForeignKeyConstraint(['loan_id'], ['loan.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('loan_id')
+                    )
+    op.create_index('transfer_job_status_available_at_idx', 'transfer_job', ['status', 'available_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('transfer_job_status_available_at_idx', table_name='transfer_job')
+    op.drop_table('transfer_job')
+    op.execute("drop type if exists transfer_job_status")
@@ -0,0 +1,24 @@
+"""add loan pagination indexes
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 11:48:05.734019
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('loan_wallet_id_idx', 'loan', ['wallet', 'id'])
+    op.create_index('loan_status_id_idx', 'loan', ['status', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('loan_status_id_idx', table_name='loan')
+    op.drop_index('loan_wallet_id_idx', table_name='loan')
@@ -0,0 +1,34 @@
+"""add wallet debt table
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 12:21:49.093512
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('wallet_debt',
+                    sa.Column('wallet', sa.String(), nullable=False),
+                    sa.Column('amount', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+                    sa.Column('loans', sa.Integer(), server_default=sa.text('0'), nullable=False),
+                    sa.PrimaryKeyConstraint('wallet')
+                    )
+    op.create_index('wallet_debt_amount_idx', 'wallet_debt', ['amount'])
+    op.execute(
+        "insert into wallet_debt (wallet, amount, loans) "
+        "select wallet, sum(amount), count(*) from loan where status = 'ACTIVE' group by wallet"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('wallet_debt_amount_idx', table_name='wallet_debt')
+    op.drop_table('wallet_debt')
@@ -0,0 +1,39 @@
+"""add loan confirmed status
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 14:05:12.631904
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("alter type status add value if not exists 'CONFIRMED'")
+    op.add_column('loan', sa.Column('signature', sa.String(), nullable=True))
+    op.add_column('loan', sa.Column('status_updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(),
+                                    nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('loan', 'status_updated_at')
+    op.drop_column('loan', 'signature')
+    # postgres can't drop values from enum type, so the type is recreated without it, confirmed transfers are
+    # considered finalized
+    op.execute("update loan set status = 'ACTIVE' where status = 'CONFIRMED'")
+    op.execute("alter type status rename to status_old")
+    op.execute("create type status as enum ('PENDING', 'ACTIVE', 'CLOSED', 'TRANSFERRING', 'FAILED')")
+    op.execute("alter table loan alter column status type status using status::text::status")
+    op.execute("drop type status_old")
+    op.execute("delete from wallet_debt")
+    op.execute(
+        "insert into wallet_debt (wallet, amount, loans) "
+        "select wallet, sum(amount), count(*) from loan where status = 'ACTIVE' group by wallet"
+    )
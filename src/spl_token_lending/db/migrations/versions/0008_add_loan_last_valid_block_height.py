@@ -0,0 +1,23 @@
+"""add loan last valid block height
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 18:42:37.205518
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('loan', sa.Column('last_valid_block_height', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('loan', 'last_valid_block_height')
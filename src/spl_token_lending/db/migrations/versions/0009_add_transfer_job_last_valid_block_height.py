@@ -0,0 +1,23 @@
+"""add transfer job last valid block height
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17 19:20:08.417362
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('transfer_job', sa.Column('last_valid_block_height', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('transfer_job', 'last_valid_block_height')
@@ -2,7 +2,7 @@ import sqlalchemy as sa
 from gino import Gino
 from sqlalchemy.dialects import postgresql as pg
 
-from spl_token_lending.repository.data import LoanItem
+from spl_token_lending.repository.data import LoanItem, TransferJobItem
 
 gino = Gino()
 
@@ -14,3 +14,37 @@ class LoanModel(gino.Model):  # type: ignore[name-defined,misc]
     status = sa.Column(sa.Enum(LoanItem.Status), nullable=False)
     wallet = sa.Column(sa.String(), nullable=False)
     amount = sa.Column(sa.Integer(), nullable=False)
+    signature = sa.Column(sa.String(), nullable=True)
+    last_valid_block_height = sa.Column(sa.BigInteger(), nullable=True)
+    status_updated_at = sa.Column(sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now())
+
+    _wallet_id_idx = sa.Index("loan_wallet_id_idx", "wallet", "id")
+    _status_id_idx = sa.Index("loan_status_id_idx", "status", "id")
+
+
+class WalletDebtModel(gino.Model):  # type: ignore[name-defined,misc]
+    """Aggregate of ACTIVE loans per wallet, it's kept in sync by
+    :class:`spl_token_lending.repository.loan.LoanRepository`."""
+
+    __tablename__ = "wallet_debt"
+
+    wallet = sa.Column(sa.String(), primary_key=True)
+    amount = sa.Column(sa.BigInteger(), nullable=False, server_default=sa.text("0"))
+    loans = sa.Column(sa.Integer(), nullable=False, server_default=sa.text("0"))
+
+    _amount_idx = sa.Index("wallet_debt_amount_idx", "amount")
+
+
+class TransferJobModel(gino.Model):  # type: ignore[name-defined,misc]
+    __tablename__ = "transfer_job"
+
+    id = sa.Column(pg.UUID(), primary_key=True, server_default=sa.text("uuid_generate_v4()"))
+    loan_id = sa.Column(pg.UUID(), sa.ForeignKey("loan.id", ondelete="CASCADE"), nullable=False, unique=True)
+    status = sa.Column(sa.Enum(TransferJobItem.Status, name="transfer_job_status"), nullable=False)
+    attempts = sa.Column(sa.Integer(), nullable=False, server_default=sa.text("0"))
+    available_at = sa.Column(sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now())
+    signature = sa.Column(sa.String(), nullable=True)
+    last_valid_block_height = sa.Column(sa.BigInteger(), nullable=True)
+    error = sa.Column(sa.String(), nullable=True)
+
+    _status_available_at_idx = sa.Index("transfer_job_status_available_at_idx", "status", "available_at")
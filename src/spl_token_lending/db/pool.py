@@ -0,0 +1,59 @@
+"""Module provides asyncpg connection pool for gino engine with pool metrics."""
+
+import asyncio
+import time
+import typing as t
+
+from gino.dialects.asyncpg import Pool
+from prometheus_client import Counter, Gauge, Histogram
+
+_POOL_CONNECTIONS = Gauge("db_pool_connections", "Connections in the pool by state", ["state"],
+                          multiprocess_mode="liveall")
+_POOL_ACQUIRE_SECONDS = Histogram("db_pool_acquire_seconds", "Time spent waiting for a pool connection",
+                                  buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0))
+_POOL_ACQUIRE_TIMEOUTS = Counter("db_pool_acquire_timeouts", "Pool connection acquire timeouts")
+
+
+class InstrumentedPool(Pool):  # type: ignore[misc]
+    """Records connection acquire wait time & timeouts, reports pool connections in use and idle.
+
+    `acquire_timeout` is applied when gino acquires a connection without explicit timeout.
+    """
+
+    def __init__(self, url: object, loop: object, acquire_timeout: t.Optional[float] = None, **kwargs: object) -> None:
+        super().__init__(url, loop, **kwargs)
+        self.__acquire_timeout = acquire_timeout
+
+    async def _init(self) -> "InstrumentedPool":
+        await super()._init()
+        self.__report_sizes()
+
+        return self
+
+    async def acquire(self, *, timeout: t.Optional[float] = None) -> object:
+        started_at = time.perf_counter()
+
+        try:
+            return await super().acquire(timeout=timeout if timeout is not None else self.__acquire_timeout)
+
+        except asyncio.TimeoutError:
+            _POOL_ACQUIRE_TIMEOUTS.inc()
+            raise
+
+        finally:
+            _POOL_ACQUIRE_SECONDS.observe(time.perf_counter() - started_at)
+            self.__report_sizes()
+
+    async def release(self, conn: object) -> None:
+        try:
+            await super().release(conn)
+
+        finally:
+            self.__report_sizes()
+
+    def __report_sizes(self) -> None:
+        # function gauges are not supported in multiprocess mode, so values are set on each pool change
+        idle_size = self.raw_pool.get_idle_size()
+        _POOL_CONNECTIONS.labels("in_use").set(self.raw_pool.get_size() - idle_size)
+        _POOL_CONNECTIONS.labels("idle").set(idle_size)
+        _POOL_CONNECTIONS.labels("max").set(self.raw_pool.get_max_size())
@@ -0,0 +1,32 @@
+"""Recomputes per-wallet debt aggregate from loans, e.g. after manual changes in loan table.
+
+Run it with `python -m spl_token_lending.db.rebuild_debts`.
+"""
+
+import asyncio
+import logging
+
+from dependency_injector import providers
+
+from spl_token_lending.container import Container, use_initialized_container
+from spl_token_lending.repository.debt import WalletDebtRepository
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def rebuild_debts() -> int:
+    container = Container()
+    # CONFIRMED loans are finalized by API process, see `Config.loan_finalization_enabled`
+    container.loan_finalization_reconciler.override(providers.Object(None))
+
+    async with use_initialized_container(container) as container:
+        repository: WalletDebtRepository = await container.wallet_debt_repository()  # type: ignore[misc]
+
+        wallets = await repository.rebuild()
+        _LOGGER.info("wallet debts rebuilt", extra={"wallets": wallets})
+
+        return wallets
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_debts())
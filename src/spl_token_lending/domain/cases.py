@@ -1,7 +1,11 @@
+import asyncio
+import logging
+import time
 import typing as t
+import uuid
 from dataclasses import replace
 
-from gino.transaction import GinoTransaction
+from solana.rpc.commitment import Finalized
 from solders.pubkey import Pubkey
 from solders.signature import Signature
 
@@ -10,9 +14,111 @@ from spl_token_lending.domain.data import (
     ItemsView,
     SubmittedUserLoan, SubmittedUserLoanResult,
 )
-from spl_token_lending.repository.data import Amount, LoanFilterOptions, LoanId, LoanItem, PaginationOptions
+from spl_token_lending.domain.pipeline import LoanTransferPipeline
+from spl_token_lending.offload import CpuOffloader
+from spl_token_lending.repository.balance import SourceBalanceLedger
+from spl_token_lending.repository.debt import WalletDebtRepository
+from spl_token_lending.repository.data import (
+    Amount, LoanFilterOptions, LoanId, LoanItem, LoanRecord, PaginationOptions,
+    TotalCountMode, TransferJobItem, WalletDebtItem,
+)
+from spl_token_lending.repository.job import TransferJobRepository
 from spl_token_lending.repository.loan import LoanRepository
 from spl_token_lending.repository.token import TokenRepository
+from spl_token_lending.repository.transfer import SentTransaction
+from spl_token_lending.timing import span
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def get_transferred_status(token_repository: TokenRepository) -> LoanItem.Status:
+    """Loan is ACTIVE after transfer only when transfers wait for finalization, otherwise it's CONFIRMED until
+    :class:`LoanFinalizationCase` checks it."""
+
+    return LoanItem.Status.ACTIVE if token_repository.transfer_commitment == Finalized else LoanItem.Status.CONFIRMED
+
+
+def _verify_signature(signature_wallet_message: t.Tuple[Signature, Pubkey, bytes]) -> bool:
+    signature, wallet, message = signature_wallet_message
+
+    return signature.verify(wallet, message)
+
+
+class LoanTransferCase:
+    """Transfers tokens for the loan in TRANSFERRING status and finishes the loan: it becomes ACTIVE (or CONFIRMED,
+    see :func:`get_transferred_status`) when transfer succeeded, FAILED otherwise. When the transfer result is unknown,
+    the loan stays TRANSFERRING with the transfer signature until :class:`LoanFinalizationCase` settles it."""
+
+    def __init__(
+            self,
+            token_repository: TokenRepository,
+            loan_repository: LoanRepository,
+            balance_ledger: SourceBalanceLedger,
+    ) -> None:
+        self.__token_repository = token_repository
+        self.__loan_repository = loan_repository
+        self.__balance_ledger = balance_ledger
+
+    async def perform(self, loan: LoanItem) -> SubmittedUserLoanResult:
+        sent_transactions: t.List[SentTransaction] = []
+
+        async def remember_signature(sent: SentTransaction) -> None:
+            sent_transactions.append(sent)
+
+        ok: t.Optional[bool]
+        try:
+            ok = await self.__token_repository.transfer(loan.wallet, loan.amount, remember_signature)
+
+        except Exception as err:
+            # loan must not be transferred once again, the sent transaction still may be processed
+            _LOGGER.warning("loan transfer raised an error", extra={"loan_id": loan.id_}, exc_info=err)
+            ok = None if sent_transactions else False
+
+        sent = sent_transactions[-1] if sent_transactions else None
+        if ok is None and sent is not None:
+            return await self.__keep_transferring(loan, sent)
+
+        finished_loan = await self.__loan_repository.update_status(
+            loan_id=loan.id_,
+            expected=LoanItem.Status.TRANSFERRING,
+            status=get_transferred_status(self.__token_repository) if ok else LoanItem.Status.FAILED,
+            signature=sent.signature if sent is not None else None,
+        )
+
+        if not ok:
+            self.__balance_ledger.release(loan.id_)
+        else:
+            self.__balance_ledger.consume(loan.id_, loan.amount)
+
+        if finished_loan is None:
+            _LOGGER.warning("loan status was changed during transfer", extra={"loan_id": loan.id_, "ok": ok})
+            return FailedUserLoan("loan is not transferring")
+
+        if not ok:
+            return FailedUserLoan("transfer process failed unexpectedly")
+
+        return SubmittedUserLoan(finished_loan)
+
+    async def __keep_transferring(self, loan: LoanItem, sent: SentTransaction) -> SubmittedUserLoanResult:
+        _LOGGER.warning("loan transfer result is unknown, loan stays transferring",
+                        extra={"loan_id": loan.id_, "signature": sent.signature,
+                               "last_valid_block_height": sent.last_valid_block_height})
+
+        # the amount stays reserved (with renewed expiration) until the transfer is settled
+        self.__balance_ledger.reserve(loan.id_, loan.amount)
+
+        transferring_loan = await self.__loan_repository.update_status(
+            loan_id=loan.id_,
+            expected=LoanItem.Status.TRANSFERRING,
+            status=LoanItem.Status.TRANSFERRING,
+            signature=sent.signature,
+            last_valid_block_height=sent.last_valid_block_height,
+        )
+        if transferring_loan is None:
+            _LOGGER.warning("loan status was changed during transfer", extra={"loan_id": loan.id_, "ok": None})
+            return FailedUserLoan("loan is not transferring")
+
+        return SubmittedUserLoan(transferring_loan)
 
 
 # TODO: create pending transaction in solana and start a listener to wait for client signed the transaction. Waiter
@@ -21,11 +127,29 @@ from spl_token_lending.repository.token import TokenRepository
 #  the whole amount was returned.
 class UserLendingCase:
     """User can request a token amount to be lent over by the server and receive the requested amount on his solana
-    wallet."""
+    wallet.
 
-    def __init__(self, token_repository: TokenRepository, loan_repository: LoanRepository) -> None:
-        self.__token_repository = token_repository
+    The amount is reserved for initialized loan for `loan_ttl` seconds, the loan that was not submitted in time
+    expires: it becomes FAILED on submit.
+    """
+
+    def __init__(
+            self,
+            loan_repository: LoanRepository,
+            balance_ledger: SourceBalanceLedger,
+            transfer_case: LoanTransferCase,
+            transfer_pipeline: LoanTransferPipeline,
+            transfer_job_repository: t.Optional[TransferJobRepository] = None,
+            offloader: t.Optional[CpuOffloader] = None,
+            loan_ttl: t.Optional[float] = None,
+    ) -> None:
         self.__loan_repository = loan_repository
+        self.__balance_ledger = balance_ledger
+        self.__transfer_case = transfer_case
+        self.__transfer_pipeline = transfer_pipeline
+        self.__transfer_job_repository = transfer_job_repository
+        self.__offloader = offloader if offloader is not None else CpuOffloader(None)
+        self.__loan_ttl = loan_ttl
 
     # TODO: support different token - create token repository for a provided token with appropriate owner from DB.
     async def initialize(
@@ -33,18 +157,76 @@ class UserLendingCase:
             wallet: Pubkey,
             amount: Amount,
     ) -> InitializedUserLoanResult:
-        token_available_amount = await self.__token_repository.get_account_amount(self.__token_repository.owner_pubkey)
+        with span("lending.check_balance"):
+            token_available_amount = await self.__balance_ledger.get_available_amount()
+
         if token_available_amount is None:
             return FailedUserLoan("failed to get token amount on source account")
 
         if amount > token_available_amount:
             return FailedUserLoan("insufficient token amount on source account")
 
-        pending_loan = await self.__loan_repository.create(LoanItem.Status.PENDING, wallet, amount)
+        # reserve the amount before the first await, so concurrent loans can't promise the same tokens
+        loan_id = LoanId(uuid.uuid4())
+        self.__balance_ledger.reserve(loan_id, amount)
+
+        try:
+            pending_loan = await self.__loan_repository.create(LoanItem.Status.PENDING, wallet, amount, id_=loan_id)
+
+        except BaseException:
+            self.__balance_ledger.release(loan_id)
+            raise
 
         return InitializedUserLoan(pending_loan)
 
+    async def initialize_many(
+            self,
+            requests: t.Sequence[t.Tuple[Pubkey, Amount]],
+    ) -> t.Sequence[InitializedUserLoanResult]:
+        """Initializes loans for provided wallets and amounts, returns results in the same order. Source balance is
+        checked once: loans are accepted in order while their total fits into the available amount, the rest fail.
+        Accepted loans are created in one insert."""
+
+        with span("lending.check_balance"):
+            token_available_amount = await self.__balance_ledger.get_available_amount()
+
+        if token_available_amount is None:
+            return [FailedUserLoan("failed to get token amount on source account") for _ in requests]
+
+        results: t.List[t.Optional[InitializedUserLoanResult]] = []
+        accepted: t.List[t.Tuple[LoanId, Pubkey, Amount]] = []
+        remaining_amount = token_available_amount
+
+        for wallet, amount in requests:
+            if amount > remaining_amount:
+                results.append(FailedUserLoan("insufficient token amount on source account"))
+                continue
+
+            remaining_amount = Amount(remaining_amount - amount)
+            accepted.append((LoanId(uuid.uuid4()), wallet, amount))
+            results.append(None)
+
+        for loan_id, _, amount in accepted:
+            self.__balance_ledger.reserve(loan_id, amount)
+
+        try:
+            pending_loans = iter(await self.__loan_repository.create_many(LoanItem.Status.PENDING, accepted))
+
+        except BaseException:
+            for loan_id, _, _ in accepted:
+                self.__balance_ledger.release(loan_id)
+            raise
+
+        return [result if result is not None else InitializedUserLoan(next(pending_loans)) for result in results]
+
     async def submit(self, loan_id: LoanId, signature: Signature) -> SubmittedUserLoanResult:
+        """Transfers tokens and waits for the transfer to finish, the loan becomes ACTIVE (or CONFIRMED) or
+        FAILED.
+
+        No DB transaction is held during the transfer: the loan is claimed by moving it to TRANSFERRING status (only
+        one of concurrent submits succeeds), then the status is finalized after the transfer in a separate update.
+        """
+
         pending_loan = await self.__loan_repository.get_by_id(loan_id)
         if pending_loan is None:
             return FailedUserLoan("loan was not found")
@@ -52,19 +234,376 @@ class UserLendingCase:
         if not self.__validate_signature(pending_loan, signature):
             return FailedUserLoan("provided signature is invalid")
 
-        async with self.__loan_repository.use_transaction(pending_loan.id_) as tx:  # type: GinoTransaction
-            active_loan = await self.__loan_repository.update_existing_by_id(
-                item=replace(pending_loan, status=LoanItem.Status.ACTIVE),
-            )
+        transferring_loan = await self.__start_transferring(pending_loan)
+        if transferring_loan is None:
+            return await self.__reject(pending_loan)
+
+        with span("lending.transfer"):
+            return await self.__transfer_case.perform(transferring_loan)
+
+    async def submit_many(
+            self,
+            submissions: t.Sequence[t.Tuple[LoanId, Signature]],
+    ) -> t.Sequence[SubmittedUserLoanResult]:
+        """Submits loans in bulk (see :meth:`submit`), returns results in the same order.
+
+        Loans are loaded and moved to TRANSFERRING status with one query each, then transfers are performed
+        concurrently, so they are packed into shared transactions by the token repository.
+        """
+
+        pending_loans = await self.__loan_repository.get_by_ids({loan_id for loan_id, _ in submissions})
+        found_submissions = [(pending_loans[loan_id], signature) for loan_id, signature in submissions
+                             if loan_id in pending_loans]
+        valid_signatures = iter(await self.validate_signatures(
+            [loan for loan, _ in found_submissions],
+            [signature for _, signature in found_submissions],
+        ))
+
+        results: t.List[t.Optional[SubmittedUserLoanResult]] = []
+        valid_loan_ids: t.Set[LoanId] = set()
+
+        for loan_id, signature in submissions:
+            if loan_id not in pending_loans:
+                results.append(FailedUserLoan("loan was not found"))
+
+            elif not next(valid_signatures):
+                results.append(FailedUserLoan("provided signature is invalid"))
+
+            elif loan_id in valid_loan_ids:
+                # the same loan is submitted twice, the same way as concurrent submits only one of them succeeds
+                results.append(FailedUserLoan("loan is not pending"))
+
+            else:
+                valid_loan_ids.add(loan_id)
+                results.append(None)
+
+        transferring_loans = await self.__loan_repository.update_status_many(
+            loan_ids=valid_loan_ids,
+            expected=LoanItem.Status.PENDING,
+            status=LoanItem.Status.TRANSFERRING,
+            changed_within=self.__loan_ttl,
+        )
+        for loan in transferring_loans:
+            self.__balance_ledger.reserve(loan.id_, loan.amount)
+
+        expired = await self.__expire_many(valid_loan_ids - {loan.id_ for loan in transferring_loans})
+
+        with span("lending.transfer"):
+            transfer_results = await asyncio.gather(*(
+                self.__transfer_case.perform(loan) for loan in transferring_loans
+            ))
+
+        submitted: t.Dict[LoanId, SubmittedUserLoanResult] = {
+            loan.id_: result for loan, result in zip(transferring_loans, transfer_results)
+        }
+        submitted.update((loan_id, FailedUserLoan("loan has expired")) for loan_id in expired)
+
+        return [
+            result if result is not None else submitted.get(loan_id, FailedUserLoan("loan is not pending"))
+            for result, (loan_id, _) in zip(results, submissions)
+        ]
+
+    async def submit_in_background(self, loan_id: LoanId, signature: Signature) -> SubmittedUserLoanResult:
+        """Moves the loan to TRANSFERRING status and schedules token transfer, returns without waiting for it. The
+        loan becomes ACTIVE (or CONFIRMED) or FAILED when transfer is finished.
+
+        If transfer job repository is set, the transfer is stored as a job in the same DB transaction and performed by
+        worker processes (see :class:`TransferJobCase`), otherwise it's performed by in-process pipeline.
+        """
+
+        pending_loan = await self.__loan_repository.get_by_id(loan_id)
+        if pending_loan is None:
+            return FailedUserLoan("loan was not found")
+
+        if not self.__validate_signature(pending_loan, signature):
+            return FailedUserLoan("provided signature is invalid")
+
+        if self.__transfer_job_repository is not None:
+            async with self.__loan_repository.use_transaction(pending_loan.id_):
+                transferring_loan = await self.__start_transferring(pending_loan)
+                if transferring_loan is not None:
+                    await self.__transfer_job_repository.create(transferring_loan.id_)
+
+            if transferring_loan is not None:
+                # the job is performed by worker process, that can't settle the reservation in this process, so the
+                # amount is counted as spent until the next balance refresh shows the actual amount
+                self.__balance_ledger.consume(transferring_loan.id_, transferring_loan.amount)
+
+        else:
+            transferring_loan = await self.__start_transferring(pending_loan)
+            if transferring_loan is not None:
+                self.__transfer_pipeline.schedule(transferring_loan)
+
+        if transferring_loan is None:
+            return await self.__reject(pending_loan)
+
+        return SubmittedUserLoan(transferring_loan)
+
+    async def __start_transferring(self, loan: LoanItem) -> t.Optional[LoanItem]:
+        transferring_loan = await self.__loan_repository.update_status(
+            loan_id=loan.id_,
+            expected=LoanItem.Status.PENDING,
+            status=LoanItem.Status.TRANSFERRING,
+            changed_within=self.__loan_ttl,
+        )
+        if transferring_loan is not None:
+            # the reservation is renewed, so it doesn't expire during the transfer
+            self.__balance_ledger.reserve(transferring_loan.id_, transferring_loan.amount)
+
+        return transferring_loan
+
+    async def __reject(self, loan: LoanItem) -> FailedUserLoan:
+        """Explains why the loan was not moved to TRANSFERRING status: it has expired or it's not pending."""
+
+        expired = await self.__expire_many({loan.id_})
+
+        return FailedUserLoan("loan has expired" if expired else "loan is not pending")
 
-            ok = await self.__token_repository.transfer(active_loan.wallet, active_loan.amount)
-            if not ok:
-                tx.raise_rollback()
+    async def __expire_many(self, loan_ids: t.Collection[LoanId]) -> t.Collection[LoanId]:
+        """Makes PENDING loans that were not submitted in time FAILED and releases their reservations, returns ids of
+        expired loans."""
 
-        return SubmittedUserLoan(active_loan) if ok else FailedUserLoan("transfer process failed unexpectedly")
+        if self.__loan_ttl is None or not loan_ids:
+            return ()
+
+        expired_loans = await self.__loan_repository.update_status_many(
+            loan_ids=loan_ids,
+            expected=LoanItem.Status.PENDING,
+            status=LoanItem.Status.FAILED,
+            unchanged_for=self.__loan_ttl,
+        )
+        for loan in expired_loans:
+            self.__balance_ledger.release(loan.id_)
+            _LOGGER.info("loan has expired", extra={"loan_id": loan.id_})
+
+        return {loan.id_ for loan in expired_loans}
+
+    async def validate_signatures(
+            self,
+            loans: t.Sequence[LoanItem],
+            signatures: t.Sequence[Signature],
+    ) -> t.Sequence[bool]:
+        """Checks that each loan id was signed by the loan wallet, signatures of a big batch are verified in the
+        offload pool."""
+
+        return await self.__offloader.map(
+            _verify_signature,
+            [(signature, loan.wallet, loan.id_.bytes) for loan, signature in zip(loans, signatures)],
+        )
 
     def __validate_signature(self, loan: LoanItem, signature: Signature) -> bool:
-        return signature.verify(loan.wallet, loan.id_.bytes)
+        return _verify_signature((signature, loan.wallet, loan.id_.bytes))
+
+
+class TransferJobCase:
+    """Performs loan transfer job that was claimed from the durable queue, see
+    :class:`spl_token_lending.repository.job.TransferJobRepository`.
+
+    Failed transfers are retried with exponential delay, the loan becomes FAILED when all attempts are used. Signature
+    of the sent transfer is stored in the job, so the next attempt checks that transaction before sending a new one -
+    a job that was reclaimed after worker crash doesn't transfer tokens twice. While solana doesn't know the sent
+    transaction, but its blockhash is still valid, the job is retried without sending a new transaction.
+    """
+
+    def __init__(
+            self,
+            token_repository: TokenRepository,
+            loan_repository: LoanRepository,
+            job_repository: TransferJobRepository,
+            max_attempts: int,
+            retry_delay: float,
+            retry_max_delay: float,
+    ) -> None:
+        self.__token_repository = token_repository
+        self.__loan_repository = loan_repository
+        self.__job_repository = job_repository
+        self.__max_attempts = max_attempts
+        self.__retry_delay = retry_delay
+        self.__retry_max_delay = retry_max_delay
+
+    async def perform(self, job: TransferJobItem) -> TransferJobItem:
+        loan = await self.__loan_repository.get_by_id(job.loan_id)
+        if loan is None or loan.status is not LoanItem.Status.TRANSFERRING:
+            # the previous attempt has finished the loan, but job was not updated
+            if loan is not None and loan.status in (LoanItem.Status.ACTIVE, LoanItem.Status.CONFIRMED):
+                return await self.__job_repository.finish(job.id_, TransferJobItem.Status.SUCCEEDED)
+
+            return await self.__job_repository.finish(
+                job_id=job.id_,
+                status=TransferJobItem.Status.FAILED,
+                error="loan is not transferring",
+            )
+
+        if job.signature is not None:
+            try:
+                transferred = await self.__token_repository.get_transfer_result(
+                    signature=job.signature,
+                    commitment=self.__token_repository.transfer_commitment,
+                    last_valid_block_height=job.last_valid_block_height,
+                )
+
+            except Exception as err:
+                _LOGGER.warning("failed to check sent transfer", extra={"job_id": job.id_}, exc_info=err)
+                return await self.__retry(job, "failed to check sent transfer")
+
+            if transferred is None:
+                return await self.__retry(job, "sent transfer is not confirmed yet")
+
+            if transferred:
+                return await self.__finish(job, loan, True, signature=job.signature)
+
+        signatures: t.List[Signature] = []
+
+        async def remember_signature(sent: SentTransaction) -> None:
+            signatures.append(sent.signature)
+            await self.__job_repository.set_signature(job.id_, sent.signature, sent.last_valid_block_height)
+
+        ok: t.Optional[bool]
+        try:
+            ok = await self.__token_repository.transfer(
+                wallet=loan.wallet,
+                amount=loan.amount,
+                on_sent=remember_signature,
+            )
+            error = "transfer failed" if ok is not None else "transfer result is unknown"
+
+        except Exception as err:
+            _LOGGER.warning("loan transfer raised an error", extra={"job_id": job.id_}, exc_info=err)
+            ok, error = None if signatures else False, repr(err)
+
+        if ok:
+            return await self.__finish(job, loan, True, signature=signatures[-1] if signatures else None)
+
+        # the sent transaction still may be processed, the next attempt checks it before sending a new one
+        if ok is None or job.attempts < self.__max_attempts:
+            return await self.__retry(job, error)
+
+        return await self.__finish(job, loan, False, error)
+
+    async def __finish(
+            self,
+            job: TransferJobItem,
+            loan: LoanItem,
+            ok: bool,
+            error: t.Optional[str] = None,
+            signature: t.Optional[Signature] = None,
+    ) -> TransferJobItem:
+        async with self.__loan_repository.use_transaction(loan.id_):
+            await self.__loan_repository.update_status(
+                loan_id=loan.id_,
+                expected=LoanItem.Status.TRANSFERRING,
+                status=get_transferred_status(self.__token_repository) if ok else LoanItem.Status.FAILED,
+                signature=signature,
+            )
+            finished_job = await self.__job_repository.finish(
+                job_id=job.id_,
+                status=TransferJobItem.Status.SUCCEEDED if ok else TransferJobItem.Status.FAILED,
+                error=error,
+            )
+
+        _LOGGER.info("transfer job finished", extra={"job_id": job.id_, "loan_id": loan.id_, "ok": ok})
+
+        return finished_job
+
+    async def __retry(self, job: TransferJobItem, error: str) -> TransferJobItem:
+        delay = min(self.__retry_delay * 2 ** max(job.attempts - 1, 0), self.__retry_max_delay)
+        _LOGGER.info("transfer job will be retried", extra={"job_id": job.id_, "delay": delay, "error": error})
+
+        return await self.__job_repository.retry(job.id_, delay, error)
+
+
+class LoanFinalizationCase:
+    """Checks transfers of CONFIRMED loans: the loan becomes ACTIVE when its transfer transaction is finalized, FAILED
+    when the transaction failed or was dropped (solana doesn't know it `rollback_after` seconds after confirmation, by
+    that time its blockhash has expired).
+
+    TRANSFERRING loans with a signature (transfer result was unknown, see :class:`LoanTransferCase`) are settled the
+    same way, but unknown transaction is considered dropped only after its blockhash has expired. The reserved amount
+    is consumed or released then.
+    """
+
+    def __init__(
+            self,
+            token_repository: TokenRepository,
+            loan_repository: LoanRepository,
+            balance_ledger: SourceBalanceLedger,
+            rollback_after: float,
+            batch_size: int = 256,
+    ) -> None:
+        self.__token_repository = token_repository
+        self.__loan_repository = loan_repository
+        self.__balance_ledger = balance_ledger
+        self.__rollback_after = rollback_after
+        self.__batch_size = batch_size
+
+    async def perform(self) -> int:
+        """Checks all CONFIRMED and sent TRANSFERRING loans, returns the amount of loans that were finished."""
+
+        finished = 0
+        for filter_ in (
+                LoanFilterOptions(status_equals=LoanItem.Status.CONFIRMED),
+                LoanFilterOptions(status_equals=LoanItem.Status.TRANSFERRING, has_signature=True),
+        ):
+            finished += await self.__finish_all(filter_)
+
+        return finished
+
+    async def __finish_all(self, filter_: LoanFilterOptions) -> int:
+        pagination = PaginationOptions(limit=self.__batch_size)
+        finished = 0
+
+        while True:
+            loans = await self.__loan_repository.find(filter_, pagination)
+            if not loans:
+                return finished
+
+            finished += await self.__finish_batch(loans)
+
+            if len(loans) < self.__batch_size:
+                return finished
+
+            pagination = replace(pagination, after=self.__loan_repository.encode_cursor(loans[-1]))
+
+    async def __finish_batch(self, loans: t.Sequence[LoanItem]) -> int:
+        signed_loans = [loan for loan in loans if loan.signature is not None]
+        results = await self.__token_repository.get_transfer_results(
+            [t.cast(Signature, loan.signature) for loan in signed_loans],
+            Finalized,
+            [loan.last_valid_block_height for loan in signed_loans],
+        )
+        finished = 0
+
+        for loan, result in zip(signed_loans, results):
+            if result is None:
+                continue
+
+            finished_loan = await self.__loan_repository.update_status(
+                loan_id=loan.id_,
+                expected=loan.status,
+                status=LoanItem.Status.ACTIVE if result else LoanItem.Status.FAILED,
+                unchanged_for=None if result else self.__rollback_after,
+            )
+            if finished_loan is None:
+                continue
+
+            finished += 1
+            if loan.status is LoanItem.Status.TRANSFERRING:
+                if result:
+                    self.__balance_ledger.consume(loan.id_, loan.amount)
+                else:
+                    self.__balance_ledger.release(loan.id_)
+
+            if result:
+                _LOGGER.info("loan transfer finalized", extra={"loan_id": loan.id_, "signature": loan.signature})
+
+            else:
+                _LOGGER.warning("loan transfer was dropped, loan is rolled back",
+                                extra={"loan_id": loan.id_, "status": loan.status, "signature": loan.signature})
+
+        return finished
+
+
+LoanItemT = t.TypeVar("LoanItemT", LoanItem, LoanRecord)
 
 
 class ViewLoansCase:
@@ -73,24 +612,86 @@ class ViewLoansCase:
     User can view all outstanding debts (wallet address, amount, token address)
     """
 
-    def __init__(self, loan_repository: LoanRepository) -> None:
+    def __init__(self, loan_repository: LoanRepository, status_poll_interval: float = 0.5) -> None:
         self.__loan_repository = loan_repository
+        self.__status_poll_interval = status_poll_interval
+
+    async def get(self, loan_id: LoanId, wait: float = 0.0) -> t.Optional[LoanItem]:
+        """Returns the loan, waits up to `wait` seconds while loan transfer is in progress."""
+
+        deadline = time.monotonic() + wait
+
+        while True:
+            loan = await self.__loan_repository.get_by_id(loan_id)
+            if loan is None or loan.status is not LoanItem.Status.TRANSFERRING:
+                return loan
+
+            delay = min(self.__status_poll_interval, deadline - time.monotonic())
+            if delay <= 0.0:
+                return loan
+
+            await asyncio.sleep(delay)
 
     async def perform(
             self,
             filter_: t.Optional[LoanFilterOptions] = None,
             pagination: t.Optional[PaginationOptions] = None,
+            total_mode: TotalCountMode = TotalCountMode.EXACT,
     ) -> ItemsView[LoanItem]:
         clean_pagination = pagination if pagination is not None else PaginationOptions()
 
-        total = await self.__loan_repository.count(filter_)
-        loans = await self.__loan_repository.find(filter_, clean_pagination)
+        loans, total = await self.__loan_repository.find_with_total(filter_, clean_pagination, total_mode)
+
+        return self.__make_view(loans, total, clean_pagination)
+
+    async def perform_records(
+            self,
+            filter_: t.Optional[LoanFilterOptions] = None,
+            pagination: t.Optional[PaginationOptions] = None,
+            total_mode: TotalCountMode = TotalCountMode.EXACT,
+    ) -> ItemsView[LoanRecord]:
+        """The same as :meth:`perform`, but loans are viewed as stored in DB, e.g. to serialize them without
+        conversions."""
+
+        clean_pagination = pagination if pagination is not None else PaginationOptions()
 
+        loans, total = await self.__loan_repository.find_records_with_total(filter_, clean_pagination, total_mode)
+
+        return self.__make_view(loans, total, clean_pagination)
+
+    def __make_view(
+            self,
+            loans: t.Sequence[LoanItemT],
+            total: t.Optional[int],
+            clean_pagination: PaginationOptions,
+    ) -> ItemsView[LoanItemT]:
         return ItemsView(
             info=ItemsView.Info(
                 offset=clean_pagination.offset,
                 limit=clean_pagination.limit,
                 total=total,
+                next_cursor=(
+                    self.__loan_repository.encode_cursor(loans[-1])
+                    if loans and len(loans) >= clean_pagination.limit else None
+                ),
             ),
             items=loans,
         )
+
+    def export(self, filter_: t.Optional[LoanFilterOptions] = None) -> t.AsyncIterator[t.Sequence[LoanRecord]]:
+        """Yields records of all loans that match the filter in batches, without counting and pagination."""
+
+        return self.__loan_repository.iterate(filter_)
+
+
+class ViewDebtsCase:
+    """User can view outstanding debt of a wallet or wallets with the biggest debt."""
+
+    def __init__(self, debt_repository: WalletDebtRepository) -> None:
+        self.__debt_repository = debt_repository
+
+    async def get(self, wallet: Pubkey) -> WalletDebtItem:
+        return await self.__debt_repository.get(wallet)
+
+    async def find_top(self, limit: int) -> t.Sequence[WalletDebtItem]:
+        return await self.__debt_repository.find_top(limit)
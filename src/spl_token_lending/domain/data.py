@@ -27,7 +27,8 @@ class ItemsView(t.Generic[T]):
     class Info:
         offset: int
         limit: int
-        total: int
+        total: t.Optional[int]
+        next_cursor: t.Optional[str] = None
 
     info: Info
     items: t.Sequence[T]
@@ -0,0 +1,199 @@
+"""Module provides background execution of loan token transfers, so API handlers don't wait for transaction
+finalization."""
+
+import asyncio
+import logging
+import typing as t
+
+from spl_token_lending.repository.data import LoanFilterOptions, LoanItem, TransferJobItem
+from spl_token_lending.repository.job import TransferJobRepository
+from spl_token_lending.repository.loan import LoanRepository
+
+if t.TYPE_CHECKING:
+    from spl_token_lending.domain.cases import LoanFinalizationCase, LoanTransferCase, TransferJobCase
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class LoanTransferPipeline:
+    """Queues loans in TRANSFERRING status and performs their transfers with a fixed amount of workers.
+
+    Workers are started on first scheduled loan. The transfer case is received from `case_factory` lazily, so pipeline
+    can be created before solana & token repository are ready. The queue is kept in memory: loans that were not
+    transferred before the process exit stay in TRANSFERRING status.
+    """
+
+    def __init__(
+            self,
+            case_factory: t.Callable[[], t.Awaitable["LoanTransferCase"]],
+            concurrency: int,
+    ) -> None:
+        self.__case_factory = case_factory
+        self.__concurrency = concurrency
+
+        self.__queue: "asyncio.Queue[LoanItem]" = asyncio.Queue()
+        self.__workers: t.List["asyncio.Task[None]"] = []
+
+    @property
+    def size(self) -> int:
+        return self.__queue.qsize()
+
+    def schedule(self, loan: LoanItem) -> None:
+        if not self.__workers:
+            self.__workers = [asyncio.create_task(self.__work()) for _ in range(self.__concurrency)]
+
+        self.__queue.put_nowait(loan)
+
+    async def join(self) -> None:
+        """Waits until all scheduled loans are processed."""
+
+        if self.__workers:
+            await self.__queue.join()
+
+    async def close(self) -> None:
+        """Processes already scheduled loans and stops the workers."""
+
+        await self.join()
+
+        workers, self.__workers = self.__workers, []
+        for worker in workers:
+            worker.cancel()
+
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def __work(self) -> None:
+        while True:
+            loan = await self.__queue.get()
+
+            try:
+                case = await self.__case_factory()
+                await case.perform(loan)
+
+            except Exception as err:
+                _LOGGER.exception("loan transfer failed unexpectedly", extra={"loan_id": loan.id_}, exc_info=err)
+
+            finally:
+                self.__queue.task_done()
+
+
+class TransferJobWorker:
+    """Claims transfer jobs from the database queue and performs up to `concurrency` of them at once.
+
+    Any amount of workers can be run in different processes / on different nodes. `visibility_timeout` must be greater
+    than the max job duration, otherwise the job may be claimed by another worker while it's still performed.
+    """
+
+    def __init__(
+            self,
+            job_repository: TransferJobRepository,
+            case: "TransferJobCase",
+            concurrency: int,
+            poll_interval: float,
+            visibility_timeout: float,
+    ) -> None:
+        self.__job_repository = job_repository
+        self.__case = case
+        self.__concurrency = concurrency
+        self.__poll_interval = poll_interval
+        self.__visibility_timeout = visibility_timeout
+
+        self.__stopped = asyncio.Event()
+        self.__tasks: t.Set["asyncio.Task[None]"] = set()
+
+    def stop(self) -> None:
+        """Stops claiming new jobs, :meth:`run` returns when claimed jobs are finished."""
+
+        self.__stopped.set()
+
+    async def run(self) -> None:
+        stop_waiter = asyncio.create_task(self.__stopped.wait())
+        _LOGGER.info("transfer job worker started", extra={"concurrency": self.__concurrency})
+
+        try:
+            while not self.__stopped.is_set():
+                free_slots = self.__concurrency - len(self.__tasks)
+                jobs = await self.__claim(free_slots) if free_slots > 0 else []
+
+                for job in jobs:
+                    task = asyncio.create_task(self.__perform(job))
+                    self.__tasks.add(task)
+                    task.add_done_callback(self.__tasks.discard)
+
+                if free_slots == 0:
+                    # all slots are busy, wait for any job to finish
+                    await asyncio.wait({stop_waiter, *self.__tasks}, return_when=asyncio.FIRST_COMPLETED)
+
+                elif len(jobs) < free_slots:
+                    # queue is drained, wait for new jobs to come
+                    await asyncio.wait({stop_waiter}, timeout=self.__poll_interval)
+
+        finally:
+            stop_waiter.cancel()
+            await asyncio.gather(*self.__tasks, return_exceptions=True)
+            _LOGGER.info("transfer job worker stopped")
+
+    async def __claim(self, limit: int) -> t.Sequence[TransferJobItem]:
+        try:
+            return await self.__job_repository.claim(limit, self.__visibility_timeout)
+
+        except Exception as err:
+            _LOGGER.warning("failed to claim transfer jobs", exc_info=err)
+            return []
+
+    async def __perform(self, job: TransferJobItem) -> None:
+        _LOGGER.debug("transfer job claimed", extra={"job_id": job.id_, "attempts": job.attempts})
+
+        try:
+            await self.__case.perform(job)
+
+        except Exception as err:
+            # job will be claimed again after visibility timeout
+            _LOGGER.exception("transfer job failed unexpectedly", extra={"job_id": job.id_}, exc_info=err)
+
+
+class LoanFinalizationReconciler:
+    """Runs :class:`spl_token_lending.domain.cases.LoanFinalizationCase` every `interval` while there are CONFIRMED
+    loans or sent TRANSFERRING loans. The case is received from `case_factory` only when such loans appear, so
+    reconciler can be started before solana & token repository are ready."""
+
+    def __init__(
+            self,
+            loan_repository: LoanRepository,
+            case_factory: t.Callable[[], t.Awaitable["LoanFinalizationCase"]],
+            interval: float,
+    ) -> None:
+        self.__loan_repository = loan_repository
+        self.__case_factory = case_factory
+        self.__interval = interval
+
+        self.__stopped = asyncio.Event()
+
+    def stop(self) -> None:
+        self.__stopped.set()
+
+    async def run(self) -> None:
+        while not self.__stopped.is_set():
+            try:
+                await self.__reconcile()
+
+            except Exception as err:
+                _LOGGER.warning("loan finalization failed", exc_info=err)
+
+            try:
+                await asyncio.wait_for(self.__stopped.wait(), self.__interval)
+
+            except asyncio.TimeoutError:
+                pass
+
+    async def __reconcile(self) -> None:
+        confirmed = await self.__loan_repository.count(LoanFilterOptions(status_equals=LoanItem.Status.CONFIRMED))
+        sent = await self.__loan_repository.count(
+            LoanFilterOptions(status_equals=LoanItem.Status.TRANSFERRING, has_signature=True)
+        )
+        if confirmed == 0 and sent == 0:
+            return
+
+        case = await self.__case_factory()
+        finished = await case.perform()
+
+        _LOGGER.debug("confirmed loans checked", extra={"confirmed": confirmed, "sent": sent, "finished": finished})
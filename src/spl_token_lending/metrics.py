@@ -0,0 +1,45 @@
+"""Module provides exposition of prometheus metrics.
+
+Metrics are declared with :mod:`prometheus_client` on module level (the same way as loggers). When
+`PROMETHEUS_MULTIPROC_DIR` environment variable is set, the client works in multiprocess mode: each process (API &
+worker processes on the host) stores its values in that directory and `/metrics` reports all of them aggregated. The
+variable must be set before the service is started and the directory must be emptied before it.
+"""
+
+import os
+import typing as t
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+from prometheus_client.metrics_core import Metric
+
+MULTIPROCESS_DIR_ENV: t.Final[str] = "PROMETHEUS_MULTIPROC_DIR"
+PROMETHEUS_CONTENT_TYPE: t.Final[str] = CONTENT_TYPE_LATEST
+
+
+def is_multiprocess_mode_enabled() -> bool:
+    return bool(os.environ.get(MULTIPROCESS_DIR_ENV))
+
+
+def collect() -> t.Sequence[Metric]:
+    """Returns current values of in-process metrics."""
+
+    return list(REGISTRY.collect())
+
+
+def render_text() -> bytes:
+    """Renders metrics in prometheus text format, metrics of all processes are aggregated in multiprocess mode."""
+
+    if not is_multiprocess_mode_enabled():
+        return generate_latest(REGISTRY)
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)  # type: ignore[no-untyped-call]
+
+    return generate_latest(registry)
+
+
+def mark_process_dead(pid: t.Optional[int] = None) -> None:
+    """Drops live gauge values of the exited process (the current one by default) in multiprocess mode."""
+
+    if is_multiprocess_mode_enabled():
+        multiprocess.mark_process_dead(pid if pid is not None else os.getpid())  # type: ignore[no-untyped-call]
@@ -0,0 +1,58 @@
+"""Module provides offloading of CPU-bound work (e.g. signature verification, token account address derivation) from
+the event loop to a thread or process pool, so processing of a big batch doesn't stall other requests."""
+
+import asyncio
+import typing as t
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+A = t.TypeVar("A")
+R = t.TypeVar("R")
+
+OffloadMode = t.Literal["inline", "thread", "process"]
+
+
+def create_executor(mode: OffloadMode, workers: t.Optional[int] = None) -> t.Optional[Executor]:
+    """Returns the executor for the mode, `None` for inline mode."""
+
+    if mode == "inline":
+        return None
+    elif mode == "thread":
+        return ThreadPoolExecutor(workers, thread_name_prefix="cpu-offload")
+    elif mode == "process":
+        return ProcessPoolExecutor(workers)
+    else:
+        raise ValueError("unknown offload mode", mode)
+
+
+class CpuOffloader:
+    """Applies a function to each item of a batch.
+
+    Batches smaller than `min_batch_size` are processed inline (pool round trip costs more than the work itself),
+    bigger ones are split into chunks of `chunk_size` items, which are processed by the executor concurrently. With
+    process pool the function and items must be picklable, e.g. the function must be defined on module level.
+    """
+
+    def __init__(self, executor: t.Optional[Executor], min_batch_size: int = 64, chunk_size: int = 256) -> None:
+        self.__executor = executor
+        self.__min_batch_size = min_batch_size
+        self.__chunk_size = chunk_size
+
+    async def map(self, func: t.Callable[[A], R], items: t.Sequence[A]) -> t.Sequence[R]:
+        if self.__executor is None or len(items) < self.__min_batch_size:
+            return _apply(func, items)
+
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*(
+            loop.run_in_executor(self.__executor, _apply, func, items[i:i + self.__chunk_size])
+            for i in range(0, len(items), self.__chunk_size)
+        ))
+
+        return [result for chunk in chunks for result in chunk]
+
+    def close(self) -> None:
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+
+
+def _apply(func: t.Callable[[A], R], items: t.Sequence[A]) -> t.Sequence[R]:
+    return [func(item) for item in items]
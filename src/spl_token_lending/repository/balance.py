@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+import typing as t
+
+from prometheus_client import Gauge
+
+from spl_token_lending.repository.data import Amount, LoanId
+from spl_token_lending.repository.token import TokenRepository
+
+_LOGGER = logging.getLogger(__name__)
+
+# processes see the same account, the lowest value is the most recent one (loans only spend tokens)
+_SOURCE_BALANCE = Gauge("token_source_balance", "Token amount on the source account known to the process",
+                        multiprocess_mode="livemin")
+
+
+class SourceBalanceLedger:
+    """Keeps an in-process view of the token amount on the source account and reserves amounts for loans that were
+    initialized, but not transferred yet.
+
+    The balance is read from solana on first use and then refreshed in background when it becomes older than
+    `refresh_interval`, so callers don't wait for RPC round trip. Reservations expire after `reservation_ttl` (the
+    loan was not submitted in time). Reservations are not shared between processes, solana still rejects transfers
+    that exceed the actual amount.
+    """
+
+    def __init__(
+            self,
+            token_repository: TokenRepository,
+            refresh_interval: float,
+            reservation_ttl: float,
+            clock: t.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.__token_repository = token_repository
+        self.__refresh_interval = refresh_interval
+        self.__reservation_ttl = reservation_ttl
+        self.__clock = clock
+
+        self.__balance: t.Optional[int] = None
+        self.__refreshed_at = 0.0
+        self.__refresh_task: t.Optional["asyncio.Task[None]"] = None
+        self.__spent_total = 0
+        self.__reservations: t.Dict[LoanId, t.Tuple[Amount, float]] = {}
+
+    async def get_available_amount(self) -> t.Optional[Amount]:
+        """Returns source balance minus all active reservations, `None` if source balance is unknown."""
+
+        if self.__balance is None:
+            await asyncio.shield(self.__start_refresh())
+
+        elif self.__refreshed_at + self.__refresh_interval <= self.__clock():
+            self.__start_refresh()
+
+        if self.__balance is None:
+            return None
+
+        return Amount(self.__balance - self.__get_reserved_amount())
+
+    def reserve(self, loan_id: LoanId, amount: Amount, ttl: t.Optional[float] = None) -> None:
+        """Reserves the amount for `ttl` (`reservation_ttl` by default), reserving it again renews the expiration."""
+
+        expires_at = self.__clock() + (ttl if ttl is not None else self.__reservation_ttl)
+        self.__reservations[loan_id] = (amount, expires_at)
+
+    def release(self, loan_id: LoanId) -> None:
+        """Returns reserved amount back, e.g. when loan transfer failed."""
+
+        self.__reservations.pop(loan_id, None)
+
+    def consume(self, loan_id: LoanId, amount: Amount) -> None:
+        """Removes the transferred amount from the balance (until the next refresh) and drops the reservation."""
+
+        self.__reservations.pop(loan_id, None)
+        self.__spent_total += amount
+
+        if self.__balance is not None:
+            self.__balance -= amount
+            _SOURCE_BALANCE.set(self.__balance)
+
+    def __start_refresh(self) -> "asyncio.Task[None]":
+        if self.__refresh_task is None:
+            self.__refresh_task = asyncio.create_task(self.__refresh())
+            self.__refresh_task.add_done_callback(self.__reset_refresh_task)
+
+        return self.__refresh_task
+
+    def __reset_refresh_task(self, _: "asyncio.Task[None]") -> None:
+        self.__refresh_task = None
+
+    async def __refresh(self) -> None:
+        spent_before = self.__spent_total
+        started_at = self.__clock()
+
+        try:
+            amount = await self.__token_repository.get_account_amount(self.__token_repository.owner_pubkey)
+
+        except Exception as err:
+            _LOGGER.warning("failed to refresh source balance", exc_info=err)
+            return
+
+        if amount is None:
+            _LOGGER.warning("source balance is unknown")
+            return
+
+        # transfers that were finished during the request may be not included in the received amount
+        self.__balance = amount - (self.__spent_total - spent_before)
+        self.__refreshed_at = started_at
+        self.__remove_expired_reservations()
+        _SOURCE_BALANCE.set(self.__balance)
+
+        _LOGGER.debug("source balance refreshed", extra={"balance": self.__balance})
+
+    def __get_reserved_amount(self) -> int:
+        now = self.__clock()
+
+        return sum(amount for amount, expires_at in self.__reservations.values() if expires_at > now)
+
+    def __remove_expired_reservations(self) -> None:
+        now = self.__clock()
+
+        for loan_id, (_, expires_at) in list(self.__reservations.items()):
+            if expires_at <= now:
+                del self.__reservations[loan_id]
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+import typing as t
+from dataclasses import dataclass
+
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.commitment import Confirmed, Finalized
+from solders.hash import Hash
+
+from spl_token_lending.repository.confirmation import DEFAULT_SLOT_TIME
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RecentBlockhashUnavailableError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class RecentBlockhash:
+    blockhash: Hash
+    last_valid_block_height: int
+    """Transaction with that blockhash can't be processed after that block height."""
+
+
+class RecentBlockhashProvider:
+    """Keeps a recent blockhash, so transactions can be built and signed locally without an RPC round trip for each
+    of them.
+
+    The blockhash is requested on first use and then refreshed in background when it becomes older than
+    `refresh_interval`. Blockhash is valid for 150 blocks (about a minute): the blockhash that is valid for less than
+    `min_remaining_blocks` is not handed out, caller waits for the new one instead. Current block height is requested
+    with the blockhash and estimated with `slot_time` between refreshes.
+    """
+
+    def __init__(
+            self,
+            client: AsyncClient,
+            refresh_interval: float,
+            min_remaining_blocks: int,
+            slot_time: float = DEFAULT_SLOT_TIME,
+            clock: t.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.__client = client
+        self.__refresh_interval = refresh_interval
+        self.__min_remaining_blocks = min_remaining_blocks
+        self.__slot_time = slot_time
+        self.__clock = clock
+
+        self.__current: t.Optional[RecentBlockhash] = None
+        self.__block_height = 0
+        self.__refreshed_at = 0.0
+        self.__refresh_task: t.Optional["asyncio.Task[None]"] = None
+
+    async def get(self) -> RecentBlockhash:
+        if not self.__is_usable():
+            await asyncio.shield(self.__start_refresh())
+
+        elif self.__clock() - self.__refreshed_at >= self.__refresh_interval:
+            self.__start_refresh()
+
+        if self.__current is None or not self.__is_usable():
+            raise RecentBlockhashUnavailableError("recent blockhash is unknown")
+
+        return self.__current
+
+    def __is_usable(self) -> bool:
+        if self.__current is None:
+            return False
+
+        block_height = self.__block_height + (self.__clock() - self.__refreshed_at) / self.__slot_time
+
+        return self.__current.last_valid_block_height - block_height >= self.__min_remaining_blocks
+
+    def invalidate(self, blockhash: Hash) -> None:
+        """Drops the blockhash, e.g. when solana responded that it was not found, so the next call waits for a new
+        one."""
+
+        if self.__current is not None and self.__current.blockhash == blockhash:
+            self.__current = None
+
+    def __start_refresh(self) -> "asyncio.Task[None]":
+        if self.__refresh_task is None:
+            self.__refresh_task = asyncio.create_task(self.__refresh())
+            self.__refresh_task.add_done_callback(self.__reset_refresh_task)
+
+        return self.__refresh_task
+
+    def __reset_refresh_task(self, _: "asyncio.Task[None]") -> None:
+        self.__refresh_task = None
+
+    async def __refresh(self) -> None:
+        started_at = self.__clock()
+
+        try:
+            resp, height_resp = await asyncio.gather(
+                # the same commitment as transaction preflight check uses by default
+                self.__client.get_latest_blockhash(Finalized),
+                # transactions are processed at the tip, so remaining blocks are counted from there
+                self.__client.get_block_height(Confirmed),
+            )
+
+        except Exception as err:
+            _LOGGER.warning("failed to refresh recent blockhash", exc_info=err)
+            return
+
+        self.__current = RecentBlockhash(resp.value.blockhash, resp.value.last_valid_block_height)
+        self.__block_height = height_resp.value
+        self.__refreshed_at = started_at
+
+        _LOGGER.debug("recent blockhash refreshed", extra={
+            "blockhash": self.__current.blockhash,
+            "last_valid_block_height": self.__current.last_valid_block_height,
+            "block_height": self.__block_height,
+        })
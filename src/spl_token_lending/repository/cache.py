@@ -0,0 +1,53 @@
+import time
+import typing as t
+from collections import OrderedDict
+
+K = t.TypeVar("K")
+V = t.TypeVar("V")
+
+
+class ExpiringLRUCache(t.Generic[K, V]):
+    """Bounded in-process cache. Entries expire after `ttl` seconds, the least recently used entry is evicted when
+    the cache is full."""
+
+    def __init__(self, max_size: int, ttl: float, clock: t.Callable[[], float] = time.monotonic) -> None:
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__clock = clock
+        self.__entries: "OrderedDict[K, t.Tuple[V, float]]" = OrderedDict()
+
+    @property
+    def max_size(self) -> int:
+        return self.__max_size
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: K) -> t.Optional[V]:
+        entry = self.__entries.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at = entry
+        if expires_at <= self.__clock():
+            del self.__entries[key]
+            return None
+
+        self.__entries.move_to_end(key)
+
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        self.__entries[key] = (value, self.__clock() + self.__ttl)
+        self.__entries.move_to_end(key)
+
+        while len(self.__entries) > self.__max_size:
+            self.__entries.popitem(last=False)
+
+    def pop(self, key: K) -> t.Optional[V]:
+        entry = self.__entries.pop(key, None)
+
+        return entry[0] if entry is not None else None
@@ -0,0 +1,465 @@
+"""Module provides waiters for solana transaction confirmation."""
+
+import abc
+import asyncio
+import logging
+import time
+import typing as t
+from dataclasses import dataclass, field
+
+from prometheus_client import Histogram
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.commitment import Commitment, Confirmed, Finalized, Processed
+from solana.rpc.websocket_api import SolanaWsClientProtocol, SubscriptionError, connect
+from solders.commitment_config import CommitmentLevel
+from solders.errors import SerdeJSONError
+from solders.rpc.config import RpcSignatureSubscribeConfig
+from solders.rpc.requests import SignatureSubscribe, SignatureUnsubscribe
+from solders.rpc.responses import SignatureNotification, SubscriptionResult
+from solders.signature import Signature
+from solders.transaction_status import TransactionConfirmationStatus, TransactionStatus
+
+from spl_token_lending.repository.iterable import DEFAULT_EXP_ALPHA, DEFAULT_EXP_INITIAL
+
+_LOGGER = logging.getLogger(__name__)
+
+_WAIT_SECONDS = Histogram("solana_confirmation_wait_seconds", "Transaction confirmation wait time by waiter and result",
+                          ("waiter", "result"), buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0, 90.0))
+
+# NOTE: `TransactionConfirmationStatus` is not hashable, so it can't be used as a dict key.
+_STATUS_ORDER: t.Final[t.Sequence[TransactionConfirmationStatus]] = (
+    TransactionConfirmationStatus.Processed,
+    TransactionConfirmationStatus.Confirmed,
+    TransactionConfirmationStatus.Finalized,
+)
+_COMMITMENT_ORDER: t.Final[t.Sequence[CommitmentLevel]] = (
+    CommitmentLevel.Processed,
+    CommitmentLevel.Confirmed,
+    CommitmentLevel.Finalized,
+)
+
+_COMMITMENTS: t.Final[t.Sequence[Commitment]] = (Processed, Confirmed, Finalized)
+
+DEFAULT_RECONNECT_MAX_DELAY: t.Final[float] = 30.0
+DEFAULT_CONNECT_WAIT: t.Final[float] = 2.0
+DEFAULT_SLOT_TIME: t.Final[float] = 0.4
+
+
+def is_status_reached(status: TransactionStatus, expected: TransactionConfirmationStatus) -> bool:
+    """Checks that transaction status is not lower than expected, e.g. finalized transaction is confirmed too."""
+
+    actual = status.confirmation_status
+    return actual is not None and _STATUS_ORDER.index(actual) >= _STATUS_ORDER.index(expected)
+
+
+def get_commitment_level(status: TransactionConfirmationStatus) -> CommitmentLevel:
+    return _COMMITMENT_ORDER[_STATUS_ORDER.index(status)]
+
+
+def get_confirmation_status(commitment: Commitment) -> TransactionConfirmationStatus:
+    return _STATUS_ORDER[_COMMITMENTS.index(commitment)]
+
+
+class SignatureWaiter(metaclass=abc.ABCMeta):
+    """Waits for transaction with specified signature to reach expected confirmation status."""
+
+    @abc.abstractmethod
+    async def wait(
+            self,
+            signature: Signature,
+            expected: TransactionConfirmationStatus = TransactionConfirmationStatus.Finalized,
+    ) -> t.Optional[bool]:
+        """Returns `True` when transaction reached expected status, `False` when transaction failed, `None` when status
+        was not received in time (transaction state is unknown)."""
+        raise NotImplementedError
+
+
+@dataclass(frozen=True)
+class _StatusRequest:
+    expected: t.Optional[TransactionConfirmationStatus]
+    """Request is resolved on the first received status when expected status is not set."""
+    deadline: float
+    result: "asyncio.Future[t.Optional[TransactionStatus]]" = field(repr=False)
+
+
+class BatchedSignatureStatusPoller(SignatureWaiter):
+    """One background loop owns all in-flight signatures and requests their statuses in batches (up to
+    `MAX_SIGNATURES_PER_REQUEST` signatures per RPC call), so the amount of RPC calls grows with the amount of batches,
+    not with the amount of waiting transactions.
+
+    The loop works while there are signatures to wait for, statuses are requested once per `interval` (slot time by
+    default). After `close` no status is received: pending and new requests are resolved with `None` at once.
+    """
+
+    MAX_SIGNATURES_PER_REQUEST: t.Final[int] = 256
+
+    def __init__(
+            self,
+            client: AsyncClient,
+            timeout: float,
+            interval: float = DEFAULT_SLOT_TIME,
+            clock: t.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.__client = client
+        self.__timeout = timeout
+        self.__interval = interval
+        self.__clock = clock
+
+        self.__requests: t.Dict[Signature, t.List[_StatusRequest]] = {}
+        self.__run_task: t.Optional["asyncio.Task[None]"] = None
+        self.__closed = False
+
+    async def wait(
+            self,
+            signature: Signature,
+            expected: TransactionConfirmationStatus = TransactionConfirmationStatus.Finalized,
+            timeout: t.Optional[float] = None,
+    ) -> t.Optional[bool]:
+        """Waits up to `timeout` seconds, poller timeout is used by default."""
+
+        started_at = self.__clock()
+
+        status = await self.__request(signature, expected, timeout)
+        if status is None:
+            _WAIT_SECONDS.labels("poller", "timeout").observe(self.__clock() - started_at)
+            _LOGGER.warning("signature status was not received in time", extra={"signature": signature})
+            return None
+
+        _WAIT_SECONDS.labels("poller", "succeeded" if status.err is None else "failed").observe(
+            self.__clock() - started_at,
+        )
+
+        return status.err is None
+
+    async def get_status(self, signature: Signature) -> t.Optional[TransactionStatus]:
+        """Returns current signature status with the next batch."""
+
+        return await self.__request(signature, None, None)
+
+    async def close(self) -> None:
+        self.__closed = True
+
+        if self.__run_task is not None:
+            self.__run_task.cancel()
+            try:
+                await self.__run_task
+
+            except asyncio.CancelledError:
+                pass
+
+        for requests in self.__requests.values():
+            for request in requests:
+                if not request.result.done():
+                    request.result.set_result(None)
+
+    async def __request(
+            self,
+            signature: Signature,
+            expected: t.Optional[TransactionConfirmationStatus],
+            timeout: t.Optional[float],
+    ) -> t.Optional[TransactionStatus]:
+        if self.__closed:
+            return None
+
+        deadline = self.__clock() + (timeout if timeout is not None else self.__timeout)
+        request = _StatusRequest(expected, deadline, asyncio.get_running_loop().create_future())
+        self.__requests.setdefault(signature, []).append(request)
+
+        if self.__run_task is None:
+            self.__run_task = asyncio.create_task(self.__run())
+            self.__run_task.add_done_callback(self.__reset_run_task)
+
+        try:
+            return await request.result
+
+        finally:
+            requests = self.__requests.get(signature)
+            if requests is not None and request in requests:
+                requests.remove(request)
+                if not requests:
+                    del self.__requests[signature]
+
+    def __reset_run_task(self, _: "asyncio.Task[None]") -> None:
+        self.__run_task = None
+
+        # new requests may be added after the loop has checked there is nothing to wait
+        if self.__requests and not self.__closed:
+            self.__run_task = asyncio.create_task(self.__run())
+            self.__run_task.add_done_callback(self.__reset_run_task)
+
+    async def __run(self) -> None:
+        while self.__requests:
+            await asyncio.sleep(self.__interval)
+
+            signatures = list(self.__requests)
+            await asyncio.gather(*(
+                self.__poll(signatures[i:i + self.MAX_SIGNATURES_PER_REQUEST])
+                for i in range(0, len(signatures), self.MAX_SIGNATURES_PER_REQUEST)
+            ))
+
+    async def __poll(self, signatures: t.List[Signature]) -> None:
+        try:
+            resp = await self.__client.get_signature_statuses(signatures)
+
+        except Exception as err:
+            _LOGGER.warning("failed to get signature statuses", extra={"signatures": len(signatures)}, exc_info=err)
+            statuses: t.Sequence[t.Optional[TransactionStatus]] = [None] * len(signatures)
+
+        else:
+            statuses = resp.value
+
+        now = self.__clock()
+        for signature, status in zip(signatures, statuses):
+            _LOGGER.debug("signature status", extra={"signature": signature, "status": status})
+
+            for request in self.__requests.get(signature, ()):
+                if request.result.done():
+                    continue
+
+                if (
+                        request.expected is None
+                        or (status is not None and (status.err is not None
+                                                    or is_status_reached(status, request.expected)))
+                ):
+                    request.result.set_result(status)
+
+                elif request.deadline <= now:
+                    request.result.set_result(None)
+
+
+class _ConnectionLostError(ConnectionError):
+    pass
+
+
+@dataclass()
+class _Subscription:
+    signature: Signature
+    expected: TransactionConfirmationStatus
+    result: "asyncio.Future[bool]" = field(repr=False)
+    subscription_id: t.Optional[int] = None
+
+
+class WebsocketSignatureWaiter(SignatureWaiter):
+    """Keeps one shared connection to solana pubsub websocket and multiplexes `signatureSubscribe` for all waiting
+    signatures.
+
+    Connection is opened on first wait and reopened automatically when it drops, waiting for the connection takes up to
+    `connect_wait` seconds. When there is no connection in time (and for subscriptions that were in flight when it
+    dropped), waiting falls back to the shared status poller for the rest of the timeout.
+    """
+
+    def __init__(
+            self,
+            endpoint: str,
+            poller: BatchedSignatureStatusPoller,
+            timeout: float,
+            connect_wait: float = DEFAULT_CONNECT_WAIT,
+    ) -> None:
+        self.__endpoint = endpoint
+        self.__poller = poller
+        self.__timeout = timeout
+        self.__connect_wait = connect_wait
+
+        self.__ws: t.Optional[SolanaWsClientProtocol] = None
+        self.__connected = asyncio.Event()
+        self.__run_task: t.Optional["asyncio.Task[None]"] = None
+        # request id -> subscription, waiting for subscription id from the server
+        self.__requested: t.Dict[int, _Subscription] = {}
+        # subscription id -> subscription, waiting for signature notification
+        self.__subscribed: t.Dict[int, _Subscription] = {}
+
+    async def wait(
+            self,
+            signature: Signature,
+            expected: TransactionConfirmationStatus = TransactionConfirmationStatus.Finalized,
+    ) -> t.Optional[bool]:
+        self.__ensure_running()
+        started_at = time.monotonic()
+
+        try:
+            ok = await asyncio.wait_for(self.__wait_notification(signature, expected), self.__timeout)
+
+        except _ConnectionLostError:
+            # the wait is observed by the poller
+            _LOGGER.info("websocket is not available, falling back", extra={"signature": signature})
+            remaining = max(started_at + self.__timeout - time.monotonic(), 0.0)
+            return await self.__poller.wait(signature, expected, remaining)
+
+        except asyncio.TimeoutError:
+            _WAIT_SECONDS.labels("websocket", "timeout").observe(time.monotonic() - started_at)
+            _LOGGER.warning("signature notification was not received in time", extra={"signature": signature})
+            return None
+
+        _WAIT_SECONDS.labels("websocket", "succeeded" if ok else "failed").observe(time.monotonic() - started_at)
+
+        return ok
+
+    async def close(self) -> None:
+        if self.__run_task is None:
+            return
+
+        self.__run_task.cancel()
+        try:
+            await self.__run_task
+
+        except asyncio.CancelledError:
+            pass
+
+        finally:
+            self.__run_task = None
+
+    def __ensure_running(self) -> None:
+        if self.__run_task is None:
+            self.__run_task = asyncio.create_task(self.__run())
+
+    async def __wait_notification(self, signature: Signature, expected: TransactionConfirmationStatus) -> bool:
+        if self.__ws is None:
+            # e.g. on the first wait or while reconnecting
+            try:
+                await asyncio.wait_for(self.__connected.wait(), self.__connect_wait)
+
+            except asyncio.TimeoutError:
+                raise _ConnectionLostError() from None
+
+        ws = self.__ws
+        if ws is None:
+            raise _ConnectionLostError()
+
+        subscription = _Subscription(signature, expected, asyncio.get_running_loop().create_future())
+        request_id = ws.increment_counter_and_get_id()
+        self.__requested[request_id] = subscription
+
+        try:
+            try:
+                await ws.send_data(SignatureSubscribe(
+                    signature,
+                    RpcSignatureSubscribeConfig(commitment=get_commitment_level(expected)),
+                    request_id,
+                ))
+
+            except Exception as err:
+                raise _ConnectionLostError() from err
+
+            # transaction might reach the status before the subscription was made, notification won't be sent then
+            await self.__check_status(subscription)
+
+            return await subscription.result
+
+        finally:
+            self.__requested.pop(request_id, None)
+            self.__unsubscribe(subscription)
+
+    async def __check_status(self, subscription: _Subscription) -> None:
+        status = await self.__poller.get_status(subscription.signature)
+        if status is not None:
+            if status.err is not None:
+                self.__resolve(subscription, False)
+
+            elif is_status_reached(status, subscription.expected):
+                self.__resolve(subscription, True)
+
+    async def __run(self) -> None:
+        delay = DEFAULT_EXP_INITIAL
+
+        while True:
+            try:
+                async with connect(self.__endpoint) as conn:
+                    ws = t.cast(SolanaWsClientProtocol, conn)
+                    _LOGGER.info("websocket connected", extra={"endpoint": self.__endpoint})
+                    self.__ws = ws
+                    self.__connected.set()
+                    delay = DEFAULT_EXP_INITIAL
+
+                    await self.__receive_messages(ws)
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception as err:
+                _LOGGER.warning("websocket connection failed", extra={"endpoint": self.__endpoint}, exc_info=err)
+
+            finally:
+                self.__ws = None
+                self.__connected.clear()
+                self.__drop_subscriptions()
+
+            await asyncio.sleep(delay)
+            delay = min(delay * DEFAULT_EXP_ALPHA, DEFAULT_RECONNECT_MAX_DELAY)
+
+    async def __receive_messages(self, ws: SolanaWsClientProtocol) -> None:
+        while True:
+            try:
+                messages = await ws.recv()
+
+            except SubscriptionError as err:
+                subscription = self.__requested.pop(err.subscription.id, None)
+                if subscription is not None and not subscription.result.done():
+                    subscription.result.set_exception(_ConnectionLostError(err.msg))
+                continue
+
+            except SerdeJSONError:
+                # e.g. responses for unsubscribe requests
+                continue
+
+            for message in messages:
+                self.__handle_message(ws, message)
+
+    def __handle_message(self, ws: SolanaWsClientProtocol, message: object) -> None:
+        if isinstance(message, SubscriptionResult):
+            ws.sent_subscriptions.pop(message.id, None)
+
+            subscription = self.__requested.pop(message.id, None)
+            if subscription is None:
+                return
+
+            subscription.subscription_id = message.result
+            if subscription.result.done():
+                self.__unsubscribe(subscription)
+            else:
+                self.__subscribed[message.result] = subscription
+
+        elif isinstance(message, SignatureNotification):
+            ws.subscriptions.pop(message.subscription, None)
+
+            subscription = self.__subscribed.pop(message.subscription, None)
+            if subscription is not None:
+                # server removes the subscription itself after the notification
+                subscription.subscription_id = None
+                self.__resolve(subscription, message.result.value.err is None)
+
+    def __resolve(self, subscription: _Subscription, ok: bool) -> None:
+        if not subscription.result.done():
+            subscription.result.set_result(ok)
+
+    def __unsubscribe(self, subscription: _Subscription) -> None:
+        ws = self.__ws
+        subscription_id, subscription.subscription_id = subscription.subscription_id, None
+        if subscription_id is None:
+            return
+
+        self.__subscribed.pop(subscription_id, None)
+        if ws is not None:
+            ws.subscriptions.pop(subscription_id, None)
+            asyncio.create_task(self.__send_unsubscribe(ws, subscription_id))
+
+    async def __send_unsubscribe(self, ws: SolanaWsClientProtocol, subscription_id: int) -> None:
+        request_id = ws.increment_counter_and_get_id()
+
+        try:
+            await ws.send_data(SignatureUnsubscribe(subscription_id, request_id))
+
+        except Exception as err:
+            _LOGGER.debug("failed to unsubscribe", extra={"subscription_id": subscription_id}, exc_info=err)
+
+        finally:
+            ws.sent_subscriptions.pop(request_id, None)
+
+    def __drop_subscriptions(self) -> None:
+        subscriptions = [*self.__requested.values(), *self.__subscribed.values()]
+        self.__requested.clear()
+        self.__subscribed.clear()
+
+        for subscription in subscriptions:
+            subscription.subscription_id = None
+            if not subscription.result.done():
+                subscription.result.set_exception(_ConnectionLostError())
@@ -4,8 +4,10 @@ import uuid
 from dataclasses import dataclass
 
 from solders.pubkey import Pubkey
+from solders.signature import Signature
 
 LoanId = t.NewType("LoanId", uuid.UUID)
+TransferJobId = t.NewType("TransferJobId", uuid.UUID)
 Amount = t.NewType("Amount", int)
 
 
@@ -13,6 +15,16 @@ Amount = t.NewType("Amount", int)
 class PaginationOptions:
     offset: int = 0
     limit: int = 1_000
+    after: t.Optional[str] = None
+    """Opaque cursor, only items after it are returned, see
+    :meth:`spl_token_lending.repository.loan.LoanRepository.encode_cursor`"""
+
+
+class TotalCountMode(enum.Enum):
+    EXACT = enum.auto()
+    ESTIMATE = enum.auto()
+    """Uses planner statistics for unfiltered listing (it's exact count for filtered listing)."""
+    NONE = enum.auto()
 
 
 @dataclass(frozen=True)
@@ -21,11 +33,42 @@ class LoanItem:
         PENDING = enum.auto()
         ACTIVE = enum.auto()
         CLOSED = enum.auto()
+        TRANSFERRING = enum.auto()
+        FAILED = enum.auto()
+        CONFIRMED = enum.auto()
+        """Transfer transaction was confirmed, but not finalized yet. The loan becomes ACTIVE when it's finalized or
+        FAILED when it was dropped."""
 
     id_: LoanId
     status: Status
     wallet: Pubkey
     amount: Amount
+    signature: t.Optional[Signature] = None
+    """Signature of the transfer transaction."""
+    last_valid_block_height: t.Optional[int] = None
+    """The transfer transaction can't be processed after that block height, see
+    :class:`spl_token_lending.repository.transfer.SentTransaction`."""
+
+
+class LoanRecord(t.NamedTuple):
+    """Loan as it's stored in DB: wallet and signature are not parsed, e.g. to serialize loan listings without
+    conversions, see :meth:`spl_token_lending.repository.loan.LoanRepository.find_records_with_total`"""
+
+    id_: LoanId
+    status: LoanItem.Status
+    wallet: str
+    amount: Amount
+    signature: t.Optional[str]
+    last_valid_block_height: t.Optional[int]
+
+
+@dataclass(frozen=True)
+class WalletDebtItem:
+    """Outstanding debt of the wallet: total amount and count of its ACTIVE loans."""
+
+    wallet: Pubkey
+    amount: Amount
+    loans: int
 
 
 @dataclass(frozen=True)
@@ -33,3 +76,22 @@ class LoanFilterOptions:
     id_equals: t.Optional[LoanId] = None
     status_equals: t.Optional[LoanItem.Status] = None
     wallet_equals: t.Optional[Pubkey] = None
+    has_signature: t.Optional[bool] = None
+
+
+@dataclass(frozen=True)
+class TransferJobItem:
+    class Status(enum.Enum):
+        QUEUED = enum.auto()
+        RUNNING = enum.auto()
+        SUCCEEDED = enum.auto()
+        FAILED = enum.auto()
+
+    id_: TransferJobId
+    loan_id: LoanId
+    status: Status
+    attempts: int
+    signature: t.Optional[Signature]
+    last_valid_block_height: t.Optional[int] = None
+    """Last valid block height of the sent transfer transaction blockhash, see
+    :class:`spl_token_lending.repository.transfer.SentTransaction`."""
@@ -0,0 +1,56 @@
+import typing as t
+
+import sqlalchemy as sa
+from gino import Gino
+from solders.pubkey import Pubkey
+
+from spl_token_lending.db.models import LoanModel, WalletDebtModel
+from spl_token_lending.repository.data import Amount, LoanItem, WalletDebtItem
+
+
+class WalletDebtRepository:
+    """Reads per-wallet debt aggregate, that is maintained by :class:`spl_token_lending.repository.loan.LoanRepository`,
+    so wallet debt is received by primary key instead of summing all wallet loans."""
+
+    __SELECT_ITEMS = sa.select(WalletDebtModel).select_from(WalletDebtModel)  # type:ignore[arg-type]
+    __SELECT_TOP_ITEMS = __SELECT_ITEMS.where(WalletDebtModel.amount > 0).order_by(WalletDebtModel.amount.desc())
+    __DELETE_ITEMS = sa.delete(WalletDebtModel)  # type:ignore[arg-type]
+    __INSERT_FROM_LOANS = sa.insert(WalletDebtModel).from_select(  # type:ignore[arg-type]
+        [WalletDebtModel.wallet, WalletDebtModel.amount, WalletDebtModel.loans],
+        sa.select([LoanModel.wallet, sa.func.sum(LoanModel.amount), sa.func.count()])
+        .where(LoanModel.status == LoanItem.Status.ACTIVE)
+        .group_by(LoanModel.wallet),
+    )
+
+    def __init__(self, gino: Gino) -> None:
+        self.__gino = gino
+
+    async def get(self, wallet: Pubkey) -> WalletDebtItem:
+        row = await self.__gino.one_or_none(self.__SELECT_ITEMS.where(WalletDebtModel.wallet == str(wallet)))
+
+        return self.__row2item(row) if row is not None else WalletDebtItem(wallet, Amount(0), 0)
+
+    async def find_top(self, limit: int) -> t.Sequence[WalletDebtItem]:
+        rows = await self.__gino.all(self.__SELECT_TOP_ITEMS.limit(limit))
+
+        return [self.__row2item(r) for r in rows]
+
+    async def rebuild(self) -> int:
+        """Recomputes the whole aggregate from loans, returns the amount of wallets with debt."""
+
+        async with self.__gino.transaction():
+            # loan changes are blocked until the aggregate is rebuilt, so no change is lost
+            await self.__gino.status(sa.text(f"lock table {LoanModel.__tablename__} in share mode"))
+            await self.__gino.status(self.__DELETE_ITEMS)
+            await self.__gino.status(self.__INSERT_FROM_LOANS)
+
+            return await self.__gino.scalar(  # type: ignore[no-any-return]
+                sa.select([sa.func.count()]).select_from(WalletDebtModel)  # type:ignore[arg-type]
+            )
+
+    def __row2item(self, row: WalletDebtModel) -> WalletDebtItem:
+        return WalletDebtItem(
+            wallet=Pubkey.from_string(row.wallet),
+            amount=Amount(row.amount),
+            loans=row.loans,
+        )
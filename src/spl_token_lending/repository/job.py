@@ -0,0 +1,120 @@
+import typing as t
+import uuid
+from datetime import timedelta
+
+import sqlalchemy as sa
+from gino import Gino
+from solders.signature import Signature
+
+from spl_token_lending.db.models import TransferJobModel
+from spl_token_lending.repository.data import LoanId, TransferJobId, TransferJobItem
+
+
+class TransferJobRepository:
+    """Provides a durable queue of loan transfer jobs in database via gino.
+
+    Jobs are claimed with `FOR UPDATE SKIP LOCKED`, so any amount of worker processes can claim jobs concurrently
+    without receiving the same job. Claimed job becomes invisible to other workers until visibility timeout expires,
+    then it's claimed again (e.g. when worker process died).
+    """
+
+    __SELECT_ITEMS = sa.select(TransferJobModel).select_from(TransferJobModel)  # type:ignore[arg-type]
+    __INSERT_ITEMS = sa.insert(TransferJobModel).returning(*TransferJobModel)  # type:ignore[arg-type]
+    __UPDATE = sa.update(TransferJobModel)  # type:ignore[arg-type]
+    __UPDATE_ITEMS = __UPDATE.returning(*TransferJobModel)
+    __CLAIMABLE_STATUSES = (TransferJobItem.Status.QUEUED, TransferJobItem.Status.RUNNING)
+
+    def __init__(self, gino: Gino) -> None:
+        self.__gino = gino
+
+    async def get_by_loan_id(self, loan_id: LoanId) -> t.Optional[TransferJobItem]:
+        row = await self.__gino.one_or_none(self.__SELECT_ITEMS.where(TransferJobModel.loan_id == loan_id))
+
+        return self.__row2item(row) if row is not None else None
+
+    async def create(self, loan_id: LoanId) -> TransferJobItem:
+        inserted_row = await self.__gino.one(self.__INSERT_ITEMS.values([{
+            TransferJobModel.loan_id: loan_id,
+            TransferJobModel.status: TransferJobItem.Status.QUEUED,
+        }]))
+
+        return self.__row2item(inserted_row)
+
+    async def claim(self, limit: int, visibility_timeout: float) -> t.Sequence[TransferJobItem]:
+        """Claims up to `limit` available jobs: queued jobs which delay has passed and running jobs which visibility
+        timeout has expired. Each claim increments job attempts."""
+
+        available_ids = (
+            sa.select([TransferJobModel.id])
+            .where(sa.and_(
+                TransferJobModel.status.in_(self.__CLAIMABLE_STATUSES),
+                TransferJobModel.available_at <= sa.func.now(),
+            ))
+            .order_by(TransferJobModel.available_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        rows = await self.__gino.all(
+            self.__UPDATE_ITEMS
+            .values({
+                TransferJobModel.status: TransferJobItem.Status.RUNNING,
+                TransferJobModel.attempts: TransferJobModel.attempts + 1,
+                TransferJobModel.available_at: sa.func.now() + timedelta(seconds=visibility_timeout),
+            })
+            .where(TransferJobModel.id.in_(available_ids))
+        )
+
+        return [self.__row2item(r) for r in rows]
+
+    async def set_signature(self, job_id: TransferJobId, signature: Signature, last_valid_block_height: int) -> None:
+        """Stores signature of the sent transfer transaction and last valid block height of its blockhash, so the next
+        attempt can check it before sending a new one."""
+
+        await self.__gino.status(
+            self.__UPDATE
+            .values({
+                TransferJobModel.signature: str(signature),
+                TransferJobModel.last_valid_block_height: last_valid_block_height,
+            })
+            .where(TransferJobModel.id == job_id)
+        )
+
+    async def retry(self, job_id: TransferJobId, delay: float, error: t.Optional[str] = None) -> TransferJobItem:
+        return await self.__update(job_id, TransferJobItem.Status.QUEUED, delay, error)
+
+    async def finish(
+            self,
+            job_id: TransferJobId,
+            status: TransferJobItem.Status,
+            error: t.Optional[str] = None,
+    ) -> TransferJobItem:
+        return await self.__update(job_id, status, 0.0, error)
+
+    async def __update(
+            self,
+            job_id: TransferJobId,
+            status: TransferJobItem.Status,
+            delay: float,
+            error: t.Optional[str],
+    ) -> TransferJobItem:
+        updated_row = await self.__gino.one(
+            self.__UPDATE_ITEMS
+            .values({
+                TransferJobModel.status: status,
+                TransferJobModel.available_at: sa.func.now() + timedelta(seconds=delay),
+                TransferJobModel.error: error,
+            })
+            .where(TransferJobModel.id == job_id)
+        )
+
+        return self.__row2item(updated_row)
+
+    def __row2item(self, row: TransferJobModel) -> TransferJobItem:
+        return TransferJobItem(
+            id_=TransferJobId(t.cast(uuid.UUID, row.id)),
+            loan_id=LoanId(t.cast(uuid.UUID, row.loan_id)),
+            status=TransferJobItem.Status(row.status),
+            attempts=row.attempts,
+            signature=Signature.from_string(row.signature) if row.signature is not None else None,
+            last_valid_block_height=row.last_valid_block_height,
+        )
@@ -1,23 +1,49 @@
+import base64
 import typing as t
 import uuid
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import replace
+from datetime import timedelta
 
 import sqlalchemy as sa
 from gino import Gino
 from gino.transaction import GinoTransaction
+from prometheus_client import Histogram
 from solders.pubkey import Pubkey
+from solders.signature import Signature
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.sql import Select
 
-from spl_token_lending.db.models import LoanModel
-from spl_token_lending.repository.data import Amount, LoanFilterOptions, LoanId, LoanItem, PaginationOptions
+from spl_token_lending.db.models import LoanModel, WalletDebtModel
+from spl_token_lending.repository.data import (
+    Amount, LoanFilterOptions, LoanId, LoanItem, LoanRecord, PaginationOptions,
+    TotalCountMode,
+)
+from spl_token_lending.timing import span
+
+_QUERY_SECONDS = Histogram("loan_repository_query_seconds", "Loan repository query latency by method", ("method",))
+
+
+@contextmanager
+def _observe_query(method: str) -> t.Iterator[None]:
+    with _QUERY_SECONDS.labels(method).time(), span(f"db.{method}"):
+        yield
 
 
 class LoanRepository:
-    """Provides operations with loans, stores data in database via gino."""
+    """Provides operations with loans, stores data in database via gino.
 
-    __SELECT_COUNT = sa.select([sa.func.count()]).select_from(LoanModel)  # type:ignore[arg-type]
+    Each loan change updates the per-wallet debt aggregate (see
+    :class:`spl_token_lending.repository.debt.WalletDebtRepository`) in the same transaction.
+    """
+
+    __SELECT_COUNT = sa.select([sa.func.count().label("total")]).select_from(LoanModel)  # type:ignore[arg-type]
+    __SELECT_ESTIMATED_COUNT = sa.select([
+        sa.cast(sa.func.greatest(sa.column("reltuples"), 0), sa.BigInteger()).label("total"),
+    ]).select_from(sa.table("pg_class")).where(sa.column("oid") == sa.text(f"'{LoanModel.__tablename__}'::regclass"))
     __SELECT_ITEMS = sa.select(LoanModel).select_from(LoanModel)  # type:ignore[arg-type]
     __SELECT_ITEMS_ORDERED = __SELECT_ITEMS.order_by(LoanModel.id)
+    __SELECT_WALLETS = sa.select([LoanModel.wallet]).select_from(LoanModel).distinct()  # type:ignore[arg-type]
     __INSERT_ITEMS = sa.insert(LoanModel).returning(*LoanModel)  # type:ignore[arg-type]
     __UPDATE_ITEMS = sa.update(LoanModel).returning(*LoanModel)  # type:ignore[arg-type]
 
@@ -31,14 +57,27 @@ class LoanRepository:
             yield tx
 
     async def get_by_id(self, loan_id: LoanId) -> t.Optional[LoanItem]:
-        row = await self.__gino.one_or_none(self.__SELECT_ITEMS.where(LoanModel.id == loan_id))
+        with _observe_query("get_by_id"):
+            row = await self.__gino.one_or_none(self.__SELECT_ITEMS.where(LoanModel.id == loan_id))
 
         return self.__row2item(row) if row is not None else None
 
+    async def get_by_ids(self, loan_ids: t.Collection[LoanId]) -> t.Mapping[LoanId, LoanItem]:
+        """Returns found loans by their ids, loans that were not found are missing in the result."""
+
+        if not loan_ids:
+            return {}
+
+        with _observe_query("get_by_ids"):
+            rows = await self.__gino.all(self.__SELECT_ITEMS.where(LoanModel.id.in_(list(loan_ids))))
+
+        return {item.id_: item for item in map(self.__row2item, rows)}
+
     async def count(self, filter_: t.Optional[LoanFilterOptions] = None) -> int:
         query = self.__append_filter(self.__SELECT_COUNT, filter_)
 
-        return await self.__gino.scalar(query)  # type: ignore[no-any-return]
+        with _observe_query("count"):
+            return await self.__gino.scalar(query)  # type: ignore[no-any-return]
 
     async def find(
             self,
@@ -46,20 +85,163 @@ class LoanRepository:
             pagination: t.Optional[PaginationOptions] = None,
     ) -> t.Sequence[LoanItem]:
         query = self.__append_pagination(self.__append_filter(self.__SELECT_ITEMS_ORDERED, filter_), pagination)
-        rows = await self.__gino.all(query)
+        with _observe_query("find"):
+            rows = await self.__gino.all(query)
 
         return [self.__row2item(r) for r in rows]
 
-    async def create(self, status: LoanItem.Status, wallet: Pubkey, amount: Amount) -> LoanItem:
+    async def find_with_total(
+            self,
+            filter_: t.Optional[LoanFilterOptions] = None,
+            pagination: t.Optional[PaginationOptions] = None,
+            total_mode: TotalCountMode = TotalCountMode.EXACT,
+    ) -> t.Tuple[t.Sequence[LoanItem], t.Optional[int]]:
+        """Finds the page of loans and counts all loans that match the filter in one query."""
+
+        rows, total = await self.__find_rows_with_total(filter_, pagination, total_mode)
+
+        return [self.__row2item(r) for r in rows], total
+
+    async def find_records_with_total(
+            self,
+            filter_: t.Optional[LoanFilterOptions] = None,
+            pagination: t.Optional[PaginationOptions] = None,
+            total_mode: TotalCountMode = TotalCountMode.EXACT,
+    ) -> t.Tuple[t.Sequence[LoanRecord], t.Optional[int]]:
+        """The same as :meth:`find_with_total`, but loans are returned as stored, without parsing of wallets and
+        signatures."""
+
+        rows, total = await self.__find_rows_with_total(filter_, pagination, total_mode)
+
+        return [self.__row2record(r) for r in rows], total
+
+    async def __find_rows_with_total(
+            self,
+            filter_: t.Optional[LoanFilterOptions],
+            pagination: t.Optional[PaginationOptions],
+            total_mode: TotalCountMode,
+    ) -> t.Tuple[t.Sequence[LoanModel], t.Optional[int]]:
+        page_query = self.__append_pagination(self.__append_filter(self.__SELECT_ITEMS_ORDERED, filter_), pagination)
+        if total_mode is TotalCountMode.NONE:
+            with _observe_query("find"):
+                return await self.__gino.all(page_query), None
+
+        if total_mode is TotalCountMode.ESTIMATE and not self.__has_conditions(filter_):
+            count_query = self.__SELECT_ESTIMATED_COUNT
+        else:
+            count_query = self.__append_filter(self.__SELECT_COUNT, filter_)
+
+        # count is joined with the page, so the single row with total is received even if the page is empty
+        counted = count_query.alias("counted")
+        page = page_query.alias("page")
+        with _observe_query("find_with_total"):
+            rows = await self.__gino.all(
+                sa.select([counted.c.total, *page.c])
+                .select_from(counted.outerjoin(page, sa.true()))
+                .order_by(page.c.id)
+            )
+
+        return [r for r in rows if r.id is not None], rows[0].total if rows else 0
+
+    async def iterate(
+            self,
+            filter_: t.Optional[LoanFilterOptions] = None,
+            batch_size: int = 1_000,
+    ) -> t.AsyncIterator[t.Sequence[LoanRecord]]:
+        """Yields records of all loans that match the filter ordered by id in batches. Rows are fetched from a
+        server-side cursor within a read-only snapshot, so memory usage doesn't depend on the amount of loans. DB
+        connection is held until the iteration is finished."""
+
+        query = self.__append_filter(self.__SELECT_ITEMS_ORDERED, filter_)
+
+        async with self.__gino.transaction(isolation="repeatable_read", readonly=True) as tx:  # type: GinoTransaction
+            cursor = await tx.connection.iterate(query)
+
+            while True:
+                with _observe_query("iterate"):
+                    rows = await cursor.many(batch_size)
+                if not rows:
+                    return
+
+                yield [self.__row2record(r) for r in rows]
+
+    async def find_wallets(
+            self,
+            filter_: t.Optional[LoanFilterOptions] = None,
+            limit: int = 1_000,
+    ) -> t.Sequence[Pubkey]:
+        query = self.__append_filter(self.__SELECT_WALLETS, filter_).limit(limit)
+        with _observe_query("find_wallets"):
+            rows = await self.__gino.all(query)
+
+        return [Pubkey.from_string(r.wallet) for r in rows]
+
+    async def create(
+            self,
+            status: LoanItem.Status,
+            wallet: Pubkey,
+            amount: Amount,
+            id_: t.Optional[LoanId] = None,
+    ) -> LoanItem:
         value_to_insert = {
             LoanModel.status: status,
             LoanModel.wallet: str(wallet),
             LoanModel.amount: amount,
         }
+        if id_ is not None:
+            value_to_insert[LoanModel.id] = id_
+
+        query = self.__INSERT_ITEMS.values([value_to_insert])
+
+        with _observe_query("create"):
+            if status is not LoanItem.Status.ACTIVE:
+                # only ACTIVE loans are counted as debt, so there is nothing to update with the insert
+                return self.__row2item(await self.__gino.one(query))
+
+            async with self.__gino.transaction():
+                inserted_item = self.__row2item(await self.__gino.one(query))
+                await self.__update_debts(None, inserted_item)
+
+        return inserted_item
+
+    async def create_many(
+            self,
+            status: LoanItem.Status,
+            values: t.Sequence[t.Tuple[LoanId, Pubkey, Amount]],
+    ) -> t.Sequence[LoanItem]:
+        """Creates loans with provided ids, wallets and amounts in one multi-row insert, returns them in the same
+        order."""
+
+        if not values:
+            return []
 
-        inserted_row = await self.__gino.one(self.__INSERT_ITEMS.values([value_to_insert]))
+        values_to_insert = [
+            {
+                LoanModel.id: id_,
+                LoanModel.status: status,
+                LoanModel.wallet: str(wallet),
+                LoanModel.amount: amount,
+            }
+            for id_, wallet, amount in values
+        ]
 
-        return self.__row2item(inserted_row)
+        query = self.__INSERT_ITEMS.values(values_to_insert)
+
+        with _observe_query("create_many"):
+            if status is not LoanItem.Status.ACTIVE:
+                # only ACTIVE loans are counted as debt, so there is nothing to update with the insert
+                rows = await self.__gino.all(query)
+                inserted_items = {item.id_: item for item in map(self.__row2item, rows)}
+
+            else:
+                async with self.__gino.transaction():
+                    rows = await self.__gino.all(query)
+                    inserted_items = {item.id_: item for item in map(self.__row2item, rows)}
+                    for item in inserted_items.values():
+                        await self.__update_debts(None, item)
+
+        # order of returned rows is not guaranteed
+        return [inserted_items[id_] for id_, _, _ in values]
 
     async def update_existing_by_id(self, item: LoanItem) -> LoanItem:
         value_to_update = {
@@ -68,9 +250,167 @@ class LoanRepository:
             LoanModel.amount: item.amount,
         }
 
-        updated_row = await self.__gino.one(self.__UPDATE_ITEMS.values(value_to_update).where(LoanModel.id == item.id_))
+        with _observe_query("update_existing_by_id"):
+            async with self.__gino.transaction():
+                previous_row = await self.__gino.one_or_none(
+                    self.__SELECT_ITEMS.where(LoanModel.id == item.id_).with_for_update()
+                )
+                updated_item = self.__row2item(
+                    await self.__gino.one(self.__UPDATE_ITEMS.values(value_to_update).where(LoanModel.id == item.id_))
+                )
+                previous_item = self.__row2item(previous_row) if previous_row is not None else None
+                await self.__update_debts(previous_item, updated_item)
+
+        return updated_item
+
+    async def update_status(
+            self,
+            loan_id: LoanId,
+            expected: LoanItem.Status,
+            status: LoanItem.Status,
+            signature: t.Optional[Signature] = None,
+            unchanged_for: t.Optional[float] = None,
+            last_valid_block_height: t.Optional[int] = None,
+            changed_within: t.Optional[float] = None,
+    ) -> t.Optional[LoanItem]:
+        """Changes loan status only if loan has the expected status, so concurrent callers can't both change it.
+        Returns `None` if loan was not found or has other status.
+
+        With `unchanged_for` (in seconds) the status is changed only if loan had the expected status at least that
+        long, with `changed_within` - only if loan has got the expected status less than that long ago. The transfer
+        `signature` and `last_valid_block_height` of its blockhash are stored along with the status if they are set.
+        """
+
+        values_to_update: t.Dict[t.Any, object] = {
+            LoanModel.status: status,
+            LoanModel.status_updated_at: sa.func.now(),
+        }
+        if signature is not None:
+            values_to_update[LoanModel.signature] = str(signature)
+        if last_valid_block_height is not None:
+            values_to_update[LoanModel.last_valid_block_height] = last_valid_block_height
+
+        conditions = [
+            LoanModel.id == loan_id,
+            LoanModel.status == expected,
+            *self.__make_status_age_conditions(unchanged_for, changed_within),
+        ]
+
+        with _observe_query("update_status"):
+            async with self.__gino.transaction():
+                updated_row = await self.__gino.one_or_none(
+                    self.__UPDATE_ITEMS.values(values_to_update).where(sa.and_(*conditions))
+                )
+                if updated_row is None:
+                    return None
 
-        return self.__row2item(updated_row)
+                updated_item = self.__row2item(updated_row)
+                await self.__update_debts(replace(updated_item, status=expected), updated_item)
+
+        return updated_item
+
+    async def update_status_many(
+            self,
+            loan_ids: t.Collection[LoanId],
+            expected: LoanItem.Status,
+            status: LoanItem.Status,
+            unchanged_for: t.Optional[float] = None,
+            changed_within: t.Optional[float] = None,
+    ) -> t.Sequence[LoanItem]:
+        """Changes status of the loans that have the expected status in one update (see :meth:`update_status`),
+        returns the changed loans."""
+
+        if not loan_ids:
+            return []
+
+        values_to_update = {
+            LoanModel.status: status,
+            LoanModel.status_updated_at: sa.func.now(),
+        }
+
+        with _observe_query("update_status_many"):
+            async with self.__gino.transaction():
+                updated_rows = await self.__gino.all(
+                    self.__UPDATE_ITEMS.values(values_to_update).where(sa.and_(
+                        LoanModel.id.in_(list(loan_ids)),
+                        LoanModel.status == expected,
+                        *self.__make_status_age_conditions(unchanged_for, changed_within),
+                    ))
+                )
+                updated_items = [self.__row2item(r) for r in updated_rows]
+                for updated_item in updated_items:
+                    await self.__update_debts(replace(updated_item, status=expected), updated_item)
+
+        return updated_items
+
+    async def find_with_status_age(
+            self,
+            statuses: t.Collection[LoanItem.Status],
+    ) -> t.Sequence[t.Tuple[LoanItem, float]]:
+        """Returns all loans with provided statuses along with the time (in seconds) they have their status."""
+
+        status_age = sa.extract("epoch", sa.func.now() - LoanModel.status_updated_at).label("status_age")
+        query = (
+            sa.select([*LoanModel, status_age])
+            .select_from(LoanModel)  # type: ignore[arg-type]
+            .where(LoanModel.status.in_(list(statuses)))
+            .order_by(LoanModel.id)
+        )
+
+        with _observe_query("find_with_status_age"):
+            rows = await self.__gino.all(query)
+
+        return [(self.__row2item(r), float(r.status_age)) for r in rows]
+
+    def __make_status_age_conditions(
+            self,
+            unchanged_for: t.Optional[float],
+            changed_within: t.Optional[float],
+    ) -> t.Sequence[t.Any]:
+        conditions = []
+        if unchanged_for is not None:
+            conditions.append(LoanModel.status_updated_at <= sa.func.now() - timedelta(seconds=unchanged_for))
+        if changed_within is not None:
+            conditions.append(LoanModel.status_updated_at > sa.func.now() - timedelta(seconds=changed_within))
+
+        return conditions
+
+    async def __update_debts(self, previous: t.Optional[LoanItem], current: t.Optional[LoanItem]) -> None:
+        # wallet -> (amount, loans) change, only ACTIVE loans are counted as debt
+        changes: t.Dict[Pubkey, t.Tuple[int, int]] = {}
+
+        if previous is not None and previous.status is LoanItem.Status.ACTIVE:
+            amount, loans = changes.get(previous.wallet, (0, 0))
+            changes[previous.wallet] = (amount - previous.amount, loans - 1)
+
+        if current is not None and current.status is LoanItem.Status.ACTIVE:
+            amount, loans = changes.get(current.wallet, (0, 0))
+            changes[current.wallet] = (amount + current.amount, loans + 1)
+
+        for wallet, (amount, loans) in changes.items():
+            if amount == 0 and loans == 0:
+                continue
+
+            insert_stmt = pg_insert(WalletDebtModel).values({
+                WalletDebtModel.wallet: str(wallet),
+                WalletDebtModel.amount: amount,
+                WalletDebtModel.loans: loans,
+            })
+            await self.__gino.status(insert_stmt.on_conflict_do_update(
+                index_elements=[WalletDebtModel.wallet],
+                set_={
+                    "amount": WalletDebtModel.amount + insert_stmt.excluded.amount,
+                    "loans": WalletDebtModel.loans + insert_stmt.excluded.loans,
+                },
+            ))
+
+    def __has_conditions(self, filter_: t.Optional[LoanFilterOptions]) -> bool:
+        return filter_ is not None and (
+                filter_.id_equals is not None
+                or filter_.status_equals is not None
+                or filter_.wallet_equals is not None
+                or filter_.has_signature is not None
+        )
 
     def __append_filter(self, select_stmt: Select, filter_: t.Optional[LoanFilterOptions]) -> Select:
         if filter_ is None:
@@ -82,13 +422,34 @@ class LoanRepository:
             select_stmt = select_stmt.where(LoanModel.status == filter_.status_equals)
         if filter_.wallet_equals is not None:
             select_stmt = select_stmt.where(LoanModel.wallet == str(filter_.wallet_equals))
+        if filter_.has_signature is not None:
+            # comparison with `None` is compiled to `IS [NOT] NULL`
+            select_stmt = select_stmt.where(
+                LoanModel.signature != None if filter_.has_signature else LoanModel.signature == None
+            )
 
         return select_stmt
 
+    def encode_cursor(self, item: t.Union[LoanItem, LoanRecord]) -> str:
+        """Returns an opaque cursor that points to the position right after the item in the ordered listing."""
+
+        return base64.urlsafe_b64encode(item.id_.bytes).rstrip(b"=").decode()
+
+    def __decode_cursor(self, cursor: str) -> LoanId:
+        try:
+            return LoanId(uuid.UUID(bytes=base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))))
+
+        except ValueError as err:
+            raise ValueError("invalid pagination cursor", cursor) from err
+
     def __append_pagination(self, select_stmt: Select, pagination: t.Optional[PaginationOptions]) -> Select:
         if pagination is None:
             return select_stmt
 
+        if pagination.after is not None:
+            # keyset pagination: index range scan instead of skipping `offset` rows
+            select_stmt = select_stmt.where(LoanModel.id > self.__decode_cursor(pagination.after))
+
         return select_stmt.offset(pagination.offset).limit(pagination.limit)
 
     def __row2item(self, row: LoanModel) -> LoanItem:
@@ -97,4 +458,17 @@ class LoanRepository:
             status=LoanItem.Status(row.status),
             wallet=Pubkey.from_string(row.wallet),
             amount=Amount(row.amount),
+            signature=Signature.from_string(row.signature) if row.signature is not None else None,
+            last_valid_block_height=row.last_valid_block_height,
+        )
+
+    def __row2record(self, row: LoanModel) -> LoanRecord:
+        # values are already converted by column types
+        return LoanRecord(
+            id_=t.cast(LoanId, row.id),
+            status=t.cast(LoanItem.Status, row.status),
+            wallet=row.wallet,
+            amount=t.cast(Amount, row.amount),
+            signature=row.signature,
+            last_valid_block_height=row.last_valid_block_height,
         )
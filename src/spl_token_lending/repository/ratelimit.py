@@ -0,0 +1,152 @@
+"""Module provides process-wide rate limiting of solana RPC requests: token buckets keep request rate under the
+provider quota, and when the provider throttles anyway (429), the whole process pauses instead of each request retrying
+on its own."""
+
+import asyncio
+import logging
+import random
+import time
+import typing as t
+
+import httpx
+from prometheus_client import Counter, Histogram
+
+_LOGGER = logging.getLogger(__name__)
+
+_THROTTLED = Counter("solana_rpc_throttled", "Solana RPC requests throttled by the provider (429) by method",
+                     ("method",))
+_WAIT = Histogram("solana_rpc_rate_limit_wait_seconds", "Time solana RPC requests waited for rate limiter",
+                  buckets=(0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+T = t.TypeVar("T")
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average with bursts up to `burst`. Waiters are served in order of
+    arrival: each acquisition takes tokens right away (the balance may go below zero) and waits until they are
+    refilled."""
+
+    def __init__(self, rate: float, burst: float, clock: t.Callable[[], float] = time.monotonic) -> None:
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate and burst must be positive", rate, burst)
+
+        self.__rate = rate
+        self.__burst = burst
+        self.__clock = clock
+
+        self.__tokens = burst
+        self.__updated_at = clock()
+
+    async def acquire(self, cost: float = 1.0) -> None:
+        delay = self.reserve(cost)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def reserve(self, cost: float = 1.0) -> float:
+        """Takes tokens and returns the time (in seconds) the caller has to wait before it may proceed."""
+
+        now = self.__clock()
+        self.__tokens = min(self.__burst, self.__tokens + (now - self.__updated_at) * self.__rate)
+        self.__updated_at = now
+        self.__tokens -= cost
+
+        return max(0.0, -self.__tokens / self.__rate)
+
+
+class RpcRateLimiter:
+    """Shared by all requests of the process. Each request takes a token from the global bucket and from the bucket of
+    its method (if the method has its own limit).
+
+    On 429 response all requests are paused until `Retry-After` (or jittered exponential backoff, when the header is
+    missing) and the throttled request is retried up to `max_retries` times.
+    """
+
+    def __init__(
+            self,
+            rate: t.Optional[float],
+            burst: t.Optional[float] = None,
+            method_rates: t.Optional[t.Mapping[str, float]] = None,
+            max_retries: int = 5,
+            backoff_initial: float = 0.5,
+            backoff_max: float = 30.0,
+            clock: t.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.__global_bucket = TokenBucket(rate, burst or rate, clock) if rate is not None else None
+        self.__method_buckets = {
+            method: TokenBucket(method_rate, method_rate, clock)
+            for method, method_rate in (method_rates or {}).items()
+        }
+        self.__max_retries = max_retries
+        self.__backoff_initial = backoff_initial
+        self.__backoff_max = backoff_max
+        self.__clock = clock
+
+        self.__paused_until = 0.0
+
+    async def run(self, methods: t.Sequence[str], call: t.Callable[[], t.Awaitable[T]]) -> T:
+        """Performs the call when rate limits allow `methods` requests (one method for single request, several for
+        batch request)."""
+
+        for attempt in range(self.__max_retries + 1):
+            await self.__acquire(methods)
+
+            try:
+                return await call()
+
+            except httpx.HTTPStatusError as err:
+                if err.response.status_code != 429 or attempt == self.__max_retries:
+                    raise
+
+                for method in methods:
+                    _THROTTLED.labels(method).inc()
+
+                self.__pause(get_retry_after(err.response) or self.__get_backoff(attempt), methods)
+
+        raise AssertionError("unreachable")
+
+    async def __acquire(self, methods: t.Sequence[str]) -> None:
+        started_at = self.__clock()
+
+        # pause may be prolonged by other requests while this one sleeps
+        while (pause := self.__paused_until - self.__clock()) > 0:
+            await asyncio.sleep(pause)
+
+        delays = [bucket.reserve() for bucket in self.__iter_buckets(methods)]
+        if delays and max(delays) > 0:
+            await asyncio.sleep(max(delays))
+
+        _WAIT.observe(self.__clock() - started_at)
+
+    def __iter_buckets(self, methods: t.Sequence[str]) -> t.Iterable[TokenBucket]:
+        if self.__global_bucket is not None:
+            yield self.__global_bucket
+
+        for method in methods:
+            bucket = self.__method_buckets.get(method)
+            if bucket is not None:
+                yield bucket
+
+    def __pause(self, delay: float, methods: t.Sequence[str]) -> None:
+        paused_until = self.__clock() + delay
+        if paused_until <= self.__paused_until:
+            return
+
+        self.__paused_until = paused_until
+        _LOGGER.warning("rpc requests are throttled by the provider, pausing", extra={
+            "delay": delay,
+            "methods": methods,
+        })
+
+    def __get_backoff(self, attempt: int) -> float:
+        # full jitter, so requests throttled at the same time don't retry at the same time
+        return random.uniform(0.0, min(self.__backoff_max, self.__backoff_initial * 2 ** attempt))
+
+
+def get_retry_after(response: httpx.Response) -> t.Optional[float]:
+    """Returns `Retry-After` header value in seconds (HTTP date format is not supported)."""
+
+    try:
+        return float(response.headers["Retry-After"])
+
+    except (KeyError, ValueError):
+        return None
@@ -0,0 +1,355 @@
+"""Module provides solana RPC client over a pool of endpoints: each request goes to one of the healthy endpoints,
+throttled and failing endpoints are taken out of rotation for a while, slow reads are hedged to another endpoint."""
+
+import asyncio
+import json
+import logging
+import random
+import time
+import typing as t
+from dataclasses import dataclass
+
+import httpx
+from prometheus_client import Counter, Histogram
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.commitment import Commitment
+from solana.rpc.providers.async_http import AsyncHTTPProvider
+from solders.rpc.requests import Body, GetSlot
+from solders.rpc.responses import GetSlotResp
+
+from spl_token_lending.repository.ratelimit import RpcRateLimiter, get_retry_after
+
+_LOGGER = logging.getLogger(__name__)
+
+_REQUESTS = Counter("solana_rpc_requests", "Solana RPC requests by endpoint and outcome",
+                    ("endpoint", "outcome"))
+_LATENCY = Histogram("solana_rpc_request_seconds", "Solana RPC request latency by endpoint", ("endpoint",))
+_METHOD_LATENCY = Histogram("solana_rpc_method_seconds",
+                            "Solana RPC call latency by method, including rate limiting, failover and hedging",
+                            ("method",))
+_METHOD_ERRORS = Counter("solana_rpc_method_errors", "Solana RPC calls failed on all endpoints by method", ("method",))
+
+# requests that change the chain state are not hedged (resending the same signed transaction is safe, but useless)
+_NOT_HEDGED_REQUESTS: t.Final[t.AbstractSet[str]] = frozenset({
+    "SendLegacyTransaction",
+    "SendRawTransaction",
+    "SendVersionedTransaction",
+    "RequestAirdrop",
+})
+# request class name -> RPC method name
+_METHODS: t.Dict[str, str] = {}
+_EWMA_ALPHA: t.Final[float] = 0.2
+_LATENCY_FLOOR: t.Final[float] = 0.01
+
+T = t.TypeVar("T")
+_Call = t.Callable[[AsyncHTTPProvider], t.Awaitable[T]]
+
+
+@dataclass(frozen=True)
+class RpcEndpoint:
+    url: str
+    weight: float = 1.0
+
+
+@dataclass(frozen=True)
+class RpcPoolOptions:
+    hedge_delay: t.Optional[float] = 0.5
+    """Time (in seconds) to wait for the read response before the same request is sent to another endpoint, `None`
+    disables hedging."""
+    cooldown: float = 5.0
+    """Time (in seconds) the endpoint is out of rotation after 429 / 5xx response or connection error, it's doubled
+    on each consequent failure. `Retry-After` header takes precedence."""
+    max_cooldown: float = 120.0
+    max_slot_lag: int = 50
+    """Endpoint is not used while its slot is behind the most recent one by more than that many slots."""
+    health_check_interval: float = 10.0
+    """How often (in seconds) slots of endpoints are requested."""
+
+
+class _EndpointState:
+    def __init__(self, endpoint: RpcEndpoint, provider: AsyncHTTPProvider) -> None:
+        self.endpoint = endpoint
+        self.provider = provider
+
+        self.latency: t.Optional[float] = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.unavailable_until = 0.0
+        self.slot: t.Optional[int] = None
+
+    @property
+    def score(self) -> float:
+        latency = self.latency if self.latency is not None else 0.0
+
+        return self.endpoint.weight * (1.0 - self.error_rate) / (latency + _LATENCY_FLOOR)
+
+    def record_success(self, latency: float) -> None:
+        self.latency = latency if self.latency is None else (1 - _EWMA_ALPHA) * self.latency + _EWMA_ALPHA * latency
+        self.error_rate *= 1 - _EWMA_ALPHA
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.error_rate = (1 - _EWMA_ALPHA) * self.error_rate + _EWMA_ALPHA
+        self.failures += 1
+
+
+class PooledHTTPProvider(AsyncHTTPProvider):
+    """Drop-in replacement of solana HTTP provider, that spreads requests over several endpoints.
+
+    Endpoint is chosen randomly, proportionally to its weight and health score (recent latency and error rate).
+    Endpoints that are in cooldown (after 429 / 5xx response or connection error) or lag behind on slot are skipped
+    while there are other ones. Failed request is retried on the next endpoint, other errors (e.g. 4xx) are raised
+    as is.
+    """
+
+    def __init__(
+            self,
+            endpoints: t.Sequence[RpcEndpoint],
+            options: RpcPoolOptions,
+            timeout: float = 10.0,
+            transport: t.Optional[httpx.AsyncBaseTransport] = None,
+            rate_limiter: t.Optional[RpcRateLimiter] = None,
+            clock: t.Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not endpoints:
+            raise ValueError("at least one endpoint is required")
+
+        super().__init__(endpoints[0].url, timeout=timeout)
+        self.__options = options
+        self.__rate_limiter = rate_limiter
+        self.__clock = clock
+
+        self.__states = [_EndpointState(endpoint, self.__create_provider(endpoint, timeout, transport))
+                         for endpoint in endpoints]
+        self.__health_check_task: t.Optional["asyncio.Task[None]"] = None
+
+    def __str__(self) -> str:
+        return f"Pooled HTTP provider connected to: {', '.join(s.endpoint.url for s in self.__states)}"
+
+    async def make_request_unparsed(self, body: Body) -> str:
+        hedged = type(body).__name__ not in _NOT_HEDGED_REQUESTS
+
+        return await self.__limit([self.__get_method(body)],
+                                  lambda: self.__request(lambda provider: provider.make_request_unparsed(body), hedged))
+
+    async def make_batch_request_unparsed(self, reqs: t.Tuple[Body, ...]) -> str:
+        return await self.__limit([self.__get_method(body) for body in reqs],
+                                  lambda: self.__request(lambda provider: provider.make_batch_request_unparsed(reqs),
+                                                         False))
+
+    async def is_connected(self) -> bool:
+        results = await asyncio.gather(*(state.provider.is_connected() for state in self.__states))
+
+        return any(results)
+
+    async def __aenter__(self) -> "PooledHTTPProvider":
+        for state in self.__states:
+            await state.provider.__aenter__()
+
+        return self
+
+    async def close(self) -> None:
+        if self.__health_check_task is not None:
+            self.__health_check_task.cancel()
+            await asyncio.gather(self.__health_check_task, return_exceptions=True)
+            self.__health_check_task = None
+
+        await asyncio.gather(*(state.provider.close() for state in self.__states))
+        await super().close()
+
+    async def __limit(self, methods: t.Sequence[str], call: t.Callable[[], t.Awaitable[str]]) -> str:
+        # batch request is observed as a whole, its methods are not known to take equal time
+        method = methods[0] if len(methods) == 1 else "batch"
+        started_at = time.perf_counter()
+
+        try:
+            if self.__rate_limiter is None:
+                return await call()
+
+            return await self.__rate_limiter.run(methods, call)
+
+        except Exception:
+            _METHOD_ERRORS.labels(method).inc()
+            raise
+
+        finally:
+            _METHOD_LATENCY.labels(method).observe(time.perf_counter() - started_at)
+
+    async def __request(self, call: _Call[str], hedged: bool) -> str:
+        self.__start_health_checks()
+
+        candidates = self.__select()
+        errors: t.List[httpx.HTTPError] = []
+
+        while candidates:
+            state = candidates.pop(0)
+
+            try:
+                if hedged and candidates and self.__options.hedge_delay is not None:
+                    return await self.__call_hedged(call, state, candidates.pop(0))
+
+                return await self.__call(call, state)
+
+            except httpx.HTTPError as err:
+                if not self.__is_retryable(err):
+                    raise
+
+                errors.append(err)
+
+        raise errors[-1]
+
+    async def __call_hedged(self, call: _Call[str], primary: _EndpointState, secondary: _EndpointState) -> str:
+        tasks = [asyncio.create_task(self.__call(call, primary))]
+
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.__options.hedge_delay)
+            # a quick retryable failure of the primary endpoint is a failover rather than a hedge, but it's the same
+            error = tasks[0].exception() if done else None
+            if not done or (isinstance(error, httpx.HTTPError) and self.__is_retryable(error)):
+                _LOGGER.debug("hedging rpc request", extra={"primary": primary.endpoint.url,
+                                                            "secondary": secondary.endpoint.url})
+                tasks.append(asyncio.create_task(self.__call(call, secondary)))
+
+            errors: t.List[httpx.HTTPError] = []
+            for future in asyncio.as_completed(tasks):
+                try:
+                    return await future
+
+                except httpx.HTTPError as err:
+                    errors.append(err)
+
+            raise errors[0]
+
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def __call(self, call: _Call[T], state: _EndpointState) -> T:
+        url = state.endpoint.url
+        started_at = self.__clock()
+
+        try:
+            result = await call(state.provider)
+
+        except httpx.HTTPStatusError as err:
+            state.record_failure()
+            if self.__is_retryable(err):
+                self.__eject(state, get_retry_after(err.response))
+                _REQUESTS.labels(url, "throttled" if err.response.status_code == 429 else "error").inc()
+
+            else:
+                _REQUESTS.labels(url, "rejected").inc()
+
+            raise
+
+        except httpx.HTTPError:
+            state.record_failure()
+            self.__eject(state, None)
+            _REQUESTS.labels(url, "error").inc()
+            raise
+
+        latency = self.__clock() - started_at
+        state.record_success(latency)
+        _REQUESTS.labels(url, "ok").inc()
+        _LATENCY.labels(url).observe(latency)
+
+        return result
+
+    def __select(self) -> t.List[_EndpointState]:
+        """Returns endpoints in order they should be tried: weighted random healthy endpoint goes first, others are
+        ordered by their score, unhealthy ones go last."""
+
+        now = self.__clock()
+        top_slot = max((state.slot for state in self.__states if state.slot is not None), default=None)
+
+        def is_healthy(state: _EndpointState) -> bool:
+            lagging = top_slot is not None and state.slot is not None \
+                      and top_slot - state.slot > self.__options.max_slot_lag
+            return state.unavailable_until <= now and not lagging
+
+        healthy = sorted((s for s in self.__states if is_healthy(s)), key=lambda s: s.score, reverse=True)
+        unhealthy = sorted((s for s in self.__states if not is_healthy(s)), key=lambda s: s.unavailable_until)
+
+        if len(healthy) > 1:
+            first = random.choices(healthy, weights=[state.score for state in healthy])[0]
+            healthy.remove(first)
+            healthy.insert(0, first)
+
+        return [*healthy, *unhealthy]
+
+    def __eject(self, state: _EndpointState, retry_after: t.Optional[float]) -> None:
+        cooldown = retry_after if retry_after is not None \
+            else min(self.__options.cooldown * 2 ** (state.failures - 1), self.__options.max_cooldown)
+        state.unavailable_until = self.__clock() + cooldown
+
+        _LOGGER.warning("rpc endpoint is taken out of rotation", extra={
+            "endpoint": state.endpoint.url,
+            "cooldown": cooldown,
+            "failures": state.failures,
+        })
+
+    def __start_health_checks(self) -> None:
+        if self.__health_check_task is None and len(self.__states) > 1:
+            self.__health_check_task = asyncio.create_task(self.__check_health())
+
+    async def __check_health(self) -> None:
+        while True:
+            await asyncio.gather(*(self.__update_slot(state) for state in self.__states))
+            await asyncio.sleep(self.__options.health_check_interval)
+
+    async def __update_slot(self, state: _EndpointState) -> None:
+        try:
+            state.slot = await self.__call(self.__get_slot, state)
+
+        except Exception as err:
+            _LOGGER.debug("rpc endpoint slot request failed", extra={"endpoint": state.endpoint.url}, exc_info=err)
+
+    @staticmethod
+    async def __get_slot(provider: AsyncHTTPProvider) -> int:
+        resp: GetSlotResp = await provider.make_request(GetSlot(), GetSlotResp)
+
+        return resp.value
+
+    @staticmethod
+    def __create_provider(
+            endpoint: RpcEndpoint,
+            timeout: float,
+            transport: t.Optional[httpx.AsyncBaseTransport],
+    ) -> AsyncHTTPProvider:
+        provider = AsyncHTTPProvider(endpoint.url, timeout=timeout)
+        if transport is not None:
+            provider.session = httpx.AsyncClient(timeout=timeout, transport=transport)
+
+        return provider
+
+    @staticmethod
+    def __is_retryable(err: httpx.HTTPError) -> bool:
+        if isinstance(err, httpx.HTTPStatusError):
+            return err.response.status_code == 429 or err.response.status_code >= 500
+
+        return isinstance(err, httpx.TransportError)
+
+    @staticmethod
+    def __get_method(body: Body) -> str:
+        name = type(body).__name__
+        method = _METHODS.get(name)
+        if method is None:
+            method = _METHODS[name] = json.loads(body.to_json())["method"]
+
+        return method
+
+
+class PooledAsyncClient(AsyncClient):
+    """Solana async client, that sends requests through :class:`PooledHTTPProvider`."""
+
+    def __init__(
+            self,
+            endpoints: t.Sequence[RpcEndpoint],
+            options: RpcPoolOptions,
+            commitment: t.Optional[Commitment] = None,
+            timeout: float = 10.0,
+            transport: t.Optional[httpx.AsyncBaseTransport] = None,
+            rate_limiter: t.Optional[RpcRateLimiter] = None,
+    ) -> None:
+        super().__init__(endpoints[0].url if endpoints else None, commitment, timeout=timeout)
+        self._provider = PooledHTTPProvider(endpoints, options, timeout, transport, rate_limiter)
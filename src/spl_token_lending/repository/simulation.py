@@ -0,0 +1,557 @@
+"""Module provides in-process stand-in for solana JSON-RPC: an in-memory ledger of lamports and SPL tokens, served
+through httpx transport, so solana client works offline with deterministic latency, throttling and errors.
+
+Only methods and instructions used by the service are supported: system account creation & transfer, token mint
+initialization, mint & transfer, associated token account creation. Transactions are applied when they are received
+(balances reflect processed state regardless of requested commitment), their status becomes confirmed and finalized
+after the configured amount of slots.
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import math
+import random
+import time
+import typing as t
+from dataclasses import dataclass, replace
+
+import httpx
+from solders.hash import Hash
+from solders.pubkey import Pubkey
+from solders.signature import Signature
+from solders.system_program import ID as SYSTEM_PROGRAM_ID
+from solders.transaction import Transaction
+from spl.token.constants import ASSOCIATED_TOKEN_PROGRAM_ID, TOKEN_PROGRAM_ID
+from spl.token.instructions import get_associated_token_address
+
+_LOGGER = logging.getLogger(__name__)
+
+_LAMPORTS_PER_SIGNATURE: t.Final[int] = 5_000
+_RENT_BYTES_OVERHEAD: t.Final[int] = 128
+_RENT_LAMPORTS_PER_BYTE: t.Final[int] = 3_480 * 2
+_TOKEN_ACCOUNT_SIZE: t.Final[int] = 165
+
+_JsonObject = t.Dict[str, t.Any]
+_TransactionError = t.Union[str, _JsonObject]
+
+
+@dataclass(frozen=True)
+class SimulationOptions:
+    slot_time: float = 0.4
+    """Time (in seconds) of one slot, transaction statuses and blockhashes progress with slots."""
+    latency_median: float = 0.05
+    """Median time (in seconds) of RPC response, latency has log-normal distribution."""
+    latency_sigma: float = 0.5
+    """Standard deviation of latency logarithm, 0 makes latency constant."""
+    throttle_rate: float = 0.0
+    """Probability of 429 response."""
+    error_rate: float = 0.0
+    """Probability of 503 response."""
+    confirmation_lag: int = 1
+    """Slots after which processed transaction becomes confirmed."""
+    finalization_lag: int = 32
+    """Slots after which processed transaction becomes finalized."""
+    blockhash_lifetime: int = 150
+    """Slots after which the blockhash is not accepted anymore."""
+    seed: t.Optional[int] = None
+    """Seed of random generator for latency, error injection and airdrop signatures."""
+
+
+@dataclass(frozen=True)
+class _Mint:
+    decimals: int
+    authority: Pubkey
+    supply: int
+
+
+@dataclass(frozen=True)
+class _TokenAccount:
+    mint: Pubkey
+    owner: Pubkey
+    amount: int
+
+
+@dataclass(frozen=True)
+class _TransactionRecord:
+    slot: int
+    err: t.Optional[_TransactionError]
+
+
+class _RpcError(Exception):
+    def __init__(self, code: int, message: str, data: t.Optional[object] = None) -> None:
+        super().__init__(code, message, data)
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+class _InstructionError(Exception):
+    def __init__(self, err: _TransactionError) -> None:
+        super().__init__(err)
+        self.err = err
+
+
+class _Changes:
+    """Account changes of one transaction, they are applied to the ledger only if all instructions succeeded."""
+
+    def __init__(self, ledger: "SimulatedLedger") -> None:
+        self.lamports: t.Dict[Pubkey, int] = {}
+        self.owners: t.Dict[Pubkey, Pubkey] = {}
+        self.mints: t.Dict[Pubkey, _Mint] = {}
+        self.token_accounts: t.Dict[Pubkey, _TokenAccount] = {}
+        self.__ledger = ledger
+
+    def get_lamports(self, account: Pubkey) -> int:
+        return self.lamports.get(account, self.__ledger.get_lamports(account))
+
+    def add_lamports(self, account: Pubkey, amount: int) -> None:
+        balance = self.get_lamports(account)
+        if balance + amount < 0:
+            # the same as system program `ResultWithNegativeLamports`
+            raise _InstructionError({"Custom": 1})
+
+        self.lamports[account] = balance + amount
+
+    def exists(self, account: Pubkey) -> bool:
+        return account in self.lamports or account in self.owners or self.__ledger.exists(account)
+
+    def get_owner(self, account: Pubkey) -> Pubkey:
+        return self.owners.get(account, self.__ledger.get_owner(account))
+
+    def get_mint(self, account: Pubkey) -> t.Optional[_Mint]:
+        return self.mints.get(account, self.__ledger.get_mint(account))
+
+    def get_token_account(self, account: Pubkey) -> t.Optional[_TokenAccount]:
+        return self.token_accounts.get(account, self.__ledger.get_token_account(account))
+
+
+class SimulatedLedger:
+    """In-memory solana state, handles JSON-RPC requests."""
+
+    def __init__(
+            self,
+            options: SimulationOptions,
+            clock: t.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.__options = options
+        self.__clock = clock
+        self.__started_at = clock()
+        self.__random = random.Random(options.seed)
+
+        self.__lamports: t.Dict[Pubkey, int] = {}
+        self.__owners: t.Dict[Pubkey, Pubkey] = {}
+        self.__mints: t.Dict[Pubkey, _Mint] = {}
+        self.__token_accounts: t.Dict[Pubkey, _TokenAccount] = {}
+        self.__transactions: t.Dict[Signature, _TransactionRecord] = {}
+        # blockhash -> slot, in order of slots
+        self.__blockhashes: t.Dict[Hash, int] = {}
+
+        self.__methods: t.Mapping[str, t.Callable[[t.Sequence[t.Any]], object]] = {
+            "getAccountInfo": self.__get_account_info,
+            "getBalance": self.__get_balance,
+            "getBlockHeight": self.__get_slot,
+            "getHealth": lambda _: "ok",
+            "getLatestBlockhash": self.__get_latest_blockhash,
+            "getMinimumBalanceForRentExemption": self.__get_minimum_balance_for_rent_exemption,
+            "getSignatureStatuses": self.__get_signature_statuses,
+            "getSlot": self.__get_slot,
+            "getTokenAccountBalance": self.__get_token_account_balance,
+            "requestAirdrop": self.__request_airdrop,
+            "sendTransaction": self.__send_transaction,
+        }
+
+    @property
+    def slot(self) -> int:
+        return int((self.__clock() - self.__started_at) / self.__options.slot_time)
+
+    def get_lamports(self, account: Pubkey) -> int:
+        return self.__lamports.get(account, 0)
+
+    def exists(self, account: Pubkey) -> bool:
+        return account in self.__lamports or account in self.__owners
+
+    def get_owner(self, account: Pubkey) -> Pubkey:
+        return self.__owners.get(account, SYSTEM_PROGRAM_ID)
+
+    def get_mint(self, account: Pubkey) -> t.Optional[_Mint]:
+        return self.__mints.get(account)
+
+    def get_token_account(self, account: Pubkey) -> t.Optional[_TokenAccount]:
+        return self.__token_accounts.get(account)
+
+    def handle(self, request: _JsonObject) -> _JsonObject:
+        request_id = request.get("id")
+
+        try:
+            method = self.__methods.get(request.get("method", ""))
+            if method is None:
+                raise _RpcError(-32601, "Method not found")
+
+            result = method(request.get("params") or [])
+
+        except _RpcError as err:
+            error: _JsonObject = {"code": err.code, "message": err.message}
+            if err.data is not None:
+                error["data"] = err.data
+
+            return {"jsonrpc": "2.0", "error": error, "id": request_id}
+
+        return {"jsonrpc": "2.0", "result": result, "id": request_id}
+
+    def __with_context(self, value: object) -> _JsonObject:
+        return {"context": {"slot": self.slot}, "value": value}
+
+    def __get_account_info(self, params: t.Sequence[t.Any]) -> object:
+        account = Pubkey.from_string(params[0])
+        if not self.exists(account):
+            return self.__with_context(None)
+
+        # account data layouts are not simulated, callers check only account existence
+        return self.__with_context({
+            "data": ["", "base64"],
+            "executable": False,
+            "lamports": self.get_lamports(account),
+            "owner": str(self.get_owner(account)),
+            "rentEpoch": 0,
+        })
+
+    def __get_balance(self, params: t.Sequence[t.Any]) -> object:
+        return self.__with_context(self.get_lamports(Pubkey.from_string(params[0])))
+
+    def __get_slot(self, _: t.Sequence[t.Any]) -> object:
+        return self.slot
+
+    def __get_latest_blockhash(self, _: t.Sequence[t.Any]) -> object:
+        slot = self.slot
+        blockhash = Hash.hash(slot.to_bytes(8, "little"))
+
+        if blockhash not in self.__blockhashes:
+            self.__blockhashes[blockhash] = slot
+
+            # expired blockhashes are dropped
+            for expired, expired_slot in list(self.__blockhashes.items()):
+                if slot - expired_slot <= self.__options.blockhash_lifetime:
+                    break
+
+                del self.__blockhashes[expired]
+
+        return self.__with_context({
+            "blockhash": str(blockhash),
+            "lastValidBlockHeight": slot + self.__options.blockhash_lifetime,
+        })
+
+    def __get_minimum_balance_for_rent_exemption(self, params: t.Sequence[t.Any]) -> object:
+        return self.__get_rent(int(params[0]))
+
+    def __get_signature_statuses(self, params: t.Sequence[t.Any]) -> object:
+        slot = self.slot
+        statuses: t.List[t.Optional[_JsonObject]] = []
+
+        for encoded in params[0]:
+            record = self.__transactions.get(Signature.from_string(encoded))
+            if record is None:
+                statuses.append(None)
+                continue
+
+            age = slot - record.slot
+            if age >= self.__options.finalization_lag:
+                confirmation_status = "finalized"
+            elif age >= self.__options.confirmation_lag:
+                confirmation_status = "confirmed"
+            else:
+                confirmation_status = "processed"
+
+            statuses.append({
+                "slot": record.slot,
+                "confirmations": age if confirmation_status != "finalized" else None,
+                "err": record.err,
+                "status": {"Ok": None} if record.err is None else {"Err": record.err},
+                "confirmationStatus": confirmation_status,
+            })
+
+        return self.__with_context(statuses)
+
+    def __get_token_account_balance(self, params: t.Sequence[t.Any]) -> object:
+        token_account = self.get_token_account(Pubkey.from_string(params[0]))
+        if token_account is None:
+            raise _RpcError(-32602, "Invalid param: could not find account")
+
+        mint = self.__mints[token_account.mint]
+        ui_amount = token_account.amount / 10 ** mint.decimals
+
+        return self.__with_context({
+            "amount": str(token_account.amount),
+            "decimals": mint.decimals,
+            "uiAmount": ui_amount,
+            "uiAmountString": f"{ui_amount:.{mint.decimals}f}",
+        })
+
+    def __request_airdrop(self, params: t.Sequence[t.Any]) -> object:
+        account, lamports = Pubkey.from_string(params[0]), int(params[1])
+        signature = Signature(self.__random.randbytes(64))
+
+        self.__lamports[account] = self.get_lamports(account) + lamports
+        self.__transactions[signature] = _TransactionRecord(self.slot, None)
+
+        return str(signature)
+
+    def __send_transaction(self, params: t.Sequence[t.Any]) -> object:
+        config: _JsonObject = params[1] if len(params) > 1 else {}
+        if config.get("encoding", "base58") != "base64":
+            raise _RpcError(-32602, "Invalid params: only base64 encoding is supported")
+
+        try:
+            txn = Transaction.from_bytes(base64.b64decode(params[0]))
+
+        except Exception as decode_err:
+            raise _RpcError(-32602, f"Invalid params: failed to deserialize transaction: {decode_err}") from decode_err
+
+        signature = txn.signatures[0]
+        # resending processed transaction is not an error
+        if signature in self.__transactions:
+            return str(signature)
+
+        err = self.__execute(txn)
+        if err is not None:
+            _LOGGER.debug("simulated transaction failed", extra={"signature": signature, "err": err})
+
+        if err is not None and not config.get("skipPreflight", False):
+            raise _RpcError(-32002, f"Transaction simulation failed: {err}", {
+                "err": err,
+                "accounts": None,
+                "logs": [],
+                "unitsConsumed": 0,
+                "returnData": None,
+            })
+
+        if err is not None and err != "InsufficientFundsForFee":
+            # failed transaction that was not rejected by preflight check is landed, so its fee is charged
+            self.__lamports[txn.message.account_keys[0]] -= self.__get_fee(txn)
+
+        self.__transactions[signature] = _TransactionRecord(self.slot, err)
+
+        return str(signature)
+
+    def __execute(self, txn: Transaction) -> t.Optional[_TransactionError]:
+        message = txn.message
+
+        blockhash_slot = self.__blockhashes.get(message.recent_blockhash)
+        if blockhash_slot is None or self.slot - blockhash_slot > self.__options.blockhash_lifetime:
+            return "BlockhashNotFound"
+
+        if not all(txn.verify_with_results()):
+            return "SignatureFailure"
+
+        keys = message.account_keys
+        signers = frozenset(keys[:message.header.num_required_signatures])
+
+        fee = self.__get_fee(txn)
+        if self.get_lamports(keys[0]) < fee:
+            return "InsufficientFundsForFee"
+
+        changes = _Changes(self)
+        changes.add_lamports(keys[0], -fee)
+
+        for index, instruction in enumerate(message.instructions):
+            program_id = keys[instruction.program_id_index]
+            accounts = [keys[i] for i in instruction.accounts]
+
+            try:
+                if program_id == SYSTEM_PROGRAM_ID:
+                    self.__execute_system(changes, bytes(instruction.data), accounts, signers)
+                elif program_id == TOKEN_PROGRAM_ID:
+                    self.__execute_token(changes, bytes(instruction.data), accounts, signers)
+                elif program_id == ASSOCIATED_TOKEN_PROGRAM_ID:
+                    self.__execute_associated_token(changes, bytes(instruction.data), accounts)
+                else:
+                    raise _InstructionError("IncorrectProgramId")
+
+            except _InstructionError as err:
+                return {"InstructionError": [index, err.err]}
+
+            except (IndexError, ValueError):
+                return {"InstructionError": [index, "InvalidInstructionData"]}
+
+        self.__lamports.update(changes.lamports)
+        self.__owners.update(changes.owners)
+        self.__mints.update(changes.mints)
+        self.__token_accounts.update(changes.token_accounts)
+
+        return None
+
+    def __execute_system(
+            self,
+            changes: _Changes,
+            data: bytes,
+            accounts: t.Sequence[Pubkey],
+            signers: t.AbstractSet[Pubkey],
+    ) -> None:
+        tag = int.from_bytes(data[:4], "little")
+        lamports = int.from_bytes(data[4:12], "little")
+
+        if tag == 0:  # CreateAccount
+            source, created = accounts[0], accounts[1]
+            if source not in signers or created not in signers:
+                raise _InstructionError("MissingRequiredSignature")
+
+            if changes.exists(created):
+                # the same as system program `AccountAlreadyInUse`
+                raise _InstructionError({"Custom": 0})
+
+            changes.add_lamports(source, -lamports)
+            changes.add_lamports(created, lamports)
+            changes.owners[created] = Pubkey(data[20:52])
+
+        elif tag == 2:  # Transfer
+            source, dest = accounts[0], accounts[1]
+            if source not in signers:
+                raise _InstructionError("MissingRequiredSignature")
+
+            changes.add_lamports(source, -lamports)
+            changes.add_lamports(dest, lamports)
+
+        else:
+            raise _InstructionError("InvalidInstructionData")
+
+    def __execute_token(
+            self,
+            changes: _Changes,
+            data: bytes,
+            accounts: t.Sequence[Pubkey],
+            signers: t.AbstractSet[Pubkey],
+    ) -> None:
+        tag = data[0]
+
+        if tag in (0, 20):  # InitializeMint, InitializeMint2
+            mint = accounts[0]
+            if changes.get_owner(mint) != TOKEN_PROGRAM_ID:
+                raise _InstructionError("IncorrectProgramId")
+
+            if changes.get_mint(mint) is not None:
+                # the same as token program `AlreadyInUse`
+                raise _InstructionError({"Custom": 6})
+
+            changes.mints[mint] = _Mint(decimals=data[1], authority=Pubkey(data[2:34]), supply=0)
+
+        elif tag in (3, 12):  # Transfer, TransferChecked
+            source, dest, owner = (accounts[0], accounts[1], accounts[2]) if tag == 3 \
+                else (accounts[0], accounts[2], accounts[3])
+            amount = int.from_bytes(data[1:9], "little")
+
+            source_account = self.__get_token_account(changes, source)
+            dest_account = self.__get_token_account(changes, dest)
+            self.__check_authority(owner, source_account.owner, signers)
+
+            if source_account.mint != dest_account.mint:
+                # the same as token program `MintMismatch`
+                raise _InstructionError({"Custom": 3})
+
+            if source_account.amount < amount:
+                # the same as token program `InsufficientFunds`
+                raise _InstructionError({"Custom": 1})
+
+            changes.token_accounts[source] = replace(source_account, amount=source_account.amount - amount)
+            dest_account = self.__get_token_account(changes, dest)
+            changes.token_accounts[dest] = replace(dest_account, amount=dest_account.amount + amount)
+
+        elif tag in (7, 14):  # MintTo, MintToChecked
+            mint, dest, authority = accounts[0], accounts[1], accounts[2]
+            amount = int.from_bytes(data[1:9], "little")
+
+            mint_state = changes.get_mint(mint)
+            if mint_state is None:
+                raise _InstructionError("UninitializedAccount")
+
+            dest_account = self.__get_token_account(changes, dest)
+            self.__check_authority(authority, mint_state.authority, signers)
+
+            if dest_account.mint != mint:
+                raise _InstructionError({"Custom": 3})
+
+            changes.mints[mint] = replace(mint_state, supply=mint_state.supply + amount)
+            changes.token_accounts[dest] = replace(dest_account, amount=dest_account.amount + amount)
+
+        else:
+            raise _InstructionError("InvalidInstructionData")
+
+    def __execute_associated_token(self, changes: _Changes, data: bytes, accounts: t.Sequence[Pubkey]) -> None:
+        payer, account, wallet, mint = accounts[0], accounts[1], accounts[2], accounts[3]
+        idempotent = data[:1] == b"\x01"
+
+        if account != get_associated_token_address(wallet, mint):
+            raise _InstructionError("InvalidSeeds")
+
+        if changes.get_mint(mint) is None:
+            raise _InstructionError("InvalidAccountData")
+
+        if changes.exists(account):
+            if idempotent and changes.get_token_account(account) is not None:
+                return
+
+            raise _InstructionError({"Custom": 0})
+
+        rent = self.__get_rent(_TOKEN_ACCOUNT_SIZE)
+        changes.add_lamports(payer, -rent)
+        changes.add_lamports(account, rent)
+        changes.owners[account] = TOKEN_PROGRAM_ID
+        changes.token_accounts[account] = _TokenAccount(mint=mint, owner=wallet, amount=0)
+
+    def __get_token_account(self, changes: _Changes, account: Pubkey) -> _TokenAccount:
+        token_account = changes.get_token_account(account)
+        if token_account is None:
+            raise _InstructionError("UninitializedAccount")
+
+        return token_account
+
+    def __check_authority(self, authority: Pubkey, expected: Pubkey, signers: t.AbstractSet[Pubkey]) -> None:
+        if authority != expected:
+            # the same as token program `OwnerMismatch`
+            raise _InstructionError({"Custom": 4})
+
+        if authority not in signers:
+            raise _InstructionError("MissingRequiredSignature")
+
+    def __get_fee(self, txn: Transaction) -> int:
+        return _LAMPORTS_PER_SIGNATURE * len(txn.signatures)
+
+    def __get_rent(self, size: int) -> int:
+        return (size + _RENT_BYTES_OVERHEAD) * _RENT_LAMPORTS_PER_BYTE
+
+
+class SimulatedSolanaTransport(httpx.AsyncBaseTransport):
+    """Serves solana JSON-RPC requests from :class:`SimulatedLedger` with injected latency, throttling (429) and
+    errors (503). All endpoints of the pool may share the transport, so they see the same ledger."""
+
+    def __init__(self, ledger: SimulatedLedger, options: SimulationOptions) -> None:
+        self.__ledger = ledger
+        self.__options = options
+        self.__random = random.Random(options.seed)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        latency = self.__get_latency()
+        if latency > 0:
+            await asyncio.sleep(latency)
+
+        if request.method == "GET":
+            return httpx.Response(200, text="ok")
+
+        roll = self.__random.random()
+        if roll < self.__options.throttle_rate:
+            return httpx.Response(429, text="Too many requests for a specific RPC call")
+
+        if roll < self.__options.throttle_rate + self.__options.error_rate:
+            return httpx.Response(503, text="Service unavailable")
+
+        payload = json.loads(await request.aread())
+        if isinstance(payload, list):
+            return httpx.Response(200, json=[self.__ledger.handle(item) for item in payload])
+
+        return httpx.Response(200, json=self.__ledger.handle(payload))
+
+    def __get_latency(self) -> float:
+        if self.__options.latency_median <= 0:
+            return 0.0
+
+        return self.__random.lognormvariate(math.log(self.__options.latency_median), self.__options.latency_sigma)
@@ -1,22 +1,41 @@
+import asyncio
 import logging
+import time
 import typing as t
 from pathlib import Path
 
 from pydantic import BaseModel, Protocol, parse_file_as, validator
 from solana.rpc.async_api import AsyncClient
-from solana.rpc.core import RPCException
+from solana.rpc.commitment import Commitment, Finalized
+from solana.rpc.types import TxOpts
 from solders.keypair import Keypair
 from solders.pubkey import Pubkey
-from solders.rpc.errors import SendTransactionPreflightFailureMessage
 from solders.rpc.responses import GetTokenAccountBalanceResp
+from solders.signature import Signature
+from solders.transaction import Transaction
 from spl.token.async_client import AsyncToken
 from spl.token.constants import TOKEN_PROGRAM_ID
-from spl.token.instructions import get_associated_token_address
-
+from spl.token.instructions import create_associated_token_account, get_associated_token_address
+
+from spl_token_lending.offload import CpuOffloader
+from spl_token_lending.repository.blockhash import RecentBlockhashProvider
+from spl_token_lending.repository.cache import ExpiringLRUCache
+from spl_token_lending.repository.confirmation import (
+    BatchedSignatureStatusPoller,
+    SignatureWaiter,
+    get_confirmation_status,
+    is_status_reached,
+)
 from spl_token_lending.repository.data import Amount
-from spl_token_lending.repository.iterable import wait_for_signature_status
+from spl_token_lending.repository.transfer import (
+    SentTransaction,
+    SentTransferCallback,
+    TokenTransferBatcher,
+    TransferBatchOptions,
+)
 from spl_token_lending.repository.wallet import WalletRepository
 from spl_token_lending.serializable import KeyPairObject, PublicKeyObject
+from spl_token_lending.timing import record_span, span
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -28,10 +47,33 @@ class TokenRepositoryError(Exception):
 class TokenRepository:
     """Provides operations with tokens in solana system."""
 
-    def __init__(self, client: AsyncClient, token: Pubkey, owner: Keypair) -> None:
+    def __init__(
+            self,
+            client: AsyncClient,
+            signature_waiter: SignatureWaiter,
+            blockhash_provider: RecentBlockhashProvider,
+            token: Pubkey,
+            owner: Keypair,
+            transfer_options: t.Optional[TransferBatchOptions] = None,
+            known_accounts: t.Optional[ExpiringLRUCache[Pubkey, Pubkey]] = None,
+            account_commitment: Commitment = Finalized,
+            offloader: t.Optional[CpuOffloader] = None,
+    ) -> None:
         self.__client = client
+        self.__signature_waiter = signature_waiter
+        self.__blockhash_provider = blockhash_provider
         self.__owner = owner
+        self.__offloader = offloader if offloader is not None else CpuOffloader(None)
+        self.__transfer_options = transfer_options or TransferBatchOptions()
+        self.__account_commitment = account_commitment
+        # wallet -> associated token account, that is known to exist in solana.
+        self.__known_accounts = known_accounts if known_accounts is not None else ExpiringLRUCache(10_000, 3600.0)
+        # wallet -> lookup (or creation) of its token account, concurrent transfers to the same wallet make one lookup
+        self.__account_lookups: t.Dict[Pubkey, "asyncio.Task[Pubkey]"] = {}
         self.__token = AsyncToken(self.__client, token, TOKEN_PROGRAM_ID, owner)
+        self.__source_account = self.get_account(owner.pubkey())
+        self.__batcher = TokenTransferBatcher(self.__client, signature_waiter, blockhash_provider, owner,
+                                              TOKEN_PROGRAM_ID, self.__transfer_options)
 
     @property
     def token(self) -> Pubkey:
@@ -41,87 +83,214 @@ class TokenRepository:
     def owner_pubkey(self) -> Pubkey:
         return self.__owner.pubkey()
 
+    @property
+    def transfer_commitment(self) -> Commitment:
+        """Commitment, that transfer transaction reaches when :meth:`transfer` succeeds."""
+
+        return self.__transfer_options.commitment
+
     def get_account(self, wallet: Pubkey) -> Pubkey:
         return get_associated_token_address(wallet, self.__token.pubkey)
 
+    async def get_accounts(self, wallets: t.Sequence[Pubkey]) -> t.Sequence[Pubkey]:
+        """Returns associated token accounts of wallets in the same order, addresses of a big batch are derived in
+        the offload pool."""
+
+        return await self.__offloader.map(_derive_account, [(wallet, self.__token.pubkey) for wallet in wallets])
+
+    async def add_known_accounts(self, wallets: t.Sequence[Pubkey]) -> None:
+        """Marks associated token accounts of specified wallets as existing, so no RPC request will be made for them
+        in :meth:`get_or_create_account`."""
+
+        for wallet, account in zip(wallets, await self.get_accounts(wallets)):
+            self.__known_accounts.put(wallet, account)
+
     async def get_or_create_account(self, wallet: Pubkey) -> Pubkey:
+        account = self.__known_accounts.get(wallet)
+        if account is not None:
+            return account
+
+        lookup = self.__account_lookups.get(wallet)
+        if lookup is None:
+            lookup = asyncio.create_task(self.__lookup_account(wallet))
+            self.__account_lookups[wallet] = lookup
+            lookup.add_done_callback(lambda _: self.__account_lookups.pop(wallet, None))
+
+        return await asyncio.shield(lookup)
+
+    async def __lookup_account(self, wallet: Pubkey) -> Pubkey:
         account = self.get_account(wallet)
 
-        resp = await self.__client.get_account_info(account)
+        with span("rpc.get_account_info"):
+            resp = await self.__client.get_account_info(account)
 
         if resp.value is None:
             account = await self.create_account(wallet)
 
+        self.__known_accounts.put(wallet, account)
+
         return account
 
     async def create_account(self, wallet: Pubkey) -> Pubkey:
         _LOGGER.debug("creating token account", extra={"wallet": wallet})
 
-        account = await self.__token.create_associated_token_account(wallet)
-        _LOGGER.info("token account created", extra={"wallet": wallet, "account": account})
+        with span("rpc.create_account"):
+            recent = await self.__blockhash_provider.get()
+            instruction = create_associated_token_account(self.__owner.pubkey(), wallet, self.__token.pubkey)
+            txn = Transaction.new_signed_with_payer([instruction], self.__owner.pubkey(), [self.__owner],
+                                                    recent.blockhash)
+
+            resp = await self.__client.send_raw_transaction(
+                bytes(txn),
+                TxOpts(skip_confirmation=True, preflight_commitment=self.__account_commitment),
+            )
+
+        with span("rpc.create_account_confirm"):
+            ok = await self.__signature_waiter.wait(resp.value, get_confirmation_status(self.__account_commitment))
+        if not ok:
+            raise TokenRepositoryError("token account creation failed", wallet, resp.value)
+
+        account = self.get_account(wallet)
+        _LOGGER.info("token account created", extra={"wallet": wallet, "account": account, "signature": resp.value})
 
         return account
 
     async def get_account_amount(self, wallet: Pubkey) -> t.Optional[Amount]:
         account = self.get_account(wallet)
 
-        resp = await self.__token.get_balance(account)
+        # balance must include transfers that were done with the same commitment
+        with span("rpc.get_balance"):
+            resp = await self.__token.get_balance(account, self.transfer_commitment)
 
         return Amount(int(resp.value.amount)) if isinstance(resp, GetTokenAccountBalanceResp) else None
 
-    async def transfer(self, wallet: Pubkey, amount: Amount) -> bool:
-        source_account = self.get_account(self.__owner.pubkey())
-        dest_account = await self.get_or_create_account(wallet)
-
-        try:
-            _LOGGER.debug("transfer started", extra={
-                "source_account": source_account,
-                "dest_account": dest_account,
-                "amount": amount,
-            })
-            resp = await self.__token.transfer(source_account, dest_account, self.__owner, amount)
-
-        except RPCException as err:
-            transaction_err = self.__get_transaction_error(err)
-            _LOGGER.warning("transfer failed", extra={
-                "source_account": source_account,
-                "dest_account": dest_account,
-                "amount": amount,
-                "err": transaction_err,
-            }, exc_info=err)
+    async def transfer(
+            self,
+            wallet: Pubkey,
+            amount: Amount,
+            on_sent: t.Optional[SentTransferCallback] = None,
+    ) -> t.Optional[bool]:
+        """Returns `True` when the transfer reached :attr:`transfer_commitment`, `False` when it failed, `None` when
+        its result is unknown: the transaction was sent, but its status was not received in time."""
 
-            return False
+        source_account = self.__source_account
+        dest_account = await self.get_or_create_account(wallet)
 
-        transfer_sig = resp.value
+        _LOGGER.debug("transfer started", extra={
+            "source_account": source_account,
+            "dest_account": dest_account,
+            "amount": amount,
+        })
+        ok = await self.__transfer_timed(source_account, dest_account, amount, on_sent)
+        if ok is None:
+            return None
 
-        ok = await wait_for_signature_status(self.__client, transfer_sig)
         if not ok:
-            _LOGGER.warning("transfer transaction finalized status was not received, assuming transaction was failed",
-                            extra={
-                                "source_account": source_account,
-                                "dest_account": dest_account,
-                                "amount": amount,
-                                "signature": transfer_sig
-                            })
-
+            # account might be closed by the wallet owner, so check it again on the next transfer
+            self.__known_accounts.pop(wallet)
             return False
 
-        _LOGGER.info("transaction succeeded", extra={
+        _LOGGER.info("transfer succeeded", extra={
             "source_account": source_account,
             "dest_account": dest_account,
             "amount": amount,
-            "signature": transfer_sig
         })
 
         return True
 
-    def __get_transaction_error(self, err: RPCException) -> t.Optional[SendTransactionPreflightFailureMessage]:
-        if len(err.args) > 0:
-            arg0 = err.args[0]
-            if isinstance(arg0, SendTransactionPreflightFailureMessage):
-                return arg0
+    async def __transfer_timed(
+            self,
+            source_account: Pubkey,
+            dest_account: Pubkey,
+            amount: Amount,
+            on_sent: t.Optional[SentTransferCallback],
+    ) -> t.Optional[bool]:
+        """Transfers with the batcher and records the time spent before the transaction was sent (batching & sending)
+        and after it (confirmation) as separate spans."""
+
+        queued_at = time.perf_counter()
+        sent_at: t.Optional[float] = None
+
+        async def mark_sent(sent: SentTransaction) -> None:
+            nonlocal sent_at
+            sent_at = time.perf_counter()
+
+            if on_sent is not None:
+                await on_sent(sent)
+
+        try:
+            return await self.__batcher.transfer(source_account, dest_account, amount, mark_sent)
+
+        finally:
+            finished_at = time.perf_counter()
+            record_span("rpc.transfer_send", queued_at, sent_at if sent_at is not None else finished_at)
+            if sent_at is not None:
+                record_span("rpc.transfer_confirm", sent_at, finished_at)
+
+    async def get_transfer_result(
+            self,
+            signature: Signature,
+            commitment: Commitment = Finalized,
+            last_valid_block_height: t.Optional[int] = None,
+    ) -> t.Optional[bool]:
+        """Checks previously sent transfer transaction: `True` - it reached the commitment, `False` - it failed or is
+        unknown to solana, `None` - it didn't reach the commitment yet.
+
+        Unknown transaction is still pending (`None`) while finalized block height doesn't exceed
+        `last_valid_block_height` of its blockhash. When the height is not set, unknown transaction is considered as
+        failed, so caller must check it after the transaction blockhash has expired.
+        """
+
+        results = await self.get_transfer_results([signature], commitment, [last_valid_block_height])
+
+        return results[0]
+
+    async def get_transfer_results(
+            self,
+            signatures: t.Sequence[Signature],
+            commitment: Commitment = Finalized,
+            last_valid_block_heights: t.Optional[t.Sequence[t.Optional[int]]] = None,
+    ) -> t.Sequence[t.Optional[bool]]:
+        """The same as :meth:`get_transfer_result`, but for many transactions with one RPC request per
+        `MAX_SIGNATURES_PER_REQUEST` signatures."""
+
+        expected = get_confirmation_status(commitment)
+        heights = last_valid_block_heights if last_valid_block_heights is not None else [None] * len(signatures)
+        block_height: t.Optional[int] = None
+        results: t.List[t.Optional[bool]] = []
+
+        for start in range(0, len(signatures), BatchedSignatureStatusPoller.MAX_SIGNATURES_PER_REQUEST):
+            chunk = signatures[start:start + BatchedSignatureStatusPoller.MAX_SIGNATURES_PER_REQUEST]
+            with span("rpc.get_signature_statuses"):
+                resp = await self.__client.get_signature_statuses(list(chunk), search_transaction_history=True)
+
+            for status, last_valid_block_height in zip(resp.value, heights[start:start + len(chunk)]):
+                if status is None and last_valid_block_height is not None:
+                    if block_height is None:
+                        block_height = await self.get_block_height()
+                    # the transaction still may be processed while its blockhash is valid
+                    results.append(None if block_height <= last_valid_block_height else False)
+
+                elif status is None or status.err is not None:
+                    results.append(False)
+
+                else:
+                    results.append(True if is_status_reached(status, expected) else None)
+
+        return results
+
+    async def get_block_height(self) -> int:
+        """Returns finalized block height: transaction which blockhash is valid up to a lower height can't be processed
+        anymore."""
+
+        with span("rpc.get_block_height"):
+            resp = await self.__client.get_block_height(Finalized)
+
+        return resp.value
+
 
-        return None
+def _derive_account(wallet_and_token: t.Tuple[Pubkey, Pubkey]) -> Pubkey:
+    return get_associated_token_address(*wallet_and_token)
 
 
 class TokenRepositoryConfig(BaseModel):
@@ -156,15 +325,34 @@ class TokenRepositoryFactory:
     """Creates :class:`TokenRepository` instances from different things, such as :class:`TokenRepositoryConfig`,
     :class:`Path` - a system path to a file with a config, etc."""
 
-    def __init__(self, client: AsyncClient, wallet_repository: WalletRepository, mint_amount: int) -> None:
+    def __init__(
+            self,
+            client: AsyncClient,
+            signature_waiter: SignatureWaiter,
+            blockhash_provider: RecentBlockhashProvider,
+            wallet_repository: WalletRepository,
+            mint_amount: int,
+            transfer_options: t.Optional[TransferBatchOptions] = None,
+            known_accounts: t.Optional[ExpiringLRUCache[Pubkey, Pubkey]] = None,
+            account_commitment: Commitment = Finalized,
+            offloader: t.Optional[CpuOffloader] = None,
+    ) -> None:
         self.__client = client
+        self.__signature_waiter = signature_waiter
+        self.__blockhash_provider = blockhash_provider
+        self.__account_commitment = account_commitment
+        self.__offloader = offloader
         self.__wallet_repository = wallet_repository
         self.__mint_amount = mint_amount
+        self.__transfer_options = transfer_options
+        self.__known_accounts = known_accounts
 
     def create_from_config(self, config: TokenRepositoryConfig) -> TokenRepository:
         _LOGGER.debug("creating token repository from config", extra={"config": config.dict()})
 
-        return TokenRepository(self.__client, config.token, config.owner)
+        return TokenRepository(self.__client, self.__signature_waiter, self.__blockhash_provider, config.token,
+                               config.owner, self.__transfer_options, self.__known_accounts,
+                               self.__account_commitment, self.__offloader)
 
     async def create_from_wallet(self, wallet: Keypair) -> TokenRepository:
         config = await self.__create_config_from_wallet(wallet)
@@ -228,7 +416,7 @@ class TokenRepositoryFactory:
             "signature": mint_resp.value
         })
 
-        ok = await wait_for_signature_status(self.__client, mint_resp.value)
+        ok = await self.__signature_waiter.wait(mint_resp.value)
         if not ok:
             raise TokenRepositoryInitializationError("token mint process failed", mint_resp)
 
@@ -0,0 +1,296 @@
+"""Module provides micro-batching for SPL token transfers: transfers requested concurrently are packed into shared
+transactions, so each of them doesn't pay for a separate send & confirm cycle."""
+
+import asyncio
+import logging
+import typing as t
+from dataclasses import dataclass
+
+from prometheus_client import Gauge
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.commitment import Commitment, Finalized
+from solana.rpc.core import RPCException
+from solana.rpc.types import TxOpts
+from solana.transaction import PACKET_DATA_SIZE
+from solders.hash import Hash
+from solders.instruction import Instruction
+from solders.keypair import Keypair
+from solders.message import Message
+from solders.pubkey import Pubkey
+from solders.rpc.errors import SendTransactionPreflightFailureMessage
+from solders.signature import Signature
+from solders.transaction import Transaction
+from solders.transaction_status import TransactionErrorFieldless
+from spl.token.instructions import TransferParams, transfer
+
+from spl_token_lending.repository.blockhash import RecentBlockhashProvider
+from spl_token_lending.repository.confirmation import SignatureWaiter, get_confirmation_status
+from spl_token_lending.repository.data import Amount
+
+_LOGGER = logging.getLogger(__name__)
+
+_IN_FLIGHT = Gauge("token_transfers_in_flight", "Token transfers that are queued, sent or waiting for confirmation",
+                   multiprocess_mode="livesum")
+
+
+
+@dataclass(frozen=True)
+class SentTransaction:
+    signature: Signature
+    last_valid_block_height: int
+    """Transaction can't be processed after that block height, so when solana doesn't know the transaction after it,
+    the transaction was dropped."""
+
+
+SentTransferCallback = t.Callable[[SentTransaction], t.Awaitable[None]]
+
+
+@dataclass(frozen=True)
+class TransferBatchOptions:
+    window: float = 0.05
+    """Time (in seconds) to collect transfers before the batch is sent."""
+    max_size: int = 64
+    """The batch is sent immediately when it collects that many transfers."""
+    commitment: Commitment = Finalized
+    """Transfer is considered done when its transaction reaches that commitment."""
+
+
+@dataclass(frozen=True)
+class _PendingTransfer:
+    source: Pubkey
+    dest: Pubkey
+    amount: Amount
+    result: "asyncio.Future[t.Optional[bool]]"
+    on_sent: t.Optional[SentTransferCallback] = None
+
+
+class _BlockhashNotFoundError(Exception):
+    def __init__(self, blockhash: Hash) -> None:
+        super().__init__("blockhash not found", blockhash)
+        self.blockhash = blockhash
+
+
+class TokenTransferBatcher:
+    """Collects transfers over a short window (or up to a size limit) and sends as many transfer instructions as fit
+    into one transaction. Each caller receives the result of its own transfer.
+
+    Solana transaction is atomic, so when a packed transaction is rejected or fails on chain, the pack is split in
+    halves and resent until failed transfers are isolated - other transfers from the same pack are not failed.
+    Transaction with unknown status is not resent, it still may be confirmed.
+
+    Transactions are built and signed locally with a cached recent blockhash, so sending takes one RPC request.
+    """
+
+    def __init__(
+            self,
+            client: AsyncClient,
+            signature_waiter: SignatureWaiter,
+            blockhash_provider: RecentBlockhashProvider,
+            owner: Keypair,
+            program_id: Pubkey,
+            options: TransferBatchOptions,
+    ) -> None:
+        self.__client = client
+        self.__signature_waiter = signature_waiter
+        self.__blockhash_provider = blockhash_provider
+        self.__owner = owner
+        self.__program_id = program_id
+        self.__options = options
+
+        self.__pending: t.List[_PendingTransfer] = []
+        self.__flush_handle: t.Optional[asyncio.TimerHandle] = None
+        self.__tasks: t.Set["asyncio.Task[None]"] = set()
+
+    async def transfer(
+            self,
+            source: Pubkey,
+            dest: Pubkey,
+            amount: Amount,
+            on_sent: t.Optional[SentTransferCallback] = None,
+    ) -> t.Optional[bool]:
+        """Returns `True` when transfer transaction reached the commitment from options, `False` when the transfer
+        failed, `None` when its status was not received in time (the transaction still may be processed until its
+        blockhash expires). `on_sent` is called with the transaction that contains the transfer right after it was
+        sent, before confirmation."""
+
+        loop = asyncio.get_running_loop()
+
+        pending = _PendingTransfer(source, dest, amount, loop.create_future(), on_sent)
+        self.__pending.append(pending)
+
+        _IN_FLIGHT.inc()
+        pending.result.add_done_callback(lambda _: _IN_FLIGHT.dec())
+
+        if len(self.__pending) >= self.__options.max_size:
+            self.__flush()
+
+        elif self.__flush_handle is None:
+            self.__flush_handle = loop.call_later(self.__options.window, self.__flush)
+
+        # transfer can't be withdrawn when it was sent, so caller cancellation must not affect the batch
+        return await asyncio.shield(pending.result)
+
+    def __flush(self) -> None:
+        if self.__flush_handle is not None:
+            self.__flush_handle.cancel()
+            self.__flush_handle = None
+
+        batch, self.__pending = self.__pending, []
+        if not batch:
+            return
+
+        task = asyncio.create_task(self.__send_batch(batch))
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def __send_batch(self, batch: t.Sequence[_PendingTransfer]) -> None:
+        packs = list(self.__split_into_packs(batch))
+        _LOGGER.debug("sending transfer batch", extra={"transfers": len(batch), "transactions": len(packs)})
+
+        await asyncio.gather(*(self.__send_pack(pack) for pack in packs))
+
+    async def __send_pack(self, pack: t.Sequence[_PendingTransfer], blockhash_retried: bool = False) -> None:
+        try:
+            sent = await self.__send_transaction(pack)
+
+        except _BlockhashNotFoundError as err:
+            self.__blockhash_provider.invalidate(err.blockhash)
+            if not blockhash_retried:
+                _LOGGER.warning("recent blockhash was not found, resending the pack with a new one",
+                                extra={"transfers": len(pack), "blockhash": err.blockhash})
+                await self.__send_pack(pack, blockhash_retried=True)
+                return
+
+            self.__reject(pack, err)
+            return
+
+        except RPCException as err:
+            if len(pack) > 1:
+                _LOGGER.warning("packed transfer transaction failed, splitting the pack to isolate failed transfers",
+                                extra={"transfers": len(pack), "err": self.__get_transaction_error(err)})
+                await self.__send_pack_halves(pack)
+                return
+
+            _LOGGER.warning("transfer failed", extra={
+                "source_account": pack[0].source,
+                "dest_account": pack[0].dest,
+                "amount": pack[0].amount,
+                "err": self.__get_transaction_error(err),
+            }, exc_info=err)
+            self.__resolve(pack, False)
+            return
+
+        except Exception as err:
+            self.__reject(pack, err)
+            return
+
+        await asyncio.gather(*(self.__notify_sent(p, sent) for p in pack if p.on_sent is not None))
+
+        signature = sent.signature
+        ok = await self.__signature_waiter.wait(signature, get_confirmation_status(self.__options.commitment))
+        if ok is None:
+            _LOGGER.warning("transfer transaction status was not received, transfer result is unknown",
+                            extra={"transfers": len(pack), "signature": signature,
+                                   "commitment": self.__options.commitment})
+
+        elif not ok and len(pack) > 1:
+            # failed transaction changed nothing, so its transfers can be resent
+            _LOGGER.warning("packed transfer transaction failed on chain, splitting the pack to isolate failed "
+                            "transfers", extra={"transfers": len(pack), "signature": signature})
+            await self.__send_pack_halves(pack)
+            return
+
+        elif not ok:
+            _LOGGER.warning("transfer transaction failed", extra={"transfers": len(pack), "signature": signature})
+
+        else:
+            _LOGGER.info("transfer transaction succeeded", extra={"transfers": len(pack), "signature": signature,
+                                                                  "commitment": self.__options.commitment})
+
+        self.__resolve(pack, ok)
+
+    async def __send_pack_halves(self, pack: t.Sequence[_PendingTransfer]) -> None:
+        middle = len(pack) // 2
+        await asyncio.gather(self.__send_pack(pack[:middle]), self.__send_pack(pack[middle:]))
+
+    async def __send_transaction(self, pack: t.Sequence[_PendingTransfer]) -> SentTransaction:
+        recent = await self.__blockhash_provider.get()
+        txn = Transaction.new_signed_with_payer(
+            [self.__build_instruction(p) for p in pack],
+            self.__owner.pubkey(),
+            [self.__owner],
+            recent.blockhash,
+        )
+
+        try:
+            resp = await self.__client.send_raw_transaction(
+                bytes(txn),
+                TxOpts(skip_confirmation=True, preflight_commitment=self.__options.commitment),
+            )
+
+        except RPCException as err:
+            preflight_error = self.__get_transaction_error(err)
+            if preflight_error is not None and preflight_error.data.err == TransactionErrorFieldless.BlockhashNotFound:
+                raise _BlockhashNotFoundError(recent.blockhash) from err
+
+            raise
+
+        return SentTransaction(resp.value, recent.last_valid_block_height)
+
+    def __split_into_packs(self, batch: t.Sequence[_PendingTransfer]) -> t.Iterable[t.Sequence[_PendingTransfer]]:
+        pack: t.List[_PendingTransfer] = []
+        instructions: t.List[Instruction] = []
+
+        for pending in batch:
+            instruction = self.__build_instruction(pending)
+
+            if pack and self.__get_transaction_size([*instructions, instruction]) > PACKET_DATA_SIZE:
+                yield pack
+                pack, instructions = [], []
+
+            pack.append(pending)
+            instructions.append(instruction)
+
+        if pack:
+            yield pack
+
+    def __build_instruction(self, pending: _PendingTransfer) -> Instruction:
+        return transfer(TransferParams(
+            program_id=self.__program_id,
+            source=pending.source,
+            dest=pending.dest,
+            owner=self.__owner.pubkey(),
+            amount=pending.amount,
+        ))
+
+    def __get_transaction_size(self, instructions: t.Sequence[Instruction]) -> int:
+        message = Message(instructions, self.__owner.pubkey())
+        # transaction = compact array of signatures (only owner signs) + message
+        return 1 + len(bytes(Signature.default())) + len(bytes(message))
+
+    async def __notify_sent(self, pending: _PendingTransfer, sent: SentTransaction) -> None:
+        assert pending.on_sent is not None
+
+        try:
+            await pending.on_sent(sent)
+
+        except Exception as err:
+            _LOGGER.warning("sent transfer callback failed", extra={"signature": sent.signature}, exc_info=err)
+
+    def __resolve(self, pack: t.Sequence[_PendingTransfer], ok: t.Optional[bool]) -> None:
+        for pending in pack:
+            if not pending.result.done():
+                pending.result.set_result(ok)
+
+    def __reject(self, pack: t.Sequence[_PendingTransfer], err: Exception) -> None:
+        for pending in pack:
+            if not pending.result.done():
+                pending.result.set_exception(err)
+
+    def __get_transaction_error(self, err: RPCException) -> t.Optional[SendTransactionPreflightFailureMessage]:
+        if len(err.args) > 0:
+            arg0 = err.args[0]
+            if isinstance(arg0, SendTransactionPreflightFailureMessage):
+                return arg0
+
+        return None
@@ -5,7 +5,8 @@ from solana.rpc.async_api import AsyncClient
 from solders.keypair import Keypair
 from solders.rpc.responses import RequestAirdropResp
 
-from spl_token_lending.repository.iterable import iter_with_exp_delay, wait_for_signature_status
+from spl_token_lending.repository.confirmation import SignatureWaiter
+from spl_token_lending.repository.iterable import iter_with_exp_delay
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -17,8 +18,9 @@ class WalletRepositoryError(Exception):
 class WalletRepository:
     """Provides operations with wallets in solana system."""
 
-    def __init__(self, client: AsyncClient, initial_amount: int) -> None:
+    def __init__(self, client: AsyncClient, signature_waiter: SignatureWaiter, initial_amount: int) -> None:
         self.__client = client
+        self.__signature_waiter = signature_waiter
         self.__initial_amount = initial_amount
 
     async def create(self, amount: t.Optional[int] = None) -> Keypair:
@@ -37,7 +39,7 @@ class WalletRepository:
         if airdrop_resp is None:
             raise WalletRepositoryError("airdrop request failed", airdrop_resp, wallet)
 
-        airdrop_finalized = await wait_for_signature_status(self.__client, airdrop_resp.value)
+        airdrop_finalized = await self.__signature_waiter.wait(airdrop_resp.value)
         if not airdrop_finalized:
             raise WalletRepositoryError("airdrop request failed", airdrop_resp, wallet, airdrop_finalized)
 
@@ -56,7 +58,7 @@ class WalletRepository:
             wallet: Keypair,
             amount: int,
     ) -> t.Optional[RequestAirdropResp]:
-        async for _ in iter_with_exp_delay():
+        async for _ in iter_with_exp_delay(jitter=True):
             airdrop_resp = await self.__client.request_airdrop(wallet.pubkey(), amount)
 
             _LOGGER.debug("airdrop response", extra={"resp": airdrop_resp, "wallet": wallet})
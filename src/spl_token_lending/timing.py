@@ -0,0 +1,106 @@
+"""Module provides request-scoped timing: spans are collected into the tree of the current trace (it's kept in a
+context variable, so it's passed through awaits and into tasks created by the request), e.g. to break the request
+latency down by DB queries, RPC calls and confirmation waits.
+
+Spans made outside of a trace (or after the trace was finished, e.g. in a background task started by a request) are
+not recorded, so code can be instrumented unconditionally.
+"""
+
+import time
+import typing as t
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Span:
+    name: str
+    started_at: float
+    finished_at: t.Optional[float] = None
+    children: t.List["Span"] = field(default_factory=list)
+
+    @property
+    def duration(self) -> float:
+        finished_at = self.finished_at if self.finished_at is not None else time.perf_counter()
+
+        return finished_at - self.started_at
+
+    def to_dict(self) -> t.Mapping[str, object]:
+        """Returns the span tree with durations (in milliseconds) and offsets from the start of this span."""
+
+        return self.__to_dict(self.started_at)
+
+    def __to_dict(self, origin: float) -> t.Mapping[str, object]:
+        result: t.Dict[str, object] = {
+            "name": self.name,
+            "offset_ms": round((self.started_at - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+        }
+        if self.children:
+            result["children"] = [child.__to_dict(origin) for child in self.children]
+
+        return result
+
+
+_CURRENT_SPAN: ContextVar[t.Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def use_trace(name: str) -> t.Iterator[Span]:
+    """Starts a new trace, spans made within the context are collected into the returned root span."""
+
+    root = Span(name, time.perf_counter())
+    token = _CURRENT_SPAN.set(root)
+
+    try:
+        yield root
+
+    finally:
+        root.finished_at = time.perf_counter()
+        _CURRENT_SPAN.reset(token)
+
+
+@contextmanager
+def span(name: str) -> t.Iterator[None]:
+    parent = _CURRENT_SPAN.get()
+    if parent is None or parent.finished_at is not None:
+        yield
+        return
+
+    child = Span(name, time.perf_counter())
+    parent.children.append(child)
+    token = _CURRENT_SPAN.set(child)
+
+    try:
+        yield
+
+    finally:
+        child.finished_at = time.perf_counter()
+        _CURRENT_SPAN.reset(token)
+
+
+def record_span(name: str, started_at: float, finished_at: float) -> None:
+    """Adds already finished span (times are from :func:`time.perf_counter`), e.g. when the start and the end of the
+    operation are observed in different places."""
+
+    parent = _CURRENT_SPAN.get()
+    if parent is not None and parent.finished_at is None:
+        parent.children.append(Span(name, started_at, finished_at))
+
+
+def format_server_timing(root: Span) -> str:
+    """Returns `Server-Timing` header value: total duration of spans with the same name (in milliseconds) in order
+    of their first occurrence, followed by the duration of the whole trace."""
+
+    durations: t.Dict[str, float] = {}
+
+    def collect(parent: Span) -> None:
+        for child in parent.children:
+            durations[child.name] = durations.get(child.name, 0.0) + child.duration
+            collect(child)
+
+    collect(root)
+    durations["total"] = root.duration
+
+    return ", ".join(f"{name};dur={duration * 1000:.1f}" for name, duration in durations.items())
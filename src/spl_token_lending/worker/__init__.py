@@ -0,0 +1,2 @@
+"""Package runs transfer job worker process, that performs loan transfers queued in postgres, see
+:class:`spl_token_lending.domain.pipeline.TransferJobWorker`."""
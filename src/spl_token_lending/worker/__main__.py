@@ -0,0 +1,7 @@
+"""Package starts transfer job worker process, run as many processes as needed to scale transfers."""
+
+import asyncio
+
+from spl_token_lending.worker.main import run_worker
+
+asyncio.run(run_worker())
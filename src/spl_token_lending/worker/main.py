@@ -0,0 +1,22 @@
+import asyncio
+import signal
+
+from dependency_injector import providers
+
+from spl_token_lending.container import Container, use_initialized_container
+from spl_token_lending.domain.pipeline import TransferJobWorker
+
+
+async def run_worker() -> None:
+    container = Container()
+    # CONFIRMED loans are finalized by API process, see `Config.loan_finalization_enabled`
+    container.loan_finalization_reconciler.override(providers.Object(None))
+
+    async with use_initialized_container(container) as container:
+        worker: TransferJobWorker = await container.transfer_job_worker()  # type: ignore[misc]
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+
+        await worker.run()
@@ -1,15 +1,35 @@
+import asyncio
+import typing as t
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import replace
+
 import pytest
 import pytest_asyncio
+from solana.rpc.commitment import Commitment, Finalized
 from solders.keypair import Keypair
+from solders.pubkey import Pubkey
+from solders.signature import Signature
 
 from spl_token_lending.container import Container
-from spl_token_lending.domain.cases import UserLendingCase
+from spl_token_lending.domain.cases import (
+    LoanFinalizationCase,
+    LoanTransferCase,
+    TransferJobCase,
+    UserLendingCase,
+    ViewLoansCase,
+)
 from spl_token_lending.domain.data import (
     FailedUserLoan, InitializedUserLoan,
-    SubmittedUserLoan,
+    SubmittedUserLoan, SubmittedUserLoanResult,
 )
-from spl_token_lending.repository.data import Amount
+from spl_token_lending.domain.pipeline import LoanTransferPipeline, TransferJobWorker
+from spl_token_lending.repository.balance import SourceBalanceLedger
+from spl_token_lending.repository.data import Amount, LoanId, LoanItem, TransferJobId, TransferJobItem
+from spl_token_lending.repository.job import TransferJobRepository
+from spl_token_lending.repository.loan import LoanRepository
 from spl_token_lending.repository.token import TokenRepository
+from spl_token_lending.repository.transfer import SentTransaction, SentTransferCallback
 
 
 # TODO: think about refilling the initial amount of tokens during the test start - it will make tests more
@@ -28,6 +48,10 @@ class TestUserLendingCase:
     async def token_repo(self, container: Container) -> TokenRepository:
         return await container.token_repository()
 
+    @pytest_asyncio.fixture(scope="class")
+    async def view_executor(self, container: Container) -> ViewLoansCase:
+        return await container.view_loans_case()  # type: ignore[no-any-return,misc]
+
     @pytest_asyncio.fixture()
     async def destination_wallet_keypair(self, container: Container) -> Keypair:
         # TODO: think how to make tests reproducible but keep keypair value outside from the code, it's not secure to
@@ -107,3 +131,610 @@ class TestUserLendingCase:
 
         token_amount_after = await token_repo.get_account_amount(destination_wallet_keypair.pubkey())
         assert token_amount_after == token_amount_before
+
+    @pytest.mark.parametrize("amount", AMOUNTS)
+    @pytest.mark.asyncio
+    async def test_loan_becomes_active_after_background_submit(
+            self,
+            executor: UserLendingCase,
+            view_executor: ViewLoansCase,
+            token_repo: TokenRepository,
+            destination_wallet_keypair: Keypair,
+            amount: Amount,
+    ) -> None:
+        token_amount_before = await token_repo.get_account_amount(destination_wallet_keypair.pubkey())
+
+        init_result = await executor.initialize(destination_wallet_keypair.pubkey(), amount)
+
+        assert isinstance(init_result, InitializedUserLoan)
+        initialized_loan = init_result.item
+
+        signature = destination_wallet_keypair.sign_message(initialized_loan.id_.bytes)
+        submit_result = await executor.submit_in_background(initialized_loan.id_, signature)
+
+        assert isinstance(submit_result, SubmittedUserLoan)
+        assert submit_result.item.status is LoanItem.Status.TRANSFERRING
+
+        resubmit_result = await executor.submit_in_background(initialized_loan.id_, signature)
+
+        assert isinstance(resubmit_result, FailedUserLoan)
+        assert resubmit_result.error == "loan is not pending"
+
+        finished_loan = await view_executor.get(initialized_loan.id_, wait=90.0)
+
+        assert finished_loan is not None
+        assert finished_loan.status in (LoanItem.Status.ACTIVE, LoanItem.Status.CONFIRMED)
+
+        token_amount_after_submit = await token_repo.get_account_amount(destination_wallet_keypair.pubkey())
+        assert token_amount_after_submit is not None
+        assert amount == token_amount_after_submit - (token_amount_before or 0)
+
+    @pytest.mark.asyncio
+    async def test_concurrently_submitted_loan_is_transferred_once(
+            self,
+            executor: UserLendingCase,
+            token_repo: TokenRepository,
+            destination_wallet_keypair: Keypair,
+    ) -> None:
+        amount = self.AMOUNTS[0]
+        token_amount_before = await token_repo.get_account_amount(destination_wallet_keypair.pubkey())
+
+        init_result = await executor.initialize(destination_wallet_keypair.pubkey(), amount)
+
+        assert isinstance(init_result, InitializedUserLoan)
+        initialized_loan = init_result.item
+
+        signature = destination_wallet_keypair.sign_message(initialized_loan.id_.bytes)
+        submit_results = await asyncio.gather(*(executor.submit(initialized_loan.id_, signature) for _ in range(2)))
+
+        assert len([r for r in submit_results if isinstance(r, SubmittedUserLoan)]) == 1
+        assert [r.error for r in submit_results if isinstance(r, FailedUserLoan)] == ["loan is not pending"]
+
+        token_amount_after_submit = await token_repo.get_account_amount(destination_wallet_keypair.pubkey())
+        assert token_amount_after_submit is not None
+        assert amount == token_amount_after_submit - (token_amount_before or 0)
+
+    @pytest.mark.asyncio
+    async def test_loans_initialized_in_bulk_while_source_amount_is_enough(
+            self,
+            executor: UserLendingCase,
+            token_repo: TokenRepository,
+            destination_wallet_keypair: Keypair,
+    ) -> None:
+        token_amount = await token_repo.get_account_amount(token_repo.owner_pubkey)
+        assert token_amount is not None
+
+        wallet = destination_wallet_keypair.pubkey()
+        init_results = await executor.initialize_many([
+            (wallet, self.AMOUNTS[0]),
+            (wallet, Amount(token_amount)),
+            (wallet, self.AMOUNTS[1]),
+        ])
+
+        assert [type(r) for r in init_results] == [InitializedUserLoan, FailedUserLoan, InitializedUserLoan]
+        assert [r.item.amount for r in init_results if isinstance(r, InitializedUserLoan)] == self.AMOUNTS
+        assert [r.item.status for r in init_results if isinstance(r, InitializedUserLoan)] == [
+            LoanItem.Status.PENDING,
+        ] * 2
+
+    @pytest.mark.asyncio
+    async def test_loans_submitted_in_bulk_are_transferred(
+            self,
+            executor: UserLendingCase,
+            token_repo: TokenRepository,
+            destination_wallet_keypair: Keypair,
+    ) -> None:
+        wallet = destination_wallet_keypair.pubkey()
+        init_results = await executor.initialize_many([(wallet, amount) for amount in self.AMOUNTS])
+        loans = [r.item for r in init_results if isinstance(r, InitializedUserLoan)]
+        assert len(loans) == len(self.AMOUNTS)
+
+        submit_results = await executor.submit_many([
+            (loans[0].id_, destination_wallet_keypair.sign_message(loans[0].id_.bytes)),
+            (loans[1].id_, Keypair().sign_message(loans[1].id_.bytes)),
+            (loans[0].id_, destination_wallet_keypair.sign_message(loans[0].id_.bytes)),
+            (LoanId(uuid.uuid4()), destination_wallet_keypair.sign_message(loans[0].id_.bytes)),
+        ])
+
+        assert isinstance(submit_results[0], SubmittedUserLoan)
+        assert [r.error for r in submit_results[1:] if isinstance(r, FailedUserLoan)] == [
+            "provided signature is invalid",
+            "loan is not pending",
+            "loan was not found",
+        ]
+        assert await token_repo.get_account_amount(wallet) == self.AMOUNTS[0]
+
+
+class _StubLoanRepository:
+    def __init__(self, loan: LoanItem, status_age: float = 0.0) -> None:
+        self.loan = loan
+        self.status_age = status_age
+
+    @asynccontextmanager
+    async def use_transaction(self, loan_id: LoanId) -> t.AsyncIterator[None]:
+        yield
+
+    async def get_by_id(self, loan_id: LoanId) -> t.Optional[LoanItem]:
+        return self.loan if self.loan.id_ == loan_id else None
+
+    async def update_status(self, loan_id: LoanId, expected: LoanItem.Status, status: LoanItem.Status,
+                            signature: t.Optional[Signature] = None, unchanged_for: t.Optional[float] = None,
+                            last_valid_block_height: t.Optional[int] = None,
+                            changed_within: t.Optional[float] = None) -> t.Optional[LoanItem]:
+        if (
+                self.loan.id_ != loan_id
+                or self.loan.status is not expected
+                or unchanged_for is not None and self.status_age < unchanged_for
+                or changed_within is not None and self.status_age >= changed_within
+        ):
+            return None
+
+        self.loan = replace(self.loan, status=status, signature=signature,
+                            last_valid_block_height=last_valid_block_height)
+        self.status_age = 0.0
+        return self.loan
+
+    async def update_status_many(self, loan_ids: t.Collection[LoanId], expected: LoanItem.Status,
+                                 status: LoanItem.Status, unchanged_for: t.Optional[float] = None,
+                                 changed_within: t.Optional[float] = None) -> t.Sequence[LoanItem]:
+        updated_loans = [
+            await self.update_status(loan_id, expected, status, unchanged_for=unchanged_for,
+                                     changed_within=changed_within)
+            for loan_id in loan_ids
+        ]
+
+        return [loan for loan in updated_loans if loan is not None]
+
+
+class _StubJobQueueRepository:
+    def __init__(self) -> None:
+        self.loan_ids: t.List[LoanId] = []
+
+    async def create(self, loan_id: LoanId) -> None:
+        self.loan_ids.append(loan_id)
+
+
+class _StubSourceTokenRepository:
+    owner_pubkey = Keypair().pubkey()
+
+    def __init__(self, amount: int) -> None:
+        self.amount = amount
+
+    async def get_account_amount(self, wallet: object) -> t.Optional[Amount]:
+        return Amount(self.amount)
+
+
+@pytest.mark.asyncio
+class TestUserLendingCaseWithJobQueue:
+    async def test_reservation_is_settled_when_transfer_job_is_queued(self) -> None:
+        wallet = Keypair()
+        token_repo = _StubSourceTokenRepository(100)
+        ledger = SourceBalanceLedger(t.cast(TokenRepository, token_repo), refresh_interval=0.0, reservation_ttl=900.0)
+        loan_repo = _StubLoanRepository(
+            LoanItem(LoanId(uuid.uuid4()), LoanItem.Status.PENDING, wallet.pubkey(), Amount(30)),
+        )
+        job_repo = _StubJobQueueRepository()
+        executor = UserLendingCase(
+            t.cast(LoanRepository, loan_repo),
+            ledger,
+            t.cast(LoanTransferCase, None),
+            t.cast(LoanTransferPipeline, None),
+            t.cast(TransferJobRepository, job_repo),
+        )
+
+        assert await ledger.get_available_amount() == 100
+        ledger.reserve(loan_repo.loan.id_, loan_repo.loan.amount)
+
+        result = await executor.submit_in_background(loan_repo.loan.id_, wallet.sign_message(loan_repo.loan.id_.bytes))
+
+        assert isinstance(result, SubmittedUserLoan)
+        assert job_repo.loan_ids == [loan_repo.loan.id_]
+        assert await ledger.get_available_amount() == 70
+
+        # worker has transferred the tokens, refreshed balance must not be reduced by the reservation once again
+        token_repo.amount = 70
+        await asyncio.sleep(0)
+        assert await ledger.get_available_amount() == 70
+
+
+@pytest.mark.asyncio
+class TestUserLendingCaseExpiration:
+    @staticmethod
+    def create_case(status_age: float) -> t.Tuple[UserLendingCase, SourceBalanceLedger, _StubLoanRepository]:
+        token_repo = _StubSourceTokenRepository(100)
+        ledger = SourceBalanceLedger(t.cast(TokenRepository, token_repo), refresh_interval=0.0, reservation_ttl=900.0)
+        loan_repo = _StubLoanRepository(
+            LoanItem(LoanId(uuid.uuid4()), LoanItem.Status.PENDING, Keypair().pubkey(), Amount(30)),
+            status_age=status_age,
+        )
+        job_repo = _StubJobQueueRepository()
+        executor = UserLendingCase(
+            t.cast(LoanRepository, loan_repo),
+            ledger,
+            t.cast(LoanTransferCase, None),
+            t.cast(LoanTransferPipeline, None),
+            t.cast(TransferJobRepository, job_repo),
+            loan_ttl=900.0,
+        )
+
+        return executor, ledger, loan_repo
+
+    async def test_expired_loan_is_not_submitted(self) -> None:
+        wallet = Keypair()
+        executor, ledger, loan_repo = self.create_case(status_age=901.0)
+        loan_repo.loan = replace(loan_repo.loan, wallet=wallet.pubkey())
+
+        assert await ledger.get_available_amount() == 100
+        ledger.reserve(loan_repo.loan.id_, loan_repo.loan.amount)
+
+        result = await executor.submit_in_background(loan_repo.loan.id_, wallet.sign_message(loan_repo.loan.id_.bytes))
+
+        assert result == FailedUserLoan("loan has expired")
+        assert loan_repo.loan.status is LoanItem.Status.FAILED
+        assert await ledger.get_available_amount() == 100
+
+    async def test_loan_is_submitted_before_expiration(self) -> None:
+        wallet = Keypair()
+        executor, _, loan_repo = self.create_case(status_age=899.0)
+        loan_repo.loan = replace(loan_repo.loan, wallet=wallet.pubkey())
+
+        result = await executor.submit_in_background(loan_repo.loan.id_, wallet.sign_message(loan_repo.loan.id_.bytes))
+
+        assert isinstance(result, SubmittedUserLoan)
+        assert result.item.status is LoanItem.Status.TRANSFERRING
+
+
+class _StubUnknownTransferTokenRepository(_StubSourceTokenRepository):
+    transfer_commitment = Finalized
+
+    def __init__(self, amount: int, sent: SentTransaction) -> None:
+        super().__init__(amount)
+        self.sent = sent
+
+    async def transfer(
+            self,
+            wallet: Pubkey,
+            amount: Amount,
+            on_sent: t.Optional[SentTransferCallback] = None,
+    ) -> t.Optional[bool]:
+        if on_sent is not None:
+            await on_sent(self.sent)
+
+        # transaction status was not received in time
+        return None
+
+
+@pytest.mark.asyncio
+class TestLoanTransferCase:
+    async def test_loan_with_unknown_transfer_result_stays_transferring(self) -> None:
+        sent = SentTransaction(Signature.new_unique(), last_valid_block_height=1_000)
+        token_repo = _StubUnknownTransferTokenRepository(100, sent)
+        ledger = SourceBalanceLedger(t.cast(TokenRepository, token_repo), refresh_interval=0.0, reservation_ttl=900.0)
+        loan_repo = _StubLoanRepository(
+            LoanItem(LoanId(uuid.uuid4()), LoanItem.Status.TRANSFERRING, Keypair().pubkey(), Amount(30)),
+        )
+        case = LoanTransferCase(t.cast(TokenRepository, token_repo), t.cast(LoanRepository, loan_repo), ledger)
+
+        assert await ledger.get_available_amount() == 100
+        ledger.reserve(loan_repo.loan.id_, loan_repo.loan.amount)
+
+        result = await case.perform(loan_repo.loan)
+
+        assert isinstance(result, SubmittedUserLoan)
+        assert result.item == loan_repo.loan == replace(result.item, status=LoanItem.Status.TRANSFERRING,
+                                                        signature=sent.signature, last_valid_block_height=1_000)
+        # the transfer still may land, so the amount stays reserved
+        assert await ledger.get_available_amount() == 70
+
+
+class _StubLoanTransferCase:
+    def __init__(self, concurrency_limit: int) -> None:
+        self.concurrency_limit = concurrency_limit
+        self.performed: t.List[LoanItem] = []
+        self.max_concurrency = 0
+        self.__active = 0
+
+    async def perform(self, loan: LoanItem) -> SubmittedUserLoanResult:
+        self.__active += 1
+        self.max_concurrency = max(self.max_concurrency, self.__active)
+
+        try:
+            await asyncio.sleep(0.01)
+            if loan.amount == 0:
+                raise RuntimeError("transfer failed")
+
+            self.performed.append(loan)
+            return SubmittedUserLoan(loan)
+
+        finally:
+            self.__active -= 1
+
+
+@pytest.mark.asyncio
+class TestLoanTransferPipeline:
+    @pytest.fixture()
+    def case(self) -> _StubLoanTransferCase:
+        return _StubLoanTransferCase(concurrency_limit=3)
+
+    @pytest.fixture()
+    def pipeline(self, case: _StubLoanTransferCase) -> LoanTransferPipeline:
+        async def get_case() -> LoanTransferCase:
+            return t.cast(LoanTransferCase, case)
+
+        return LoanTransferPipeline(get_case, case.concurrency_limit)
+
+    @staticmethod
+    def create_loan(amount: int) -> LoanItem:
+        return LoanItem(LoanId(uuid.uuid4()), LoanItem.Status.TRANSFERRING, Keypair().pubkey(), Amount(amount))
+
+    async def test_all_scheduled_loans_are_performed_with_limited_concurrency(
+            self,
+            pipeline: LoanTransferPipeline,
+            case: _StubLoanTransferCase,
+    ) -> None:
+        loans = [self.create_loan(i + 1) for i in range(10)]
+
+        for loan in loans:
+            pipeline.schedule(loan)
+
+        await pipeline.close()
+
+        assert sorted(loan.amount for loan in case.performed) == [loan.amount for loan in loans]
+        assert case.max_concurrency == case.concurrency_limit
+
+    async def test_failed_loan_does_not_stop_the_pipeline(
+            self,
+            pipeline: LoanTransferPipeline,
+            case: _StubLoanTransferCase,
+    ) -> None:
+        pipeline.schedule(self.create_loan(0))
+        pipeline.schedule(self.create_loan(1))
+
+        await pipeline.join()
+
+        assert [loan.amount for loan in case.performed] == [1]
+
+        await pipeline.close()
+
+
+class _StubTransferJobRepository:
+    def __init__(self, jobs: t.Sequence[TransferJobItem]) -> None:
+        self.queued = list(jobs)
+
+    async def claim(self, limit: int, visibility_timeout: float) -> t.Sequence[TransferJobItem]:
+        claimed, self.queued = self.queued[:limit], self.queued[limit:]
+        return claimed
+
+    async def set_signature(self, job_id: TransferJobId, signature: Signature, last_valid_block_height: int) -> None:
+        pass
+
+    async def retry(self, job_id: TransferJobId, delay: float, error: t.Optional[str] = None) -> TransferJobItem:
+        job = next(job for job in self.queued if job.id_ == job_id)
+        return replace(job, status=TransferJobItem.Status.QUEUED)
+
+    async def finish(self, job_id: TransferJobId, status: TransferJobItem.Status,
+                     error: t.Optional[str] = None) -> TransferJobItem:
+        job = next(job for job in self.queued if job.id_ == job_id)
+        return replace(job, status=status)
+
+
+class _StubTransferJobCase:
+    def __init__(self, concurrency_limit: int) -> None:
+        self.concurrency_limit = concurrency_limit
+        self.performed: t.List[TransferJobItem] = []
+        self.max_concurrency = 0
+        self.__active = 0
+
+    async def perform(self, job: TransferJobItem) -> TransferJobItem:
+        self.__active += 1
+        self.max_concurrency = max(self.max_concurrency, self.__active)
+
+        try:
+            await asyncio.sleep(0.01)
+            self.performed.append(job)
+            return job
+
+        finally:
+            self.__active -= 1
+
+
+@pytest.mark.asyncio
+class TestTransferJobWorker:
+    async def test_claimed_jobs_are_performed_with_limited_concurrency(self) -> None:
+        jobs = [
+            TransferJobItem(TransferJobId(uuid.uuid4()), LoanId(uuid.uuid4()), TransferJobItem.Status.RUNNING, 1, None)
+            for _ in range(10)
+        ]
+        repo = _StubTransferJobRepository(jobs)
+        case = _StubTransferJobCase(concurrency_limit=3)
+        worker = TransferJobWorker(
+            job_repository=t.cast(TransferJobRepository, repo),
+            case=t.cast(TransferJobCase, case),
+            concurrency=case.concurrency_limit,
+            poll_interval=0.01,
+            visibility_timeout=60.0,
+        )
+
+        run_task = asyncio.create_task(worker.run())
+        while repo.queued or len(case.performed) < len(jobs):
+            await asyncio.sleep(0.01)
+
+        worker.stop()
+        await run_task
+
+        assert {job.id_ for job in case.performed} == {job.id_ for job in jobs}
+        assert case.max_concurrency == case.concurrency_limit
+
+
+class _StubUnknownSignatureTokenRepository(_StubSourceTokenRepository):
+    """Solana doesn't know any sent transaction: it's pending until its blockhash expires at `block_height`."""
+
+    transfer_commitment = Finalized
+
+    def __init__(self, block_height: int) -> None:
+        super().__init__(100)
+        self.block_height = block_height
+        self.transfers = 0
+
+    async def get_transfer_result(
+            self,
+            signature: Signature,
+            commitment: Commitment = Finalized,
+            last_valid_block_height: t.Optional[int] = None,
+    ) -> t.Optional[bool]:
+        if last_valid_block_height is not None and self.block_height <= last_valid_block_height:
+            return None
+
+        return False
+
+    async def transfer(
+            self,
+            wallet: Pubkey,
+            amount: Amount,
+            on_sent: t.Optional[SentTransferCallback] = None,
+    ) -> t.Optional[bool]:
+        self.transfers += 1
+        return True
+
+
+@pytest.mark.asyncio
+class TestTransferJobCase:
+    @staticmethod
+    def create_case(
+            token_repo: _StubUnknownSignatureTokenRepository,
+    ) -> t.Tuple[TransferJobCase, TransferJobItem, _StubLoanRepository]:
+        loan_repo = _StubLoanRepository(
+            LoanItem(LoanId(uuid.uuid4()), LoanItem.Status.TRANSFERRING, Keypair().pubkey(), Amount(1)),
+        )
+        job = TransferJobItem(TransferJobId(uuid.uuid4()), loan_repo.loan.id_, TransferJobItem.Status.RUNNING, 2,
+                              Signature.new_unique(), last_valid_block_height=1_000)
+        case = TransferJobCase(
+            t.cast(TokenRepository, token_repo),
+            t.cast(LoanRepository, loan_repo),
+            t.cast(TransferJobRepository, _StubTransferJobRepository([job])),
+            max_attempts=5,
+            retry_delay=1.0,
+            retry_max_delay=10.0,
+        )
+
+        return case, job, loan_repo
+
+    async def test_unknown_transfer_is_not_resent_while_blockhash_is_valid(self) -> None:
+        token_repo = _StubUnknownSignatureTokenRepository(block_height=1_000)
+        case, job, loan_repo = self.create_case(token_repo)
+
+        assert (await case.perform(job)).status is TransferJobItem.Status.QUEUED
+        assert token_repo.transfers == 0
+        assert loan_repo.loan.status is LoanItem.Status.TRANSFERRING
+
+    async def test_unknown_transfer_is_resent_after_blockhash_expiration(self) -> None:
+        token_repo = _StubUnknownSignatureTokenRepository(block_height=1_001)
+        case, job, loan_repo = self.create_case(token_repo)
+
+        assert (await case.perform(job)).status is TransferJobItem.Status.SUCCEEDED
+        assert token_repo.transfers == 1
+        assert loan_repo.loan.status is LoanItem.Status.ACTIVE
+
+
+class _StubTransferResultTokenRepository:
+    def __init__(self, results: t.Mapping[Signature, t.Optional[bool]]) -> None:
+        self.results = results
+
+    async def get_transfer_results(
+            self,
+            signatures: t.Sequence[Signature],
+            commitment: Commitment = Finalized,
+            last_valid_block_heights: t.Optional[t.Sequence[t.Optional[int]]] = None,
+    ) -> t.Sequence[t.Optional[bool]]:
+        return [self.results[signature] for signature in signatures]
+
+    async def get_account_amount(self, wallet: object) -> t.Optional[Amount]:
+        return Amount(100)
+
+
+@pytest.mark.usefixtures("clean_database")
+@pytest.mark.asyncio
+class TestLoanFinalizationCase:
+    @pytest_asyncio.fixture()
+    async def loan_repo(self, container: Container) -> LoanRepository:
+        return await container.loan_repository()  # type: ignore[no-any-return,misc]
+
+    @staticmethod
+    def create_case(
+            token_repo: _StubTransferResultTokenRepository,
+            loan_repo: LoanRepository,
+            rollback_after: float,
+            batch_size: int = 256,
+    ) -> t.Tuple[LoanFinalizationCase, SourceBalanceLedger]:
+        ledger = SourceBalanceLedger(t.cast(TokenRepository, token_repo), refresh_interval=0.0, reservation_ttl=900.0)
+        case = LoanFinalizationCase(t.cast(TokenRepository, token_repo), loan_repo, ledger, rollback_after, batch_size)
+
+        return case, ledger
+
+    @staticmethod
+    async def create_sent_loan(loan_repo: LoanRepository, signature: Signature) -> LoanItem:
+        loan = await loan_repo.create(LoanItem.Status.TRANSFERRING, Keypair().pubkey(), Amount(1))
+        sent_loan = await loan_repo.update_status(loan.id_, LoanItem.Status.TRANSFERRING,
+                                                  LoanItem.Status.TRANSFERRING, signature,
+                                                  last_valid_block_height=1_000)
+        assert sent_loan is not None
+
+        return sent_loan
+
+    @staticmethod
+    async def create_confirmed_loan(loan_repo: LoanRepository, signature: Signature) -> LoanItem:
+        loan = await loan_repo.create(LoanItem.Status.TRANSFERRING, Keypair().pubkey(), Amount(1))
+        confirmed_loan = await loan_repo.update_status(loan.id_, LoanItem.Status.TRANSFERRING,
+                                                       LoanItem.Status.CONFIRMED, signature)
+        assert confirmed_loan is not None
+
+        return confirmed_loan
+
+    async def test_confirmed_loans_are_finished(self, loan_repo: LoanRepository) -> None:
+        finalized, failed, unknown = (Signature.new_unique() for _ in range(3))
+        finalized_loan = await self.create_confirmed_loan(loan_repo, finalized)
+        failed_loan = await self.create_confirmed_loan(loan_repo, failed)
+        unknown_loan = await self.create_confirmed_loan(loan_repo, unknown)
+
+        token_repo = _StubTransferResultTokenRepository({finalized: True, failed: False, unknown: None})
+        case, _ = self.create_case(token_repo, loan_repo, rollback_after=0.0, batch_size=2)
+
+        assert await case.perform() == 2
+
+        assert [await loan_repo.get_by_id(loan.id_) for loan in (finalized_loan, failed_loan, unknown_loan)] == [
+            replace(finalized_loan, status=LoanItem.Status.ACTIVE),
+            replace(failed_loan, status=LoanItem.Status.FAILED),
+            unknown_loan,
+        ]
+
+    async def test_dropped_transfer_is_not_rolled_back_too_early(self, loan_repo: LoanRepository) -> None:
+        signature = Signature.new_unique()
+        loan = await self.create_confirmed_loan(loan_repo, signature)
+
+        token_repo = _StubTransferResultTokenRepository({signature: False})
+        case, _ = self.create_case(token_repo, loan_repo, rollback_after=60.0)
+
+        assert await case.perform() == 0
+        assert await loan_repo.get_by_id(loan.id_) == loan
+
+    async def test_sent_transferring_loans_are_settled(self, loan_repo: LoanRepository) -> None:
+        finalized, dropped, pending = (Signature.new_unique() for _ in range(3))
+        finalized_loan = await self.create_sent_loan(loan_repo, finalized)
+        dropped_loan = await self.create_sent_loan(loan_repo, dropped)
+        pending_loan = await self.create_sent_loan(loan_repo, pending)
+
+        token_repo = _StubTransferResultTokenRepository({finalized: True, dropped: False, pending: None})
+        case, ledger = self.create_case(token_repo, loan_repo, rollback_after=0.0)
+        assert await ledger.get_available_amount() == 100
+        for loan in (finalized_loan, dropped_loan, pending_loan):
+            ledger.reserve(loan.id_, loan.amount)
+
+        assert await case.perform() == 2
+
+        assert [await loan_repo.get_by_id(loan.id_) for loan in (finalized_loan, dropped_loan, pending_loan)] == [
+            replace(finalized_loan, status=LoanItem.Status.ACTIVE),
+            replace(dropped_loan, status=LoanItem.Status.FAILED),
+            pending_loan,
+        ]
+        # the finalized amount is spent, the dropped one is available again, the pending one is still reserved
+        assert await ledger.get_available_amount() == 98
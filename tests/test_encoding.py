@@ -0,0 +1,36 @@
+import typing as t
+import uuid
+
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from solders.keypair import Keypair
+from solders.signature import Signature
+
+from spl_token_lending.api.data import ItemsViewObject, LoanObject
+from spl_token_lending.api.encoding import encode_loan_records_view
+from spl_token_lending.domain.data import ItemsView
+from spl_token_lending.repository.data import Amount, LoanId, LoanItem, LoanRecord
+
+
+class TestEncoding:
+    @pytest.mark.asyncio
+    async def test_loan_records_view_matches_response_model(self) -> None:
+        wallet = Keypair().pubkey()
+        loans = [
+            LoanItem(LoanId(uuid.uuid4()), status, wallet, Amount(i), Signature.default() if i % 2 else None,
+                     i * 100 if i % 3 else None)
+            for i, status in enumerate(LoanItem.Status)
+        ]
+        records = [
+            LoanRecord(loan.id_, loan.status, str(loan.wallet), loan.amount,
+                       str(loan.signature) if loan.signature is not None else None, loan.last_valid_block_height)
+            for loan in loans
+        ]
+        info = ItemsView.Info(offset=0, limit=10, total=None, next_cursor="cursor")
+
+        field = create_response_field(name="response", type_=ItemsViewObject[LoanObject])
+        expected = await serialize_response(field=field, response_content=ItemsView(info, loans))
+
+        assert encode_loan_records_view(ItemsView(info, records)) == JSONResponse(expected).body
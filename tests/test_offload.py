@@ -0,0 +1,35 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from spl_token_lending.offload import CpuOffloader
+
+
+def _square(value: int) -> int:
+    return value * value
+
+
+@pytest.mark.asyncio
+class TestCpuOffloader:
+    async def test_results_of_chunks_are_returned_in_order(self) -> None:
+        offloader = CpuOffloader(ProcessPoolExecutor(2), min_batch_size=4, chunk_size=3)
+
+        try:
+            assert await offloader.map(_square, list(range(10))) == [v * v for v in range(10)]
+
+        finally:
+            offloader.close()
+
+    async def test_small_batch_is_processed_inline(self) -> None:
+        offloader = CpuOffloader(ThreadPoolExecutor(1), min_batch_size=4)
+
+        def get_thread(_: int) -> int:
+            return threading.get_ident()
+
+        try:
+            assert await offloader.map(get_thread, [1, 2, 3]) == [threading.get_ident()] * 3
+            assert threading.get_ident() not in await offloader.map(get_thread, [1, 2, 3, 4])
+
+        finally:
+            offloader.close()
@@ -1,13 +1,53 @@
+import asyncio
+import json
+import typing as t
+import uuid
 from dataclasses import replace
 
+import httpx
 import pytest
 import pytest_asyncio
 from _pytest.fixtures import SubRequest
+from solana.exceptions import SolanaRpcException
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.commitment import Commitment, Finalized
+from solders.hash import Hash
+from solders.keypair import Keypair
 from solders.pubkey import Pubkey
+from solders.rpc.responses import (
+    GetBlockHeightResp,
+    GetLatestBlockhashResp,
+    GetSignatureStatusesResp,
+    RpcBlockhash,
+    RpcResponseContext,
+    SendTransactionResp,
+)
+from solders.signature import Signature
+from solders.transaction import Transaction
+from solders.transaction_status import TransactionConfirmationStatus, TransactionStatus
 
 from spl_token_lending.container import Container
-from spl_token_lending.repository.data import Amount, LoanFilterOptions, LoanItem, PaginationOptions
+from spl_token_lending.repository.balance import SourceBalanceLedger
+from spl_token_lending.repository.blockhash import RecentBlockhashProvider
+from spl_token_lending.repository.cache import ExpiringLRUCache
+from spl_token_lending.repository.confirmation import (
+    BatchedSignatureStatusPoller,
+    SignatureWaiter,
+    WebsocketSignatureWaiter,
+)
+from spl_token_lending.repository.data import (
+    Amount, LoanFilterOptions, LoanId, LoanItem, LoanRecord, PaginationOptions,
+    TotalCountMode, TransferJobItem, WalletDebtItem,
+)
+from spl_token_lending.repository.debt import WalletDebtRepository
+from spl_token_lending.repository.job import TransferJobRepository
 from spl_token_lending.repository.loan import LoanRepository
+from spl_token_lending.repository.ratelimit import RpcRateLimiter, TokenBucket
+from spl_token_lending.repository.rpc import PooledAsyncClient, RpcEndpoint, RpcPoolOptions
+from spl_token_lending.repository.simulation import SimulatedLedger, SimulatedSolanaTransport, SimulationOptions
+from spl_token_lending.repository.token import TokenRepository, TokenRepositoryFactory
+from spl_token_lending.repository.transfer import SentTransaction, TokenTransferBatcher, TransferBatchOptions
+from spl_token_lending.repository.wallet import WalletRepository
 
 
 @pytest.mark.usefixtures("clean_database")
@@ -62,6 +102,45 @@ class TestLoanRepository:
 
         assert count_after == count_before + 1
 
+    async def test_created_many_are_returned_in_order_of_values(self, repo: LoanRepository) -> None:
+        values = [(LoanId(uuid.uuid4()), wallet, amount) for _, wallet, amount in self.ITEM_VALUES]
+
+        created_items = await repo.create_many(LoanItem.Status.PENDING, values)
+
+        assert created_items == [
+            LoanItem(id_=id_, status=LoanItem.Status.PENDING, wallet=wallet, amount=amount)
+            for id_, wallet, amount in values
+        ]
+        assert [await repo.get_by_id(id_) for id_, _, _ in values] == created_items
+
+    async def test_status_of_many_is_changed_only_for_expected_status(self, repo: LoanRepository) -> None:
+        created_items = [await repo.create(status, wallet, amount) for status, wallet, amount in self.ITEM_VALUES]
+        loan_ids = [item.id_ for item in created_items]
+
+        updated_items = await repo.update_status_many(loan_ids, LoanItem.Status.PENDING, LoanItem.Status.TRANSFERRING)
+
+        assert [item.id_ for item in updated_items] == [created_items[0].id_]
+        assert await repo.get_by_ids([*loan_ids, LoanId(uuid.uuid4())]) == {
+            updated_items[0].id_: updated_items[0],
+            **{item.id_: item for item in created_items[1:]},
+        }
+
+    async def test_status_is_changed_only_within_age_limits(self, repo: LoanRepository) -> None:
+        loan = await repo.create(LoanItem.Status.PENDING, Keypair().pubkey(), Amount(1))
+
+        assert await repo.update_status(loan.id_, loan.status, LoanItem.Status.FAILED, unchanged_for=60.0) is None
+        assert await repo.update_status_many([loan.id_], loan.status, LoanItem.Status.FAILED, unchanged_for=60.0) == []
+        assert await repo.update_status(loan.id_, loan.status, LoanItem.Status.TRANSFERRING,
+                                        changed_within=60.0) == replace(loan, status=LoanItem.Status.TRANSFERRING)
+
+    async def test_found_with_status_age_have_expected_statuses(self, repo: LoanRepository) -> None:
+        created_items = [await repo.create(status, wallet, amount) for status, wallet, amount in self.ITEM_VALUES]
+
+        found = await repo.find_with_status_age([LoanItem.Status.PENDING, LoanItem.Status.CLOSED])
+
+        assert [item for item, _ in found] == sorted([created_items[0], created_items[2]], key=lambda item: item.id_)
+        assert all(0.0 <= age < 60.0 for _, age in found)
+
     async def test_created_can_be_get_by_id(
             self,
             repo: LoanRepository,
@@ -86,13 +165,731 @@ class TestLoanRepository:
 
         assert actual_updated == expected_updated
 
-# TODO: implement tests for token repo
-# @pytest.mark.asyncio
-# class TestTokenRepository:
-#     @pytest_asyncio.fixture()
-#     async def repo(self, container: Container) -> LoanRepository:
-#         return await container.token_repository()
-#
-#     async def test_get_amount_of_existing_account(self, repo: TokenRepository) -> None:
-#         amount = await repo.get_amount()
-#         await
+    async def test_pages_found_by_cursor_contain_all_items_once(self, repo: LoanRepository) -> None:
+        created_items = [await repo.create(*values) for values in self.ITEM_VALUES * 3]
+
+        found_items: t.List[LoanItem] = []
+        pagination = PaginationOptions(limit=2)
+        while True:
+            page = await repo.find(pagination=pagination)
+            found_items.extend(page)
+            if len(page) < pagination.limit:
+                break
+
+            pagination = replace(pagination, after=repo.encode_cursor(page[-1]))
+
+        assert sorted(item.id_ for item in found_items) == sorted(item.id_ for item in created_items)
+        assert len(found_items) == len(created_items)
+
+    async def test_found_with_total_matches_find_and_count(self, repo: LoanRepository, created_loan: LoanItem) -> None:
+        filter_ = LoanFilterOptions(status_equals=created_loan.status)
+        pagination = PaginationOptions(limit=1)
+
+        items, total = await repo.find_with_total(filter_, pagination)
+
+        assert items == await repo.find(filter_, pagination)
+        assert total == await repo.count(filter_)
+
+    async def test_found_records_match_found_items(self, repo: LoanRepository, created_loan: LoanItem) -> None:
+        records, records_total = await repo.find_records_with_total()
+        items, items_total = await repo.find_with_total()
+
+        assert records_total == items_total
+        assert [
+            LoanRecord(item.id_, item.status, str(item.wallet), item.amount,
+                       str(item.signature) if item.signature is not None else None, item.last_valid_block_height)
+            for item in items
+        ] == records
+
+    async def test_total_is_received_for_empty_page(self, repo: LoanRepository, created_loan: LoanItem) -> None:
+        items, total = await repo.find_with_total(pagination=PaginationOptions(offset=10))
+
+        assert items == []
+        assert total == 1
+
+    async def test_total_is_not_counted_in_none_mode(self, repo: LoanRepository, created_loan: LoanItem) -> None:
+        items, total = await repo.find_with_total(total_mode=TotalCountMode.NONE)
+
+        assert items == [created_loan, ]
+        assert total is None
+
+    async def test_iterated_batches_contain_all_found_records(self, repo: LoanRepository) -> None:
+        for status, wallet, amount in self.ITEM_VALUES:
+            await repo.create(status, wallet, amount)
+
+        batches = [batch async for batch in repo.iterate(batch_size=2)]
+        records, _ = await repo.find_records_with_total()
+
+        assert [len(batch) for batch in batches] == [2, 1]
+        assert [record for batch in batches for record in batch] == records
+
+    async def test_find_fails_with_invalid_cursor(self, repo: LoanRepository) -> None:
+        with pytest.raises(ValueError):
+            await repo.find(pagination=PaginationOptions(after="not a cursor"))
+
+
+@pytest.mark.usefixtures("clean_database")
+@pytest.mark.asyncio
+class TestWalletDebtRepository:
+    WALLET = Pubkey.from_string("Dk5tmjFgGxqF8XbGvBwjJ4Unr1aStCQSQeED6nS8b6ab")
+
+    @pytest_asyncio.fixture()
+    async def loan_repo(self, container: Container) -> LoanRepository:
+        return await container.loan_repository()  # type: ignore[no-any-return,misc]
+
+    @pytest_asyncio.fixture()
+    async def repo(self, container: Container) -> WalletDebtRepository:
+        return await container.wallet_debt_repository()  # type: ignore[no-any-return,misc]
+
+    async def test_debt_is_updated_on_loan_status_changes(
+            self,
+            repo: WalletDebtRepository,
+            loan_repo: LoanRepository,
+    ) -> None:
+        active_loan = await loan_repo.create(LoanItem.Status.ACTIVE, self.WALLET, Amount(17))
+        pending_loan = await loan_repo.create(LoanItem.Status.PENDING, self.WALLET, Amount(31))
+
+        assert await repo.get(self.WALLET) == WalletDebtItem(self.WALLET, Amount(17), 1)
+
+        await loan_repo.update_status(pending_loan.id_, LoanItem.Status.PENDING, LoanItem.Status.ACTIVE)
+        assert await repo.get(self.WALLET) == WalletDebtItem(self.WALLET, Amount(48), 2)
+
+        await loan_repo.update_existing_by_id(replace(active_loan, status=LoanItem.Status.CLOSED))
+        assert await repo.get(self.WALLET) == WalletDebtItem(self.WALLET, Amount(31), 1)
+
+    async def test_rebuilt_debts_match_maintained_debts(
+            self,
+            repo: WalletDebtRepository,
+            loan_repo: LoanRepository,
+    ) -> None:
+        for status, wallet, amount in TestLoanRepository.ITEM_VALUES * 2:
+            await loan_repo.create(LoanItem.Status.ACTIVE, wallet, amount)
+
+        maintained_debts = await repo.find_top(10)
+        wallets = await repo.rebuild()
+
+        assert await repo.find_top(10) == maintained_debts
+        assert wallets == len(TestLoanRepository.ITEM_VALUES)
+        expected_amounts = sorted((amount * 2 for _, _, amount in TestLoanRepository.ITEM_VALUES), reverse=True)
+        assert [debt.amount for debt in maintained_debts] == expected_amounts
+
+
+@pytest.mark.usefixtures("clean_database")
+@pytest.mark.asyncio
+class TestTransferJobRepository:
+    @pytest_asyncio.fixture()
+    async def loan_repo(self, container: Container) -> LoanRepository:
+        return await container.loan_repository()  # type: ignore[no-any-return,misc]
+
+    @pytest_asyncio.fixture()
+    async def repo(self, container: Container) -> TransferJobRepository:
+        return await container.transfer_job_repository()  # type: ignore[no-any-return,misc]
+
+    @pytest_asyncio.fixture()
+    async def created_job(self, repo: TransferJobRepository, loan_repo: LoanRepository) -> TransferJobItem:
+        loan = await loan_repo.create(LoanItem.Status.TRANSFERRING, Pubkey.new_unique(), Amount(1))
+
+        return await repo.create(loan.id_)
+
+    async def test_claimed_job_is_not_claimed_again_within_visibility_timeout(
+            self,
+            repo: TransferJobRepository,
+            created_job: TransferJobItem,
+    ) -> None:
+        claimed_jobs = await repo.claim(10, visibility_timeout=60.0)
+
+        assert [(job.id_, job.status, job.attempts) for job in claimed_jobs] == [
+            (created_job.id_, TransferJobItem.Status.RUNNING, 1),
+        ]
+        assert await repo.claim(10, visibility_timeout=60.0) == []
+
+    async def test_job_is_claimed_again_after_visibility_timeout(
+            self,
+            repo: TransferJobRepository,
+            created_job: TransferJobItem,
+    ) -> None:
+        await repo.claim(10, visibility_timeout=0.0)
+        reclaimed_jobs = await repo.claim(10, visibility_timeout=60.0)
+
+        assert [(job.id_, job.attempts) for job in reclaimed_jobs] == [(created_job.id_, 2)]
+
+    async def test_retried_job_is_claimed_after_delay(
+            self,
+            repo: TransferJobRepository,
+            created_job: TransferJobItem,
+    ) -> None:
+        await repo.claim(10, visibility_timeout=60.0)
+
+        await repo.retry(created_job.id_, delay=60.0, error="transfer failed")
+        assert await repo.claim(10, visibility_timeout=60.0) == []
+
+        await repo.retry(created_job.id_, delay=0.0, error="transfer failed")
+        assert [job.id_ for job in await repo.claim(10, visibility_timeout=60.0)] == [created_job.id_]
+
+    async def test_finished_job_is_not_claimed(
+            self,
+            repo: TransferJobRepository,
+            created_job: TransferJobItem,
+    ) -> None:
+        await repo.finish(created_job.id_, TransferJobItem.Status.SUCCEEDED)
+
+        assert await repo.claim(10, visibility_timeout=0.0) == []
+
+
+class TestExpiringLRUCache:
+    @pytest.fixture()
+    def clock(self) -> t.List[float]:
+        return [0.0]
+
+    @pytest.fixture()
+    def cache(self, clock: t.List[float]) -> ExpiringLRUCache[str, int]:
+        return ExpiringLRUCache(max_size=2, ttl=10.0, clock=lambda: clock[0])
+
+    def test_put_value_can_be_get(self, cache: ExpiringLRUCache[str, int]) -> None:
+        cache.put("a", 1)
+
+        assert cache.get("a") == 1
+        assert "a" in cache
+
+    def test_value_expires_after_ttl(self, cache: ExpiringLRUCache[str, int], clock: t.List[float]) -> None:
+        cache.put("a", 1)
+        clock[0] += 10.0
+
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_value_is_evicted(self, cache: ExpiringLRUCache[str, int]) -> None:
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_popped_value_is_removed(self, cache: ExpiringLRUCache[str, int]) -> None:
+        cache.put("a", 1)
+
+        assert cache.pop("a") == 1
+        assert cache.get("a") is None
+
+
+@pytest.mark.asyncio
+class TestSourceBalanceLedger:
+    class _StubTokenRepository:
+        owner_pubkey = Pubkey.default()
+
+        def __init__(self, amount: int) -> None:
+            self.amount = amount
+            self.calls = 0
+
+        async def get_account_amount(self, wallet: Pubkey) -> t.Optional[Amount]:
+            self.calls += 1
+            return Amount(self.amount)
+
+    @pytest.fixture()
+    def token_repo(self) -> "TestSourceBalanceLedger._StubTokenRepository":
+        return self._StubTokenRepository(100)
+
+    @pytest.fixture()
+    def ledger(self, token_repo: "TestSourceBalanceLedger._StubTokenRepository") -> SourceBalanceLedger:
+        return SourceBalanceLedger(t.cast(TokenRepository, token_repo), refresh_interval=60.0, reservation_ttl=60.0)
+
+    async def test_reserved_amount_is_not_available(self, ledger: SourceBalanceLedger) -> None:
+        assert await ledger.get_available_amount() == 100
+
+        ledger.reserve(LoanId(uuid.uuid4()), Amount(30))
+
+        assert await ledger.get_available_amount() == 70
+
+    async def test_released_amount_is_available_again(self, ledger: SourceBalanceLedger) -> None:
+        loan_id = LoanId(uuid.uuid4())
+        ledger.reserve(loan_id, Amount(30))
+        ledger.release(loan_id)
+
+        assert await ledger.get_available_amount() == 100
+
+    async def test_consumed_amount_is_removed_from_balance(self, ledger: SourceBalanceLedger) -> None:
+        loan_id = LoanId(uuid.uuid4())
+        ledger.reserve(loan_id, Amount(30))
+        await ledger.get_available_amount()
+        ledger.consume(loan_id, Amount(30))
+
+        assert await ledger.get_available_amount() == 70
+
+    async def test_balance_is_requested_once_within_refresh_interval(
+            self,
+            ledger: SourceBalanceLedger,
+            token_repo: "TestSourceBalanceLedger._StubTokenRepository",
+    ) -> None:
+        for _ in range(3):
+            await ledger.get_available_amount()
+
+        assert token_repo.calls == 1
+
+    async def test_reservation_expires_after_provided_ttl(
+            self,
+            token_repo: "TestSourceBalanceLedger._StubTokenRepository",
+    ) -> None:
+        now = 0.0
+        ledger = SourceBalanceLedger(t.cast(TokenRepository, token_repo), refresh_interval=60.0, reservation_ttl=60.0,
+                                     clock=lambda: now)
+        ledger.reserve(LoanId(uuid.uuid4()), Amount(30), ttl=10.0)
+        ledger.reserve(LoanId(uuid.uuid4()), Amount(20))
+
+        assert await ledger.get_available_amount() == 50
+
+        now = 10.0
+        assert await ledger.get_available_amount() == 80
+
+
+@pytest.mark.asyncio
+class TestPooledAsyncClient:
+    class _StubEndpoint:
+        def __init__(self, status_code: int = 200, delay: float = 0.0) -> None:
+            self.status_code = status_code
+            self.delay = delay
+            self.calls = 0
+
+        async def handle(self, request: httpx.Request) -> httpx.Response:
+            body = json.loads(request.content)
+            if body["method"] != "getBlockHeight":
+                return httpx.Response(200, json={"jsonrpc": "2.0", "id": body["id"], "result": 1})
+
+            self.calls += 1
+            await asyncio.sleep(self.delay)
+
+            return httpx.Response(self.status_code, json={"jsonrpc": "2.0", "id": body["id"], "result": 42})
+
+    @staticmethod
+    def create_client(endpoints: t.Mapping[str, "TestPooledAsyncClient._StubEndpoint"]) -> PooledAsyncClient:
+        async def handle(request: httpx.Request) -> httpx.Response:
+            return await endpoints[request.url.host].handle(request)
+
+        return PooledAsyncClient(
+            endpoints=[RpcEndpoint(f"http://{host}") for host in endpoints],
+            options=RpcPoolOptions(hedge_delay=0.05, cooldown=60.0),
+            # mock transport supports async handlers too
+            transport=httpx.MockTransport(handle),  # type: ignore[arg-type]
+        )
+
+    async def test_throttled_endpoint_is_taken_out_of_rotation(self) -> None:
+        throttled, ok = self._StubEndpoint(status_code=429), self._StubEndpoint()
+
+        async with self.create_client({"throttled": throttled, "ok": ok}) as client:
+            for _ in range(10):
+                assert (await client.get_block_height()).value == 42
+
+        assert throttled.calls <= 1
+        assert ok.calls == 10
+
+    async def test_slow_read_is_hedged(self) -> None:
+        slow, fast = self._StubEndpoint(delay=10.0), self._StubEndpoint()
+
+        async with self.create_client({"slow": slow, "fast": fast}) as client:
+            for _ in range(3):
+                assert (await asyncio.wait_for(client.get_block_height(), 1.0)).value == 42
+
+        assert fast.calls == 3
+
+    async def test_client_error_is_not_retried(self) -> None:
+        first, second = self._StubEndpoint(status_code=400), self._StubEndpoint(status_code=400)
+
+        async with self.create_client({"first": first, "second": second}) as client:
+            with pytest.raises(SolanaRpcException):
+                await client.get_block_height()
+
+        assert first.calls + second.calls == 1
+
+
+class TestTokenBucket:
+    def test_burst_is_allowed_then_rate_is_kept(self) -> None:
+        clock = [0.0]
+        bucket = TokenBucket(rate=10.0, burst=2.0, clock=lambda: clock[0])
+
+        assert [bucket.reserve() for _ in range(4)] == pytest.approx([0.0, 0.0, 0.1, 0.2])
+
+        clock[0] += 1.0
+
+        assert bucket.reserve() == 0.0
+
+
+@pytest.mark.asyncio
+class TestRpcRateLimiter:
+    @staticmethod
+    def throttled(retry_after: str) -> httpx.HTTPStatusError:
+        request = httpx.Request("POST", "http://rpc")
+        response = httpx.Response(429, headers={"Retry-After": retry_after}, request=request)
+
+        return httpx.HTTPStatusError("throttled", request=request, response=response)
+
+    async def test_throttled_request_pauses_other_requests(self) -> None:
+        limiter = RpcRateLimiter(rate=None)
+        calls: t.List[str] = []
+
+        async def call(name: str) -> str:
+            calls.append(name)
+            if calls == ["first"]:
+                raise self.throttled("0.1")
+
+            return name
+
+        first = asyncio.create_task(limiter.run(["getSlot"], lambda: call("first")))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(limiter.run(["getSlot"], lambda: call("second")))
+        await asyncio.sleep(0.05)
+
+        assert calls == ["first"]
+        assert list(await asyncio.gather(first, second)) == ["first", "second"]
+
+    async def test_throttled_request_is_raised_after_max_retries(self) -> None:
+        limiter = RpcRateLimiter(rate=None, max_retries=1)
+
+        async def call() -> str:
+            raise self.throttled("0")
+
+        with pytest.raises(httpx.HTTPStatusError):
+            await limiter.run(["getSlot"], call)
+
+
+@pytest.mark.asyncio
+class TestRecentBlockhashProvider:
+    class _StubClient:
+        def __init__(self) -> None:
+            self.calls = 0
+            self.block_height = 0
+
+        async def get_latest_blockhash(self, commitment: t.Optional[Commitment] = None) -> GetLatestBlockhashResp:
+            self.calls += 1
+            return GetLatestBlockhashResp(RpcBlockhash(Hash.new_unique(), self.block_height + 150),
+                                          RpcResponseContext(1))
+
+        async def get_block_height(self, commitment: t.Optional[Commitment] = None) -> GetBlockHeightResp:
+            return GetBlockHeightResp(self.block_height)
+
+    @pytest.fixture()
+    def client(self) -> "TestRecentBlockhashProvider._StubClient":
+        return self._StubClient()
+
+    @pytest.fixture()
+    def clock(self) -> t.List[float]:
+        return [0.0]
+
+    @pytest.fixture()
+    def provider(
+            self,
+            client: "TestRecentBlockhashProvider._StubClient",
+            clock: t.List[float],
+    ) -> RecentBlockhashProvider:
+        return RecentBlockhashProvider(t.cast(AsyncClient, client), refresh_interval=10.0, min_remaining_blocks=75,
+                                       slot_time=0.4, clock=lambda: clock[0])
+
+    async def test_blockhash_is_requested_once_within_refresh_interval(
+            self,
+            provider: RecentBlockhashProvider,
+            client: "TestRecentBlockhashProvider._StubClient",
+    ) -> None:
+        blockhashes = {(await provider.get()).blockhash for _ in range(3)}
+
+        assert len(blockhashes) == 1
+        assert client.calls == 1
+
+    async def test_stale_blockhash_is_returned_while_refreshing(
+            self,
+            provider: RecentBlockhashProvider,
+            clock: t.List[float],
+    ) -> None:
+        first = await provider.get()
+        clock[0] += 10.0
+
+        assert await provider.get() == first
+
+        await asyncio.sleep(0.01)
+
+        assert (await provider.get()).blockhash != first.blockhash
+
+    async def test_blockhash_close_to_expiration_is_not_returned(
+            self,
+            provider: RecentBlockhashProvider,
+            client: "TestRecentBlockhashProvider._StubClient",
+            clock: t.List[float],
+    ) -> None:
+        first = await provider.get()
+        # ~100 blocks were produced since the refresh, the blockhash is valid for ~50 blocks more
+        clock[0] += 40.0
+        client.block_height = 100
+
+        recent = await provider.get()
+
+        assert recent.blockhash != first.blockhash
+        assert recent.last_valid_block_height == 250
+
+    async def test_invalidated_blockhash_is_not_returned(self, provider: RecentBlockhashProvider) -> None:
+        first = await provider.get()
+        provider.invalidate(first.blockhash)
+
+        assert await provider.get() != first
+
+
+@pytest.mark.asyncio
+class TestBatchedSignatureStatusPoller:
+    class _StubClient:
+        def __init__(self) -> None:
+            self.statuses: t.Dict[Signature, TransactionStatus] = {}
+            self.requested: t.List[int] = []
+
+        async def get_signature_statuses(self, signatures: t.Sequence[Signature]) -> GetSignatureStatusesResp:
+            self.requested.append(len(signatures))
+            return GetSignatureStatusesResp([self.statuses.get(s) for s in signatures], RpcResponseContext(1))
+
+    @pytest.fixture()
+    def client(self) -> "TestBatchedSignatureStatusPoller._StubClient":
+        return self._StubClient()
+
+    @pytest.fixture()
+    def clock(self) -> t.List[float]:
+        return [0.0]
+
+    @pytest_asyncio.fixture()
+    async def poller(
+            self,
+            client: "TestBatchedSignatureStatusPoller._StubClient",
+            clock: t.List[float],
+    ) -> t.AsyncIterator[BatchedSignatureStatusPoller]:
+        poller = BatchedSignatureStatusPoller(t.cast(AsyncClient, client), timeout=10.0, interval=0.001,
+                                              clock=lambda: clock[0])
+        yield poller
+        await poller.close()
+
+    async def test_statuses_are_requested_in_batches(
+            self,
+            poller: BatchedSignatureStatusPoller,
+            client: "TestBatchedSignatureStatusPoller._StubClient",
+    ) -> None:
+        signatures = [Signature.new_unique() for _ in range(300)]
+        for signature in signatures:
+            client.statuses[signature] = TransactionStatus(1, None, None, None,
+                                                           TransactionConfirmationStatus.Finalized)
+
+        results = await asyncio.gather(*(poller.wait(signature) for signature in signatures))
+
+        assert all(results)
+        assert client.requested == [256, 44]
+
+    async def test_wait_times_out_when_status_is_not_reached(
+            self,
+            poller: BatchedSignatureStatusPoller,
+            clock: t.List[float],
+    ) -> None:
+        wait = asyncio.create_task(poller.wait(Signature.new_unique()))
+        await asyncio.sleep(0.01)
+
+        assert not wait.done()
+
+        clock[0] += 10.0
+
+        assert await wait is None
+
+    async def test_close_resolves_pending_waits_and_stops_polling(
+            self,
+            poller: BatchedSignatureStatusPoller,
+            client: "TestBatchedSignatureStatusPoller._StubClient",
+    ) -> None:
+        wait = asyncio.create_task(poller.wait(Signature.new_unique()))
+        await asyncio.sleep(0.01)
+
+        await poller.close()
+        requested = len(client.requested)
+
+        assert await wait is None
+        assert await poller.wait(Signature.new_unique()) is None
+
+        await asyncio.sleep(0.01)
+
+        assert len(client.requested) == requested
+
+
+@pytest.mark.asyncio
+class TestWebsocketSignatureWaiter:
+    @pytest.fixture()
+    def client(self) -> TestBatchedSignatureStatusPoller._StubClient:
+        return TestBatchedSignatureStatusPoller._StubClient()
+
+    @pytest_asyncio.fixture()
+    async def waiter(
+            self,
+            client: TestBatchedSignatureStatusPoller._StubClient,
+    ) -> t.AsyncIterator[WebsocketSignatureWaiter]:
+        poller = BatchedSignatureStatusPoller(t.cast(AsyncClient, client), timeout=10.0, interval=0.001)
+        # nothing listens on the port, so the waiter falls back to the poller
+        waiter = WebsocketSignatureWaiter("ws://127.0.0.1:9", poller, timeout=0.2, connect_wait=0.05)
+
+        yield waiter
+
+        await waiter.close()
+        await poller.close()
+
+    async def test_status_is_polled_when_websocket_is_not_connected(
+            self,
+            waiter: WebsocketSignatureWaiter,
+            client: TestBatchedSignatureStatusPoller._StubClient,
+    ) -> None:
+        signature = Signature.new_unique()
+        client.statuses[signature] = TransactionStatus(1, None, None, None, TransactionConfirmationStatus.Finalized)
+
+        assert await waiter.wait(signature) is True
+
+    async def test_polling_fallback_is_limited_by_remaining_timeout(self, waiter: WebsocketSignatureWaiter) -> None:
+        started_at = asyncio.get_running_loop().time()
+
+        assert await waiter.wait(Signature.new_unique()) is None
+        assert asyncio.get_running_loop().time() - started_at < 1.0
+
+
+@pytest.mark.asyncio
+class TestTokenTransferBatcher:
+    class _StubClient(TestRecentBlockhashProvider._StubClient):
+        def __init__(self) -> None:
+            super().__init__()
+            self.transactions: t.Dict[Signature, Transaction] = {}
+
+        async def send_raw_transaction(self, txn: bytes, opts: object = None) -> SendTransactionResp:
+            transaction = Transaction.from_bytes(txn)
+            self.transactions[transaction.signatures[0]] = transaction
+            return SendTransactionResp(transaction.signatures[0])
+
+    class _StubSignatureWaiter(SignatureWaiter):
+        """Transactions that transfer to `failed_dest` fail on chain."""
+
+        def __init__(self, client: "TestTokenTransferBatcher._StubClient", failed_dest: Pubkey) -> None:
+            self.client = client
+            self.failed_dest = failed_dest
+
+        async def wait(
+                self,
+                signature: Signature,
+                expected: TransactionConfirmationStatus = TransactionConfirmationStatus.Finalized,
+        ) -> t.Optional[bool]:
+            return self.failed_dest not in self.client.transactions[signature].message.account_keys
+
+    async def test_transfers_of_pack_failed_on_chain_are_isolated(self) -> None:
+        client = self._StubClient()
+        failed_dest = Pubkey.new_unique()
+        batcher = TokenTransferBatcher(
+            t.cast(AsyncClient, client),
+            self._StubSignatureWaiter(client, failed_dest),
+            RecentBlockhashProvider(t.cast(AsyncClient, client), refresh_interval=10.0, min_remaining_blocks=75),
+            Keypair(),
+            Pubkey.new_unique(),
+            TransferBatchOptions(window=0.01, max_size=4),
+        )
+        dests = [Pubkey.new_unique(), failed_dest, Pubkey.new_unique(), Pubkey.new_unique()]
+
+        results = await asyncio.gather(*(batcher.transfer(Pubkey.new_unique(), dest, Amount(1)) for dest in dests))
+
+        assert results == [True, False, True, True]
+        # the pack, its halves and the quarters of the failed half
+        assert sorted(len(txn.message.instructions) for txn in client.transactions.values()) == [1, 1, 2, 2, 4]
+
+    async def test_transfers_of_pack_with_unknown_status_are_not_resent(self) -> None:
+        class UnknownStatusWaiter(SignatureWaiter):
+            async def wait(
+                    self,
+                    signature: Signature,
+                    expected: TransactionConfirmationStatus = TransactionConfirmationStatus.Finalized,
+            ) -> t.Optional[bool]:
+                return None
+
+        client = self._StubClient()
+        batcher = TokenTransferBatcher(
+            t.cast(AsyncClient, client),
+            UnknownStatusWaiter(),
+            RecentBlockhashProvider(t.cast(AsyncClient, client), refresh_interval=10.0, min_remaining_blocks=75),
+            Keypair(),
+            Pubkey.new_unique(),
+            TransferBatchOptions(window=0.01, max_size=2),
+        )
+
+        results = await asyncio.gather(*(batcher.transfer(Pubkey.new_unique(), Pubkey.new_unique(), Amount(1))
+                                         for _ in range(2)))
+
+        assert results == [None, None]
+        assert len(client.transactions) == 1
+
+
+@pytest.mark.asyncio
+class TestTokenRepository:
+    @pytest_asyncio.fixture(scope="class")
+    async def repo(self) -> t.AsyncIterator[TokenRepository]:
+        options = SimulationOptions(slot_time=0.01, latency_median=0.001, finalization_lag=4, seed=1)
+        transport = SimulatedSolanaTransport(SimulatedLedger(options), options)
+        endpoints = [RpcEndpoint("http://simulated")]
+
+        async with PooledAsyncClient(endpoints, RpcPoolOptions(), transport=transport) as client:
+            poller = BatchedSignatureStatusPoller(client, timeout=10.0, interval=0.01)
+            blockhash_provider = RecentBlockhashProvider(client, refresh_interval=0.1, min_remaining_blocks=75,
+                                                         slot_time=options.slot_time)
+            wallet_repository = WalletRepository(client, poller, 10 ** 9)
+            factory = TokenRepositoryFactory(
+                client=client,
+                signature_waiter=poller,
+                blockhash_provider=blockhash_provider,
+                wallet_repository=wallet_repository,
+                mint_amount=1_000,
+                transfer_options=TransferBatchOptions(window=0.01),
+            )
+
+            try:
+                yield await factory.create_from_wallet(await wallet_repository.create())
+
+            finally:
+                await poller.close()
+
+    async def test_transfer_creates_account_and_moves_tokens(self, repo: TokenRepository) -> None:
+        wallet = Keypair().pubkey()
+        source_amount = await repo.get_account_amount(repo.owner_pubkey)
+        assert source_amount is not None
+
+        assert await repo.transfer(wallet, Amount(10))
+
+        assert await repo.get_account_amount(wallet) == 10
+        assert await repo.get_account_amount(repo.owner_pubkey) == source_amount - 10
+
+    async def test_concurrent_transfers_to_new_wallet_succeed(self, repo: TokenRepository) -> None:
+        wallet = Keypair().pubkey()
+
+        results = await asyncio.gather(*(repo.transfer(wallet, Amount(1)) for _ in range(5)))
+
+        assert list(results) == [True] * 5
+        assert await repo.get_account_amount(wallet) == 5
+
+    async def test_failed_transfer_does_not_fail_transfers_of_the_same_batch(self, repo: TokenRepository) -> None:
+        wallets = [Keypair().pubkey() for _ in range(3)]
+        await asyncio.gather(*(repo.get_or_create_account(wallet) for wallet in wallets))
+
+        results = await asyncio.gather(
+            repo.transfer(wallets[0], Amount(1)),
+            repo.transfer(wallets[1], Amount(10 ** 6)),
+            repo.transfer(wallets[2], Amount(1)),
+        )
+
+        assert list(results) == [True, False, True]
+
+    async def test_sent_transfer_is_finalized(self, repo: TokenRepository) -> None:
+        signatures: t.List[Signature] = []
+
+        async def remember_signature(sent: SentTransaction) -> None:
+            signatures.append(sent.signature)
+
+        assert await repo.transfer(Keypair().pubkey(), Amount(1), remember_signature)
+        await asyncio.sleep(0.1)
+
+        assert await repo.get_transfer_result(signatures[0], Finalized) is True
+        assert await repo.get_transfer_result(Signature.default(), Finalized) is False
+
+    async def test_unknown_transfer_is_dropped_only_after_blockhash_expiration(self, repo: TokenRepository) -> None:
+        block_height = await repo.get_block_height()
+
+        assert await repo.get_transfer_result(Signature.default(), Finalized, block_height + 150) is None
+        assert await repo.get_transfer_result(Signature.default(), Finalized, block_height - 1) is False
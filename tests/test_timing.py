@@ -0,0 +1,40 @@
+import asyncio
+import re
+
+import pytest
+
+from spl_token_lending.timing import format_server_timing, record_span, span, use_trace
+
+
+class TestTiming:
+    @pytest.mark.asyncio
+    async def test_spans_of_concurrent_tasks_are_collected_into_trace(self) -> None:
+        async def query(name: str) -> None:
+            with span(name):
+                await asyncio.sleep(0.01)
+
+        with use_trace("request") as trace:
+            with span("case"):
+                await asyncio.gather(query("db.find"), query("db.count"))
+                record_span("db.find", 0.0, 0.5)
+
+        assert [(child.name, [grandchild.name for grandchild in child.children]) for child in trace.children] == [
+            ("case", ["db.find", "db.count", "db.find"]),
+        ]
+        assert trace.to_dict()["name"] == "request"
+
+    def test_server_timing_sums_spans_with_the_same_name(self) -> None:
+        with use_trace("request") as trace:
+            record_span("db.find", 0.0, 0.25)
+            record_span("db.find", 1.0, 1.5)
+
+        assert re.fullmatch(r"db\.find;dur=750\.0, total;dur=\d+\.\d", format_server_timing(trace))
+
+    def test_spans_out_of_trace_are_not_recorded(self) -> None:
+        with use_trace("request") as trace:
+            pass
+
+        with span("db.find"):
+            record_span("db.count", 0.0, 1.0)
+
+        assert trace.children == []